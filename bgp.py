@@ -22,6 +22,7 @@
 ##     02111-1307 USA
 
 import struct, socket, sys, math, getopt, string, os.path, time
+import threading, Queue, signal
 from mutils import *
 
 #-------------------------------------------------------------------------------
@@ -30,14 +31,23 @@ INDENT          = "    "
 VERSION         = "3.0"
 
 RCV_BUF_SZ      = 8192
+RCV_QUEUE_SZ    = 4096
 BGP_LISTEN_PORT = 179
+LISTEN_BACKLOG  = 128
 BGP_HDR_LEN     = 19
+BGP_MAX_LEN     = 4096
 BGP_MARKER      = struct.pack(">LLLL",
                               0xffffffff, 0xffffffff, 0xffffffff, 0xffffffff)
 BGP_MARKER_LEN  = len(BGP_MARKER)
 
 TABLE_DUMP_ENTRY_HDR_LEN = 18
 
+# Python 2 doesn't export SO_REUSEPORT; this is the Linux value
+SO_REUSEPORT    = getattr(socket, "SO_REUSEPORT", 15)
+
+# set by the entry point (or by importers) to select the MRTD dump format
+DUMP_MRTD       = 0
+
 ################################################################################
 
 DLIST = []
@@ -362,7 +372,7 @@ def parseUpdate(msg_len, msg, verbose=1, level=0):
         unfeasible_pfxs = unfeasible_pfxs + (level+2)*INDENT +\
                            "%d: %s\n" % (rn, pfx2str(pfx, plen))
 
-        rv["V"]["UNFEASIBLE"].append((pfx,plen))
+        rv["V"]["UNFEASIBLE"].append(pfx2key(pfx, plen))
         curp = curp + plen_octets
 
     # "BGP4: Inter-domain routing in the Internet" John W. Stewart III,
@@ -454,7 +464,7 @@ def parseUpdate(msg_len, msg, verbose=1, level=0):
                      (len(msg[curp:curp+plen_octets]) != plen_octets)*
                      '[ *** bogus NLRI field: plen_octets did not match *** ]')
 
-        rv["V"]["FEASIBLE"].append((pfx,plen))
+        rv["V"]["FEASIBLE"].append(pfx2key(pfx, plen))
         curp = curp + plen_octets
 
     if verbose > 0:
@@ -658,7 +668,7 @@ def parseTableEntry(length, entries, verbose=1, level=0):
     pfx, plen, status, uptime, peer_addr, peer_as, elen =\
          struct.unpack(hfmt, entries[:hfmt_l])
 
-    rv["V"]["PREFIX"]  = (struct.pack(">L", pfx), plen)
+    rv["V"]["PREFIX"]  = id2key(pfx, plen)
     rv["V"]["STATUS"]  = status
     rv["V"]["UPTIME"]  = uptime
     rv["V"]["PEER_IP"] = peer_addr
@@ -722,8 +732,215 @@ def parseTableEntry(length, entries, verbose=1, level=0):
     if verbose: print
     return rv
 
+#-------------------------------------------------------------------------------
+
+# Encoding, ie. the reverse of the above.  Path attributes are given as
+# parseBgpAttr() returns them; FLAGS may be left out, in which case the
+# RFC 1771 flags for the attribute are used.  Prefixes are packed keys
+# (mutils.id2key()) as parseUpdate() returns them, or (pfx, plen) pairs,
+# pfx being either a packed string or a long.  Pieces are collected in
+# lists and joined once, so the cost is linear in the size of the
+# output.
+
+PDU_HDR      = struct.Struct(">16sHB")
+ATTR_HDR     = struct.Struct("BBB")
+ATTR_HDR_EXT = struct.Struct(">BBH")
+ASP_SEG_HDR  = struct.Struct("BB")
+AGGR_VAL     = struct.Struct(">HL")
+UINT16       = struct.Struct(">H")
+UINT32       = struct.Struct(">L")
+
+PLEN_OCTETS  = map(lambda plen: (plen+7)/8, range(33))
+
+# default flags: optional (0x80), transitive (0x40)
+ATTR_FLAGS = { PATH_ATTRIBUTES["ORIGIN"]:                   0x40,
+               PATH_ATTRIBUTES["AS_PATH"]:                  0x40,
+               PATH_ATTRIBUTES["NEXT_HOP"]:                 0x40,
+               PATH_ATTRIBUTES["MULTI_EXIT_DISCRIMINATOR"]: 0x80,
+               PATH_ATTRIBUTES["LOC_PREF"]:                 0x40,
+               PATH_ATTRIBUTES["ATOMIC_AGGR"]:              0x40,
+               PATH_ATTRIBUTES["AGGREGATOR"]:               0xc0,
+               PATH_ATTRIBUTES["COMMUNITY"]:                0xc0,
+               PATH_ATTRIBUTES["ORIGINATOR_ID"]:            0x80,
+               PATH_ATTRIBUTES["CLUSTER_LIST"]:             0x80,
+               }
+
+class EncodeExc(Exception): pass
+
+#-------------------------------------------------------------------------------
+
+def mkBgpAttr(atype, aval):
+
+    ## returns the encoded attribute, or None if we can't encode atype
+
+    if not ATTR_FLAGS.has_key(atype):
+        return None
+
+    v = aval["V"]
+    if v == None:
+        # zero length, eg. ATOMIC_AGGR or an empty (iBGP) AS_PATH
+        val = ""
+
+    elif atype == PATH_ATTRIBUTES["ORIGIN"]:
+        val = chr(v)
+
+    elif atype == PATH_ATTRIBUTES["AS_PATH"]:
+        segs = []
+        for seg in v:
+            asns = seg["V"]
+            if not asns:
+                segs.append(ASP_SEG_HDR.pack(seg["T"], 0))
+            # a segment holds at most 255 ASes; longer ones are split
+            for i in range(0, len(asns), 0xff):
+                chunk = asns[i:i+0xff]
+                segs.append(ASP_SEG_HDR.pack(seg["T"], len(chunk)))
+                segs.append(struct.pack(">%dH" % len(chunk), *chunk))
+        val = string.join(segs, '')
+
+    elif atype == PATH_ATTRIBUTES["AGGREGATOR"]:
+        val = AGGR_VAL.pack(v[0], v[1])
+
+    elif atype == PATH_ATTRIBUTES["COMMUNITY"]:
+        # parseBgpAttr() leaves communities packed
+        comms = []
+        for c in v:
+            if type(c) == type(""):
+                comms.append(c)
+            else:
+                comms.append(UINT32.pack(c))
+        val = string.join(comms, '')
+
+    elif atype == PATH_ATTRIBUTES["CLUSTER_LIST"]:
+        val = struct.pack(">%dL" % len(v), *v)
+
+    else:
+        # NEXT_HOP, MED, LOC_PREF, ORIGINATOR_ID
+        val = UINT32.pack(v)
+
+    flags = ATTR_FLAGS[atype]
+    if aval.has_key("FLAGS"):
+        f = aval["FLAGS"]
+        flags = (f["optional"]<<7) | (f["transitive"]<<6) |\
+                (f["partial"]<<5) | (f["extlen"]<<4)
+    if len(val) > 0xff:
+        flags = flags | (1<<4)
+
+    if flags & (1<<4):
+        return ATTR_HDR_EXT.pack(flags, atype, len(val)) + val
+    return ATTR_HDR.pack(flags, atype, len(val)) + val
+
+#-------------------------------------------------------------------------------
+
+def mkPathAttrs(attrs, verbose=1, level=0):
+
+    ## attrs as in parseUpdate()'s rv["V"]["PATH_ATTRS"]; encoded in
+    ## type code order, skipping (and complaining about) any we can't do
+
+    atypes = attrs.keys()
+    atypes.sort()
+
+    rv = []
+    for atype in atypes:
+        a = mkBgpAttr(atype, attrs[atype])
+        if a == None:
+            if verbose > 0:
+                print level*INDENT + "[ *** unsupported attribute: %s *** ]" %\
+                      PATH_ATTRIBUTES.get(atype, atype)
+            continue
+        rv.append(a)
+
+    return string.join(rv, '')
+
+#-------------------------------------------------------------------------------
+
+def mkPfx(pfx, plen=None):
+
+    if plen == None:
+        if type(pfx) == type(()):
+            (pfx, plen) = pfx
+        else:
+            key = long(pfx)
+            (pfx, plen) = (key >> 8, int(key & 0xff))
+
+    n = PLEN_OCTETS[plen]
+    if type(pfx) == type(""):
+        pfx = pfx[:n] + (n-len(pfx))*"\000"
+    else:
+        pfx = UINT32.pack(pfx)[:n]
+
+    return chr(plen) + pfx
+
+#-------------------------------------------------------------------------------
+
+def mkUpdates(unfeasible=(), attrs="", feasible=(), maxlen=BGP_MAX_LEN,
+              verbose=1, level=0):
+
+    ## returns a list of UPDATE bodies (less the BGP header) withdrawing
+    ## unfeasible and announcing feasible with attrs, using as few
+    ## messages of at most maxlen octets as possible.  attrs may be
+    ## already encoded (a string) or as for mkPathAttrs().
+
+    if type(attrs) != type(""):
+        attrs = mkPathAttrs(attrs, verbose, level)
+
+    room = maxlen - BGP_HDR_LEN - 4
+    if feasible and len(attrs) + 5 > room:
+        raise EncodeExc("path attributes too long: %d" % len(attrs))
+
+    rv = []
+    wdrn = [] ; nlri = [] ; used = 0
+
+    for pfx in unfeasible:
+        p = mkPfx(pfx)
+        if used + len(p) > room:
+            rv.append(mkUpdateBody(wdrn, "", nlri))
+            wdrn = [] ; used = 0
+        wdrn.append(p)
+        used = used + len(p)
+
+    # the NLRI share the last withdrawal message if the attributes fit
+    alen = len(attrs)
+    for pfx in feasible:
+        p = mkPfx(pfx)
+        if not nlri:
+            if used + alen + len(p) > room:
+                rv.append(mkUpdateBody(wdrn, "", nlri))
+                wdrn = [] ; used = 0
+            used = used + alen
+        elif used + len(p) > room:
+            rv.append(mkUpdateBody(wdrn, attrs, nlri))
+            wdrn = [] ; nlri = [] ; used = alen
+        nlri.append(p)
+        used = used + len(p)
+
+    if wdrn or nlri:
+        rv.append(mkUpdateBody(wdrn, attrs, nlri))
+
+    return rv
+
+#-------------------------------------------------------------------------------
+
+def mkUpdateBody(wdrn, attrs, nlri):
+
+    wdrn = string.join(wdrn, '')
+    if not nlri:
+        attrs = ""
+
+    return string.join([UINT16.pack(len(wdrn)), wdrn,
+                        UINT16.pack(len(attrs)), attrs] + nlri, '')
+
+#-------------------------------------------------------------------------------
+
+def mkBgpPdu(msg_type, msg):
+
+    return PDU_HDR.pack(BGP_MARKER, len(msg)+BGP_HDR_LEN, msg_type) + msg
+
 ################################################################################
 
+class ConnClosedExc(Exception): pass
+
+#-------------------------------------------------------------------------------
+
 class Bgp:
 
     _version = 4
@@ -731,7 +948,7 @@ class Bgp:
     #---------------------------------------------------------------------------
 
 
-    def __init__(self, loc_name, asn, rem_name, port, holdtime):
+    def __init__(self, loc_name, asn, rem_name, port, holdtime, sock=None):
 
         self._bgp_id_str  = loc_name
         self._bgp_id_addr = socket.gethostbyname(loc_name)
@@ -746,13 +963,24 @@ class Bgp:
 
         self._holdtime = holdtime
 
-        self._sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        self._sock.bind((self._bgp_id_str, 0))
-        self._sock.connect((self._bgp_peer_str, self._bgp_peer_prt))
+        if sock:
+            # session already accepted by a BgpListener
+            self._sock = sock
+        else:
+            self._sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            self._sock.bind((self._bgp_id_str, 0))
+            self._sock.connect((self._bgp_peer_str, self._bgp_peer_prt))
 
         self._rcvd = ""
         self._mrt  = None
 
+        self._rcvq      = None
+        self._rcvq_thrd = None
+        self._rcvq_stats = { "QUEUED":    0,
+                             "DROPPED":   0,
+                             "MAX_DEPTH": 0,
+                             }
+
     def __repr__(self):
 
         ret = """Passive BGP speaker version %s:
@@ -773,12 +1001,19 @@ class Bgp:
 
     #---------------------------------------------------------------------------
 
+    def fillBuf(self):
+
+        data = self._sock.recv(RCV_BUF_SZ)
+        if not data:
+            raise ConnClosedExc
+        self._rcvd = self._rcvd + data
+
     def recvMsg(self, verbose=1, level=0):
 
         while 1:
 
             if len(self._rcvd) < BGP_MARKER_LEN+3:
-                self._rcvd = self._rcvd + self._sock.recv(RCV_BUF_SZ)
+                self.fillBuf()
                 continue
 
             ## guaranteed to have a BGP-msg-header-worth of data in buffer
@@ -786,7 +1021,7 @@ class Bgp:
             msg_start = string.find(self._rcvd, BGP_MARKER)
             if msg_start < 0:
                 # no marker in buffer -- fill buffer and continue
-                self._rcvd = self._rcvd + self._sock.recv(RCV_BUF_SZ)
+                self.fillBuf()
                 continue
 
             elif msg_start > 0:
@@ -805,7 +1040,7 @@ class Bgp:
         ## message may not be completely received...
 
         while msg_len > len(self._rcvd):
-            self._rcvd = self._rcvd + self._sock.recv(RCV_BUF_SZ)
+            self.fillBuf()
 
         msg_end = msg_start + msg_len
 
@@ -826,10 +1061,7 @@ class Bgp:
 
     def sendMsg(self, msg_type, msg_len, msg, verbose=1, level=0):
 
-        fmt = ">LLLLH B %ds" % msg_len
-        pkt = struct.pack(fmt,
-                          0xffffffff, 0xffffffff, 0xffffffff, 0xffffffff,
-                          msg_len+BGP_HDR_LEN, msg_type, msg)
+        pkt = mkBgpPdu(msg_type, msg[:msg_len])
 
         if DUMP_MRTD == 1:
             self._mrt.writeBgp4pyMsg(msg_type, len(pkt), pkt)
@@ -841,13 +1073,23 @@ class Bgp:
         if verbose > 2:
             print "%ssendMsg: type=%s (%d), len=%d%s" %\
                   (level*INDENT, MSG_TYPES[msg_type], msg_type,
-                   struct.calcsize(fmt), prtbin((level+1)*INDENT, pkt))
+                   len(pkt), prtbin((level+1)*INDENT, pkt))
 
-        self._sock.send(pkt)
+        self._sock.sendall(pkt)
 
-    def parseMsg(self, verbose=1, level=0):
+    def sendUpdates(self, unfeasible=(), attrs="", feasible=(),
+                    verbose=1, level=0):
 
-        msg_type, msg_len, msg = self.recvMsg()
+        ## returns the number of UPDATEs it took
+
+        msgs = mkUpdates(unfeasible, attrs, feasible, BGP_MAX_LEN,
+                         verbose, level)
+        for msg in msgs:
+            self.sendMsg(MSG_TYPES["UPDATE"], len(msg), msg, verbose, level)
+
+        return len(msgs)
+
+    def dumpMsg(self, msg_type, msg_len, msg):
 
         if DUMP_MRTD == 1:
             self._mrt.writeBgp4pyMsg(msg_type, msg_len, msg)
@@ -856,6 +1098,15 @@ class Bgp:
         elif DUMP_MRTD == 3:
             self._mrt.writeBgp4mpMsg(msg_type, msg_len, msg)
 
+    def parseMsg(self, verbose=1, level=0):
+
+        msg_type, msg_len, msg = self.recvMsg()
+        self.dumpMsg(msg_type, msg_len, msg)
+
+        return self.decodeMsg(msg_type, msg_len, msg, verbose, level)
+
+    def decodeMsg(self, msg_type, msg_len, msg, verbose=1, level=0):
+
         if verbose > 2:
             print "%sparseMsg: type=%s (%d) len=%d%s" %\
                   (level*INDENT, MSG_TYPES[msg_type], msg_type,
@@ -868,9 +1119,83 @@ class Bgp:
 
     #---------------------------------------------------------------------------
 
+    # Receiving and decoding are decoupled so that a burst of UPDATEs
+    # doesn't stall the socket while we pretty print: the receiver
+    # thread only frames messages and writes them to the MRT dump, and
+    # hands them to the decoder through a bounded queue.  If the
+    # decoder falls behind and the queue fills, messages are dropped
+    # from the decode path only -- they are still in the dump.  With a
+    # qsize of 0 nothing is queued: messages are read (and dumped) only
+    # so that the peer's output doesn't back up.
+
+    def startReceiver(self, qsize=RCV_QUEUE_SZ):
+
+        if qsize > 0:
+            self._rcvq = Queue.Queue(qsize)
+        self._rcvq_thrd = threading.Thread(target=self.rcvLoop,
+                                           name="bgp-rcv")
+        self._rcvq_thrd.setDaemon(1)
+        self._rcvq_thrd.start()
+
+    def rcvLoop(self):
+
+        stats = self._rcvq_stats
+        try:
+            while 1:
+                msg_type, msg_len, msg = self.recvMsg(0)
+                self.dumpMsg(msg_type, msg_len, msg)
+                if not self._rcvq:
+                    continue
+
+                try:
+                    self._rcvq.put_nowait((msg_type, msg_len, msg))
+                    stats["QUEUED"] = stats["QUEUED"] + 1
+                except Queue.Full:
+                    stats["DROPPED"] = stats["DROPPED"] + 1
+
+                depth = self._rcvq.qsize()
+                if depth > stats["MAX_DEPTH"]:
+                    stats["MAX_DEPTH"] = depth
+
+        except (ConnClosedExc, socket.error):
+            pass
+
+        # wake the decoder so that it notices the session has gone
+        if self._rcvq:
+            self._rcvq.put(None)
+
+    def parseQueued(self, verbose=1, level=0, timeout=1.0):
+
+        ## returns None if nothing arrived within timeout; raises
+        ## ConnClosedExc once the receiver has exited and the queue is
+        ## drained
+
+        try:
+            item = self._rcvq.get(1, timeout)
+        except Queue.Empty:
+            return None
+
+        if item == None:
+            raise ConnClosedExc
+
+        msg_type, msg_len, msg = item
+        return self.decodeMsg(msg_type, msg_len, msg, verbose, level)
+
+    def queueStats(self):
+
+        rv = { "DEPTH": 0 }
+        rv.update(self._rcvq_stats)
+        if self._rcvq:
+            rv["DEPTH"] = self._rcvq.qsize()
+
+        return rv
+
+    #---------------------------------------------------------------------------
+
     def sendOpen(self, verbose=1, level=0):
 
-        print `type(self._bgp_id)`, `self._bgp_id`
+        if verbose > 2:
+            print `type(self._bgp_id)`, `self._bgp_id`
 
         fmt = ">BHHLB"
         msg = struct.pack(fmt, Bgp._version,
@@ -898,6 +1223,62 @@ class Bgp:
 
     #---------------------------------------------------------------------------
 
+#-------------------------------------------------------------------------------
+
+# Accepts inbound sessions rather than connecting out, so that peers
+# reconnect to us when we restart.  Sessions are only accepted from
+# configured peers.  With reuseport set, several processes may each
+# have a listener bound to the same address and port, and the kernel
+# spreads incoming connections between them.
+
+class BgpListener:
+
+    def __init__(self, loc_name, port=BGP_LISTEN_PORT, peers=(), reuseport=0):
+
+        self._loc_str  = loc_name
+        self._loc_addr = socket.gethostbyname(loc_name)
+        self._port     = port
+
+        self._peers = {}
+        for p in peers:
+            self._peers[socket.gethostbyname(p)] = p
+
+        self._sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        if reuseport:
+            self._sock.setsockopt(socket.SOL_SOCKET, SO_REUSEPORT, 1)
+        self._sock.bind((self._loc_addr, self._port))
+        self._sock.listen(LISTEN_BACKLOG)
+
+    def __repr__(self):
+
+        ret = """BGP listener version %s:
+        local: %s:%d [%s]
+        peers: %s\n""" %\
+            (VERSION, self._loc_str, self._port, self._loc_addr,
+             `self._peers.values()`)
+
+        return ret
+
+    def close(self):
+
+        self._sock.close()
+
+    def accept(self, asn, holdtime, verbose=1, level=0):
+
+        while 1:
+            sock, (addr, port) = self._sock.accept()
+            if self._peers.has_key(addr):
+                break
+
+            if verbose > 0:
+                print level*INDENT +\
+                      "[ *** rejected session from unconfigured peer %s:%d *** ]" %\
+                      (addr, port)
+            sock.close()
+
+        return Bgp(self._loc_str, asn, self._peers[addr], port, holdtime, sock)
+
 ################################################################################
 
 if __name__ == "__main__":
@@ -906,8 +1287,6 @@ if __name__ == "__main__":
 
     #---------------------------------------------------------------------------
 
-    global VERBOSE, DUMP_MRTD
-
     VERBOSE   = 1
     DUMP_MRTD = 0
 
@@ -915,10 +1294,13 @@ if __name__ == "__main__":
     file_sz   = mrtd.DEFAULT_SIZE
     mrtd_type = None
     loc_name  = None
-    rem_name  = None
+    rem_names = []
     asn       = None
     port      = BGP_LISTEN_PORT
     holdtime  = 0
+    queue_sz  = 0
+    listen    = 0
+    workers   = 1
 
     #---------------------------------------------------------------------------
 
@@ -935,13 +1317,22 @@ if __name__ == "__main__":
         -d|--dump     : Dump MRTd::PROTOCOL_BGP format
         -m|--dump-4mp : Dump MRTd::PROTOCOL_BGP4MP format
 
-        -p|--peer     : [*] BGP peer address/name
+        -p|--peer     : [*] BGP peer address/name (may be repeated
+                        with --listen)
         -a|--as       : [*] Local AS number
         -l|--local    : Address/name for local bind
-        -t|--port     : BGP peer listening port [def: %d]
-        -z|--size     : Size of output file(s) [min: %d]""" %\
+        -t|--port     : BGP peer listening port, or local listening
+                        port with --listen [def: %d]
+        -z|--size     : Size of output file(s) [min: %d]
+
+        -L|--listen   : Accept sessions from peers instead of connecting
+        -w|--workers  : Number of accepting processes with --listen [def: 1]
+
+        -Q|--queue    : Receive in a separate thread, queueing up to
+                        this many messages for decoding (%d is the
+                        Bgp.startReceiver() default) [def: off]""" %\
             (os.path.basename(sys.argv[0]), mrtd.DEFAULT_FILE,
-             BGP_LISTEN_PORT, mrtd.MIN_FILE_SZ)
+             BGP_LISTEN_PORT, mrtd.MIN_FILE_SZ, RCV_QUEUE_SZ)
         sys.exit(0)
 
     #---------------------------------------------------------------------------
@@ -951,11 +1342,12 @@ if __name__ == "__main__":
 
     try:
         opts, args = getopt.getopt(sys.argv[1:],
-                                   "hqvVydmp:a:o:t:l:f:z:",
+                                   "hqvVydmp:a:o:t:l:f:z:Q:Lw:",
                                    ("help", "quiet", "verbose", "VERBOSE",
                                     "dump-4py", "dump", "dump-4mp",
                                     "file-pfx=", "peer=", "as=", "holdtime=",
-                                    "port=", "local=", "size=" ))
+                                    "port=", "local=", "size=", "queue=",
+                                    "listen", "workers=" ))
     except (getopt.error):
         usage()
 
@@ -985,7 +1377,7 @@ if __name__ == "__main__":
             mrtd_type = mrtd.MSG_TYPES["PROTOCOL_BGP4MP"]
 
         elif x in ('-p', '--peer'):
-            rem_name = y
+            rem_names.append(y)
 
         elif x in ('-a', '--as'):
             asn = string.atoi(y)
@@ -1005,10 +1397,22 @@ if __name__ == "__main__":
         elif x in ('-z', '--file-size'):
             file_sz = max(string.atof(y), mrtd.MIN_FILE_SZ)
 
+        elif x in ('-Q', '--queue'):
+            queue_sz = string.atoi(y)
+
+        elif x in ('-L', '--listen'):
+            listen = 1
+
+        elif x in ('-w', '--workers'):
+            workers = max(string.atoi(y), 1)
+
         else:
             usage()
 
-    if not (rem_name and asn):
+    if not (rem_names and asn):
+        usage()
+
+    if len(rem_names) > 1 and not listen:
         usage()
 
     if not loc_name:
@@ -1016,25 +1420,70 @@ if __name__ == "__main__":
 
     #---------------------------------------------------------------------------
 
-    bgp      = Bgp(loc_name, asn, rem_name, port, holdtime)
-    bgp._mrt = mrtd.Mrtd(file_pfx, "w+b", file_sz, mrtd_type, bgp)
+    def runSession(bgp, file_pfx):
 
-    if VERBOSE > 0:
-        print `bgp`
+        bgp._mrt = mrtd.Mrtd(file_pfx, "w+b", file_sz, mrtd_type, bgp)
 
-    try:
+        if VERBOSE > 0:
+            print `bgp`
+
+        try:
+
+            # the wafeur-est thin state machine you ever did see :-)
+            bgp.sendOpen(VERBOSE, 0)
+            rv = bgp.parseMsg(VERBOSE, 0)
+            bgp._bgp_peer_as = rv["V"]["AS"]
+            bgp.sendKeepalive(VERBOSE, 0)
+
+            if queue_sz > 0:
+                bgp.startReceiver(queue_sz)
+                while 1:
+                    msg = bgp.parseQueued(VERBOSE, 0)
 
-        # the wafeur-est thin state machine you ever did see :-)
-        bgp.sendOpen(VERBOSE, 0)
-        rv = bgp.parseMsg(VERBOSE, 0)
-        bgp._bgp_peer_as = rv["V"]["AS"]
-        bgp.sendKeepalive(VERBOSE, 0)
+            else:
+                while 1:
+                    msg = bgp.parseMsg(VERBOSE, 0)
+
+        except (KeyboardInterrupt, ConnClosedExc, socket.error):
+            if queue_sz > 0:
+                error("receive queue: %s\n" % `bgp.queueStats()`)
+            bgp.close()
+            sys.exit(1)
+
+    #---------------------------------------------------------------------------
 
+    if not listen:
+        runSession(Bgp(loc_name, asn, rem_names[0], port, holdtime), file_pfx)
+
+    # each accepting worker binds its own listener (SO_REUSEPORT lets the
+    # kernel spread connections between them); each accepted session is
+    # then run in its own process, dumping to its own file -- named for
+    # the accepting worker and a count of its sessions as well as the
+    # peer, so that a peer reconnecting doesn't clobber its last dump
+
+    signal.signal(signal.SIGCHLD, signal.SIG_IGN)
+    for i in range(workers-1):
+        if os.fork() == 0:
+            break
+
+    lsnr = BgpListener(loc_name, port, rem_names, workers > 1)
+    if VERBOSE > 0:
+        print `lsnr`
+
+    sessions = 0
+    try:
         while 1:
-            msg = bgp.parseMsg(VERBOSE, 0)
+            bgp = lsnr.accept(asn, holdtime, VERBOSE, 0)
+            sessions = sessions + 1
+            if os.fork() == 0:
+                lsnr.close()
+                runSession(bgp, "%s.%s.%d-%d" % (file_pfx, bgp._bgp_peer_addr,
+                                                 os.getppid(), sessions))
+
+            bgp._sock.close()
 
     except (KeyboardInterrupt):
-        bgp.close()
+        lsnr.close()
         sys.exit(1)
 
     #---------------------------------------------------------------------------
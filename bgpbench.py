@@ -0,0 +1,257 @@
+#! /usr/bin/env python2.5
+
+##     PyRT: Python Routeing Toolkit
+
+##     Benchmarks the BGP collector end to end against a fake peer on
+##     the loopback: throughput, MRTd write rate, and receive latency.
+
+##     Copyright (C) 2001 Richard Mortier <mort@sprintlabs.com>, Sprint ATL
+
+##     This program is free software; you can redistribute it and/or
+##     modify it under the terms of the GNU General Public License as
+##     published by the Free Software Foundation; either version 2 of the
+##     License, or (at your option) any later version.
+
+##     This program is distributed in the hope that it will be useful,
+##     but WITHOUT ANY WARRANTY; without even the implied warranty of
+##     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+##     General Public License for more details.
+
+##     You should have received a copy of the GNU General Public License
+##     along with this program; if not, write to the Free Software
+##     Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA
+##     02111-1307 USA
+
+# The fake peer runs in a child process so that it doesn't compete
+# with the collector for the interpreter lock.  The collector side is
+# the same recvMsg()/dumpMsg()/decodeMsg() sequence as Bgp.parseMsg(),
+# timed a step at a time.
+
+import time, getopt, sys, string, os, tempfile, glob, traceback
+import bgp, mrtd, fakepeer
+from mutils import *
+
+COLLECTOR_AS = 65000
+
+################################################################################
+
+def percentile(sorted_vals, p):
+
+    if not sorted_vals:
+        return 0.0
+    i = min(int(len(sorted_vals)*p), len(sorted_vals)-1)
+    return sorted_vals[i]
+
+#-------------------------------------------------------------------------------
+
+def runPeer(peer, updates, rate, count):
+
+    ## never returns; the child exits 1 (having printed the traceback)
+    ## if the peer failed
+
+    rc = 0
+    try:
+        try:
+            peer.establish(0)
+            peer.stream(updates, rate, count, 0)
+        except:
+            traceback.print_exc()
+            rc = 1
+    finally:
+        peer.close()
+        os._exit(rc)
+
+#-------------------------------------------------------------------------------
+
+def runCollector(port, dump_pfx, stamped=1):
+
+    bgp.DUMP_MRTD = 1
+    coll = bgp.Bgp(fakepeer.DEFAULT_ADDR, COLLECTOR_AS,
+                   fakepeer.DEFAULT_ADDR, port, 0)
+    coll._mrt = mrtd.Mrtd(dump_pfx, "w+b", 1L<<62,
+                          mrtd.MSG_TYPES["PROTOCOL_BGP4PY"], coll)
+
+    coll.sendOpen(0)
+    rv = coll.parseMsg(0)
+    coll._bgp_peer_as = rv["V"]["AS"]
+    coll.sendKeepalive(0)
+
+    rv = { "UPDATES": 0, "OCTETS": 0,
+           "RECV_T": 0.0, "DUMP_T": 0.0, "DECODE_T": 0.0,
+           "LATENCY": [],
+           }
+    update = bgp.MSG_TYPES["UPDATE"]
+
+    start = None
+    try:
+        while 1:
+            t0 = time.time()
+            msg_type, msg_len, msg = coll.recvMsg(0)
+            t1 = time.time()
+            coll.dumpMsg(msg_type, msg_len, msg)
+            t2 = time.time()
+            prv = coll.decodeMsg(msg_type, msg_len, msg, 0)
+            t3 = time.time()
+
+            if msg_type != update:
+                continue
+
+            if start == None:
+                start = t0
+            rv["UPDATES"]  = rv["UPDATES"] + 1
+            rv["OCTETS"]   = rv["OCTETS"] + msg_len
+            rv["RECV_T"]   = rv["RECV_T"] + (t1-t0)
+            rv["DUMP_T"]   = rv["DUMP_T"] + (t2-t1)
+            rv["DECODE_T"] = rv["DECODE_T"] + (t3-t2)
+            if stamped:
+                rv["LATENCY"].append(fakepeer.updateLatency(prv, t1))
+
+    except (bgp.ConnClosedExc):
+        pass
+
+    rv["ELAPSED"] = time.time() - (start or time.time())
+    rv["DUMPED"]  = coll._mrt._of.tell()
+    coll.close()
+
+    return rv
+
+#-------------------------------------------------------------------------------
+
+def report(rv):
+
+    n       = rv["UPDATES"]
+    elapsed = max(rv["ELAPSED"], 0.000001)
+    lat     = rv["LATENCY"] ; lat.sort()
+
+    print "updates:    %d (%d octets) in %.3fs" % (n, rv["OCTETS"], elapsed)
+    if n == 0:
+        return
+    print "throughput: %.1f msgs/sec, %.1f kB/sec" %\
+          (n/elapsed, rv["OCTETS"]/elapsed/1024)
+    print "MRTd write: %.1f records/sec, %.1f kB/sec (%.1f%% of time)" %\
+          (n/max(rv["DUMP_T"], 0.000001),
+           rv["DUMPED"]/max(rv["DUMP_T"], 0.000001)/1024,
+           100*rv["DUMP_T"]/elapsed)
+    print "decode:     %.1f msgs/sec (%.1f%% of time)" %\
+          (n/max(rv["DECODE_T"], 0.000001), 100*rv["DECODE_T"]/elapsed)
+    if not lat:
+        print "latency:    n/a (UPDATEs not timestamped)"
+        return
+    print "latency:    p50 %.3fms, p99 %.3fms, max %.3fms" %\
+          (1000*percentile(lat, 0.50), 1000*percentile(lat, 0.99),
+           1000*percentile(lat, 1.0))
+
+################################################################################
+
+if __name__ == "__main__":
+
+    port       = fakepeer.DEFAULT_PORT
+    rate       = 0
+    count      = 10000
+    npfxs      = 1
+    mix        = fakepeer.DEFAULT_MIX
+    aspath_len = 4
+    keep       = 0
+
+    #---------------------------------------------------------------------------
+
+    def usage():
+
+        print """Usage: %s [ options ] [ <filenames> ]:
+        -h|--help       : Help
+
+        -t|--port       : Loopback port to use [def: %d]
+        -r|--rate       : UPDATEs per second [def: as fast as possible]
+        -c|--count      : Number of UPDATEs to send [def: %d]
+        -n|--prefixes   : Prefixes per synthetic UPDATE [def: 1]
+        -m|--mix        : Prefix length mix, plen:weight,... [def: %s]
+        -s|--aspath-len : AS path length of synthetic UPDATEs [def: 4]
+        -k|--keep       : Keep the MRTd dump written by the collector
+
+        UPDATEs are taken from <filenames> (MRTd BGP4MP/BGP4PY dumps) if
+        any are given, else synthesised; latency is only measured for
+        synthetic UPDATEs.""" %\
+            (os.path.basename(sys.argv[0]), fakepeer.DEFAULT_PORT, count,
+             fakepeer.DEFAULT_MIX)
+        sys.exit(0)
+
+    #---------------------------------------------------------------------------
+
+    try:
+        opts, args = getopt.getopt(sys.argv[1:],
+                                   "ht:r:c:n:m:s:k",
+                                   ("help", "port=", "rate=", "count=",
+                                    "prefixes=", "mix=", "aspath-len=",
+                                    "keep" ))
+    except (getopt.error):
+        usage()
+
+    for (x, y) in opts:
+        if x in ('-h', '--help'):
+            usage()
+
+        elif x in ('-t', '--port'):
+            port = string.atoi(y)
+
+        elif x in ('-r', '--rate'):
+            rate = string.atof(y)
+
+        elif x in ('-c', '--count'):
+            count = string.atoi(y)
+
+        elif x in ('-n', '--prefixes'):
+            npfxs = string.atoi(y)
+
+        elif x in ('-m', '--mix'):
+            mix = y
+
+        elif x in ('-s', '--aspath-len'):
+            aspath_len = string.atoi(y)
+
+        elif x in ('-k', '--keep'):
+            keep = 1
+
+        else:
+            usage()
+
+    if not args and npfxs > fakepeer.maxPrefixes(aspath_len):
+        error("at most %d prefixes fit in an UPDATE\n" %
+              fakepeer.maxPrefixes(aspath_len))
+        sys.exit(1)
+
+    #---------------------------------------------------------------------------
+
+    if args:
+        updates = fakepeer.fileUpdates(args)
+    else:
+        updates = fakepeer.synthUpdates(count, npfxs, mix, aspath_len)
+
+    # listen before forking so the collector can't connect too early
+    peer = fakepeer.FakePeer(port=port)
+    pid  = os.fork()
+    if pid == 0:
+        runPeer(peer, updates, rate, count)
+
+    peer._lsnr.close()
+
+    tmpdir = tempfile.mkdtemp()
+    try:
+        rv = runCollector(port, os.path.join(tmpdir, "bench"), not args)
+        (pid, status) = os.waitpid(pid, 0)
+        report(rv)
+
+    finally:
+        for f in glob.glob(os.path.join(tmpdir, "*")):
+            if keep:
+                error("kept %s\n" % f)
+            else:
+                os.unlink(f)
+        if not keep:
+            os.rmdir(tmpdir)
+
+    if status:
+        error("fake peer failed\n")
+    sys.exit((status or not rv["UPDATES"]) and 1 or 0)
+
+################################################################################
+################################################################################
@@ -0,0 +1,362 @@
+#! /usr/bin/env python2.5
+
+##     PyRT: Python Routeing Toolkit
+
+##     Fake BGP peer: a stand-in for a real router which brings up a
+##     session with a collector and then streams synthetic or recorded
+##     UPDATEs at it at a given rate.
+
+##     Copyright (C) 2001 Richard Mortier <mort@sprintlabs.com>, Sprint ATL
+
+##     This program is free software; you can redistribute it and/or
+##     modify it under the terms of the GNU General Public License as
+##     published by the Free Software Foundation; either version 2 of the
+##     License, or (at your option) any later version.
+
+##     This program is distributed in the hope that it will be useful,
+##     but WITHOUT ANY WARRANTY; without even the implied warranty of
+##     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+##     General Public License for more details.
+
+##     You should have received a copy of the GNU General Public License
+##     along with this program; if not, write to the Free Software
+##     Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA
+##     02111-1307 USA
+
+# The fake peer listens (by default on the loopback) and waits for the
+# collector to connect, answers its OPEN, and then sends UPDATEs until
+# it runs out or has sent the requested number, and closes the session.
+
+# Synthetic UPDATEs carry the time at which they were sent (in
+# microseconds, modulo 2^32) in their MED, so that the receiver can
+# work out how long each took to arrive; see updateLatency().
+
+import struct, socket, sys, time, getopt, string, os, random
+import bgp, mrtd, replay
+from mutils import *
+
+#-------------------------------------------------------------------------------
+
+DEFAULT_ADDR = "127.0.0.1"
+DEFAULT_PORT = 1179
+DEFAULT_AS   = 65001
+
+CLOSE_TIMEOUT = 5
+
+# (plen, weight) pairs -- roughly the shape of a full table
+DEFAULT_MIX  = "24:55,23:6,22:9,21:5,20:7,19:6,18:3,17:2,16:7"
+
+################################################################################
+
+def parseMix(mix):
+
+    rv = []
+    for e in string.split(mix, ','):
+        plen, weight = string.split(e, ':')
+        rv.append((string.atoi(plen), string.atoi(weight)))
+
+    return rv
+
+#-------------------------------------------------------------------------------
+
+def mkAttrs(asns, nexthop, stamp=0):
+
+    attrs = { bgp.PATH_ATTRIBUTES["ORIGIN"]:   { "V": bgp.NLRI_SRC["IGP"] },
+              bgp.PATH_ATTRIBUTES["AS_PATH"]:
+                  { "V": [ { "T": bgp.AS_PATH_SEG_TYPES["SEQUENCE"],
+                             "V": asns } ] },
+              bgp.PATH_ATTRIBUTES["NEXT_HOP"]: { "V": nexthop },
+              bgp.PATH_ATTRIBUTES["MULTI_EXIT_DISCRIMINATOR"]: { "V": stamp },
+              }
+
+    return bgp.mkPathAttrs(attrs)
+
+def maxPrefixes(aspath_len=4):
+
+    ## returns the most prefixes a synthetic UPDATE can carry whatever
+    ## their lengths (a /32 takes 5 octets) and still be one message
+
+    room = bgp.BGP_MAX_LEN - bgp.BGP_HDR_LEN - 4
+    return (room - len(mkAttrs([0]*aspath_len, 0))) / 5
+
+def mkUpdate(pfxs, asns, nexthop, stamp=0):
+
+    ## returns (UPDATE body, offset of the MED value in body); raises
+    ## bgp.EncodeExc if pfxs won't fit in one UPDATE (see maxPrefixes())
+
+    attrs = mkAttrs(asns, nexthop, stamp)
+
+    # MED has the highest type code so it's last, and its value ends
+    # the attributes
+    bodies = bgp.mkUpdates((), attrs, pfxs)
+    if len(bodies) > 1:
+        raise bgp.EncodeExc("%d prefixes don't fit in one UPDATE" % len(pfxs))
+
+    return (bodies[0], 4 + len(attrs) - 4)
+
+#-------------------------------------------------------------------------------
+
+def synthUpdates(nupds, npfxs=1, mix=DEFAULT_MIX, aspath_len=4, seed=0):
+
+    ## generates (body, MED offset) for nupds UPDATEs (forever if 0);
+    ## npfxs should be at most maxPrefixes(aspath_len)
+
+    rnd   = random.Random(seed)
+    mix   = parseMix(mix)
+    total = reduce(lambda x, y: x+y, map(lambda x: x[1], mix))
+
+    n = 0
+    while nupds == 0 or n < nupds:
+        n = n + 1
+
+        pfxs = []
+        for i in range(npfxs):
+            r = rnd.randrange(total)
+            for (plen, weight) in mix:
+                if r < weight: break
+                r = r - weight
+            addr = rnd.randrange(0x01000000, 0xe0000000)
+            pfxs.append(id2key(addr, plen))
+
+        asns = []
+        for i in range(aspath_len):
+            asns.append(rnd.randrange(1, 64512))
+
+        yield mkUpdate(pfxs, asns, str2id(DEFAULT_ADDR))
+
+#-------------------------------------------------------------------------------
+
+def fileUpdates(filenames):
+
+    ## generates (body, None) for each UPDATE recorded in filenames
+
+    for fn in filenames:
+        mrt = mrtd.Mrtd(fn, "rb")
+        try:
+            while 1:
+                upd = replay.getUpdate(mrt.read())
+                if upd:
+                    yield (upd[1], None)
+
+        except (mrtd.EOFExc):
+            mrt.close()
+
+#-------------------------------------------------------------------------------
+
+def updateLatency(rv, now=None):
+
+    ## given a parsed synthetic UPDATE, returns seconds since it was sent
+
+    if now == None:
+        now = time.time()
+
+    med = rv["V"]["PATH_ATTRS"][bgp.PATH_ATTRIBUTES["MULTI_EXIT_DISCRIMINATOR"]]
+    usec = (long(now*1000000) - med["V"]) & 0xffffffffL
+
+    return usec * 0.000001
+
+################################################################################
+
+class FakePeer:
+
+    def __init__(self, asn=DEFAULT_AS, loc_name=DEFAULT_ADDR,
+                 port=DEFAULT_PORT, peers=(DEFAULT_ADDR,)):
+
+        self._asn  = asn
+        self._lsnr = bgp.BgpListener(loc_name, port, peers)
+        self._bgp  = None
+
+    def __repr__(self):
+
+        return "Fake BGP peer, AS %d, %s" % (self._asn, `self._lsnr`)
+
+    def close(self):
+
+        # half-close and wait for the collector to go away, so that
+        # nothing it still has in flight makes us reset the connection
+        if self._bgp:
+            self._bgp._sock.shutdown(socket.SHUT_WR)
+            self._bgp._rcvq_thrd.join(CLOSE_TIMEOUT)
+            self._bgp._sock.close()
+        self._lsnr.close()
+
+    #---------------------------------------------------------------------------
+
+    def establish(self, verbose=1, level=0):
+
+        self._bgp = self._lsnr.accept(self._asn, 0, verbose, level)
+
+        rv = self._bgp.parseMsg(verbose, level)
+        self._bgp._bgp_peer_as = rv["V"]["AS"]
+        self._bgp.sendOpen(verbose, level)
+        self._bgp.sendKeepalive(verbose, level)
+
+        # established once the collector confirms our OPEN
+        while rv["T"] != bgp.MSG_TYPES["KEEPALIVE"]:
+            rv = self._bgp.parseMsg(verbose, level)
+
+        # never decoded; just stops the collector's KEEPALIVEs backing up
+        self._bgp.startReceiver()
+
+    def stream(self, updates, rate=0, count=0, verbose=1, level=0):
+
+        ## returns (number of UPDATEs sent, seconds taken)
+
+        n     = 0
+        start = time.time()
+        for (body, med_off) in updates:
+            if count and n >= count:
+                break
+
+            if rate:
+                delay = start + n/float(rate) - time.time()
+                if delay > 0:
+                    time.sleep(delay)
+
+            if med_off != None:
+                stamp = long(time.time()*1000000) & 0xffffffffL
+                body  = body[:med_off] + struct.pack(">L", stamp) +\
+                        body[med_off+4:]
+
+            self._bgp.sendMsg(bgp.MSG_TYPES["UPDATE"], len(body), body,
+                              verbose, level)
+            n = n + 1
+
+        return (n, time.time() - start)
+
+################################################################################
+
+if __name__ == "__main__":
+
+    VERBOSE = 1
+
+    loc_name   = DEFAULT_ADDR
+    port       = DEFAULT_PORT
+    asn        = DEFAULT_AS
+    peers      = []
+    rate       = 0
+    count      = 0
+    npfxs      = 1
+    mix        = DEFAULT_MIX
+    aspath_len = 4
+    seed       = 0
+
+    #---------------------------------------------------------------------------
+
+    def usage():
+
+        print """Usage: %s [ options ] [ <filenames> ]:
+        -h|--help       : Help
+        -q|--quiet      : Be quiet
+        -v|--verbose    : Be verbose
+        -V|--VERBOSE    : Be very verbose
+
+        -l|--local      : Address/name to listen on [def: %s]
+        -t|--port       : Port to listen on [def: %d]
+        -a|--as         : Local AS number [def: %d]
+        -p|--peer       : Collector address/name, may be repeated [def: %s]
+
+        -r|--rate       : UPDATEs per second [def: as fast as possible]
+        -c|--count      : Number of UPDATEs to send [def: all/unlimited]
+        -n|--prefixes   : Prefixes per synthetic UPDATE [def: 1]
+        -m|--mix        : Prefix length mix, plen:weight,... [def: %s]
+        -s|--aspath-len : AS path length of synthetic UPDATEs [def: 4]
+        -S|--seed       : Random seed [def: 0]
+
+        UPDATEs are taken from <filenames> (MRTd BGP4MP/BGP4PY dumps) if
+        any are given, else synthesised.""" %\
+            (os.path.basename(sys.argv[0]), DEFAULT_ADDR, DEFAULT_PORT,
+             DEFAULT_AS, DEFAULT_ADDR, DEFAULT_MIX)
+        sys.exit(0)
+
+    #---------------------------------------------------------------------------
+
+    try:
+        opts, args = getopt.getopt(sys.argv[1:],
+                                   "hqvVl:t:a:p:r:c:n:m:s:S:",
+                                   ("help", "quiet", "verbose", "VERBOSE",
+                                    "local=", "port=", "as=", "peer=",
+                                    "rate=", "count=", "prefixes=", "mix=",
+                                    "aspath-len=", "seed=" ))
+    except (getopt.error):
+        usage()
+
+    for (x, y) in opts:
+        if x in ('-h', '--help'):
+            usage()
+
+        elif x in ('-q', '--quiet'):
+            VERBOSE = 0
+
+        elif x in ('-v', '--verbose'):
+            VERBOSE = 2
+
+        elif x in ('-V', '--VERBOSE'):
+            VERBOSE = 3
+
+        elif x in ('-l', '--local'):
+            loc_name = y
+
+        elif x in ('-t', '--port'):
+            port = string.atoi(y)
+
+        elif x in ('-a', '--as'):
+            asn = string.atoi(y)
+
+        elif x in ('-p', '--peer'):
+            peers.append(y)
+
+        elif x in ('-r', '--rate'):
+            rate = string.atof(y)
+
+        elif x in ('-c', '--count'):
+            count = string.atoi(y)
+
+        elif x in ('-n', '--prefixes'):
+            npfxs = string.atoi(y)
+
+        elif x in ('-m', '--mix'):
+            mix = y
+
+        elif x in ('-s', '--aspath-len'):
+            aspath_len = string.atoi(y)
+
+        elif x in ('-S', '--seed'):
+            seed = string.atoi(y)
+
+        else:
+            usage()
+
+    if not peers:
+        peers = [DEFAULT_ADDR]
+
+    if not args and npfxs > maxPrefixes(aspath_len):
+        error("at most %d prefixes fit in an UPDATE\n" %
+              maxPrefixes(aspath_len))
+        sys.exit(1)
+
+    #---------------------------------------------------------------------------
+
+    if args:
+        updates = fileUpdates(args)
+    else:
+        updates = synthUpdates(count, npfxs, mix, aspath_len, seed)
+
+    peer = FakePeer(asn, loc_name, port, peers)
+    if VERBOSE > 0:
+        print `peer`
+
+    try:
+        peer.establish(VERBOSE-1, 0)
+        (n, elapsed) = peer.stream(updates, rate, count, VERBOSE-1, 0)
+        error("sent %d updates in %.3fs: %.1f msgs/sec\n" %
+              (n, elapsed, n/max(elapsed, 0.000001)))
+
+    except (KeyboardInterrupt):
+        error("interrupted!\n")
+
+    peer.close()
+    sys.exit(0)
+
+################################################################################
+################################################################################
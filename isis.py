@@ -81,9 +81,10 @@
 # fact quite a lot nicer once adjacency is established.  ISIS is a much nicer
 # protocol than BGP which sucks high vacuum.
 
-import sys, getopt, string, os.path, struct, time, select, math
+import sys, getopt, string, os.path, struct, time, select, math, bisect
 from mutils import *
-from isis_extra import check_cksum, getifaddrs
+from isis_extra import check_cksum, getifaddrs, PacketRing, RingError,\
+                       attach_filter, ISIS_FILTER
 from socket import AF_INET, AF_INET6, PF_PACKET, SOCK_RAW, socket,\
                    inet_ntop, inet_pton, htons, error as sockError
 
@@ -95,6 +96,9 @@ INDENT  = "    "
 RETX_THRESH = 3
 RCV_BUF_SZ  = 2048
 
+ZERO_AGE_LIFETIME = 60 # ISO 10589 7.3.16.4: how long purges are kept
+PSNP_DELAY        = 1  # how long to gather LSP acks before sending them
+
 MAC_PKT_LEN  = 1514
 MAC_HDR_LEN  = 17
 ISIS_PKT_LEN = 1500
@@ -108,6 +112,23 @@ ISIS_LSP_HDR_LEN   = 19
 ISIS_CSN_HDR_LEN   = 25
 ISIS_PSN_HDR_LEN   =  9
 
+LSP_ENTRY_LEN      = 16
+
+# where the fields that change between hellos sit in the frames built
+# by mkIsh()/mkPPIsh(), so that they can be patched in place
+ISH_HOLDTIMER_OFF  = MAC_HDR_LEN + ISIS_HDR_LEN + 7
+ISH_LAN_ID_OFF     = MAC_HDR_LEN + ISIS_HDR_LEN + 12
+ISH_CIRCUIT_ID_OFF = MAC_HDR_LEN + ISIS_HDR_LEN + 11
+ISNS_PER_FIELD     = 255 / 6 # IIHIISNeighbor entries per TLV
+
+# LSP header bits
+LSP_OVERLOAD = 1<<2
+LSP_ATTACHED = (1<<6) | (1<<5) | (1<<4) | (1<<3)
+
+# flags in the compact prefix entries kept by the LSDB
+PFX_EXTERNAL = 1<<0
+PFX_DOWN     = 1<<1
+
 AllL1ISs = struct.pack("6B", 0x01, 0x80, 0xc2, 0x00, 0x00, 0x14)
 AllL2ISs = struct.pack("6B", 0x01, 0x80, 0xc2, 0x00, 0x00, 0x15)
 
@@ -223,6 +244,27 @@ for d in DLIST:
     for k in d.keys():
         d[ d[k] ] = k
 
+# the TLVs that the speaker (processFsm(), Adj, Lsdb) looks at in each
+# PDU type; when not printing, parseMsg() decodes only these
+FSM_VFIELDS = { }
+for (ts, fs) in (
+    (("L1LANHello", "L2LANHello", "PPHello"),
+     ("AreaAddress", "ThreeWayHello")),
+    (("L1LSP", "L2LSP"),
+     ("LSPIISNeighbor", "TEIISNeighbor", "IPIntReach", "IPExtReach",
+      "TEIPReach", "DynamicHostname")),
+    (("L1CSN", "L2CSN"),
+     ("LSPEntries", )),
+    (("L1PSN", "L2PSN"),
+     ()),
+    ):
+    for t in ts:
+        FSM_VFIELDS[MSG_TYPES[t]] = { }
+        for f in fs:
+            FSM_VFIELDS[MSG_TYPES[t]][VLEN_FIELDS[f]] = 1
+
+VLEN_HDR = struct.Struct(">BB")
+
 ################################################################################
 
 def padPkt(tgt_len, pkt):
@@ -230,11 +272,18 @@ def padPkt(tgt_len, pkt):
     pad_len = tgt_len - len(pkt)
     if pad_len > 0:
         full, part = divmod(pad_len, 257)
+        if part == 1 and full > 0:
+            # a field is at least 2 octets: borrow one from a full one
+            full = full - 1
+            pkt  = pkt + struct.pack("BB 254s",
+                                     VLEN_FIELDS["Padding"], 254, 254*'\000')
+            part = 2
 
         pkt = pkt + (full*struct.pack("BB 255s",
                                  VLEN_FIELDS["Padding"], 255, 255*'\000'))
-        pkt = pkt + struct.pack("BB %ds" % (part-2, ),
-                           VLEN_FIELDS["Padding"], part-2, (part-2)*'\000')
+        if part >= 2:
+            pkt = pkt + struct.pack("BB %ds" % (part-2, ),
+                               VLEN_FIELDS["Padding"], part-2, (part-2)*'\000')
     return pkt
 
 #-------------------------------------------------------------------------------
@@ -286,9 +335,23 @@ def parseLspHdr(pkt):
 
     return (pdu_len, lifetime, lsp_id, seq_no, cksm, bits)
 
+#-------------------------------------------------------------------------------
+
+# The LSDB keys LSPs by their LSP ID as an 8 octet string: system ID,
+# pseudonode ID, fragment number.  The first 7 octets are the node ID.
+
+def lspKey(lsp_id):
+
+    return lsp_id[0] + chr(lsp_id[1]) + chr(lsp_id[2])
+
+def lspKeyStr(key):
+
+    return "%s.%s-%s" %\
+           (str2hex(key[:6]), int2hex(ord(key[6])), int2hex(ord(key[7])))
+
 ################################################################################
 
-def parseIsisMsg(msg_len, msg, verbose=1, level=0):
+def parseIsisMsg(msg_len, msg, verbose=1, level=0, types=None, skip=0):
 
     (src_mac, dst_mac, length, dsap, ssap, ctrl) = parseMacHdr(msg)
     (nlpid, hdr_len, ver_proto_id, resvd, msg_type, ver, eco, user_eco) =\
@@ -346,7 +409,8 @@ def parseIsisMsg(msg_len, msg, verbose=1, level=0):
              rv["V"]["PDU_LEN"],
              rv["V"]["PRIO"],
              rv["V"]["LAN_ID"],
-             rv["V"]["VFIELDS"]) = parseIsisIsh(msg_len, msg, verbose, level)
+             rv["V"]["VFIELDS"]) = parseIsisIsh(msg_len, msg, verbose, level,
+                                                types, skip)
 
         elif msg_type == MSG_TYPES["PPHello"]:
             (rv["V"]["CIRCUIT_TYPE"],
@@ -354,7 +418,8 @@ def parseIsisMsg(msg_len, msg, verbose=1, level=0):
              rv["V"]["HOLDTIMER"],
              rv["V"]["PDU_LEN"],
              rv["V"]["LOCAL_CIRCUIT_ID"],
-             rv["V"]["VFIELDS"]) = parseIsisPPIsh(msg_len, msg, verbose, level)
+             rv["V"]["VFIELDS"]) = parseIsisPPIsh(msg_len, msg, verbose, level,
+                                                  types, skip)
 
         elif msg_type in (MSG_TYPES["L1LSP"], MSG_TYPES["L2LSP"]):
             (rv["V"]["PDU_LEN"],
@@ -363,19 +428,23 @@ def parseIsisMsg(msg_len, msg, verbose=1, level=0):
              rv["V"]["SEQ_NO"],
              rv["V"]["CKSM"],
              rv["V"]["BITS"],
-             rv["V"]["VFIELDS"]) = parseIsisLsp(msg_len, msg, verbose, level)
+             rv["V"]["CKSM_OK"],
+             rv["V"]["VFIELDS"]) = parseIsisLsp(msg_len, msg, verbose, level,
+                                                types, skip)
 
         elif msg_type in (MSG_TYPES["L1CSN"], MSG_TYPES["L2CSN"]):
             (rv["V"]["PDU_LEN"],
              rv["V"]["SRC_ID"],
              rv["V"]["START_LSP_ID"],
              rv["V"]["END_LSP_ID"],
-             rv["V"]["VFIELDS"]) = parseIsisCsn(msg_len, msg, verbose, level)
+             rv["V"]["VFIELDS"]) = parseIsisCsn(msg_len, msg, verbose, level,
+                                                types, skip)
 
         elif msg_type in (MSG_TYPES["L1PSN"], MSG_TYPES["L2PSN"]):
             (rv["V"]["PDU_LEN"],
              rv["V"]["SRC_ID"],
-             rv["V"]["VFIELDS"]) = parseIsisPsn(msg_len, msg, verbose, level)
+             rv["V"]["VFIELDS"]) = parseIsisPsn(msg_len, msg, verbose, level,
+                                                types, skip)
 
         else:
             if verbose > 0:
@@ -389,7 +458,7 @@ def parseIsisMsg(msg_len, msg, verbose=1, level=0):
 
 ################################################################################
 
-def parseIsisIsh(msg_len, msg, verbose=1, level=0):
+def parseIsisIsh(msg_len, msg, verbose=1, level=0, types=None, skip=0):
 
     (circuit_type, src_id, holdtimer,
      pdu_len, prio, lan_id) = struct.unpack("> B 6s H H B 7s",
@@ -406,12 +475,13 @@ def parseIsisIsh(msg_len, msg, verbose=1, level=0):
         print (level+1)*INDENT + "src id: %s, LAN id: %s" %\
               (str2hex(src_id), str2hex(lan_id))
 
-    vfields = parseVLenFields(msg[ISIS_HELLO_HDR_LEN:], verbose, level)
+    vfields = parseVLenFields(msg, verbose, level, types, ISIS_HELLO_HDR_LEN,
+                              skip)
     return (circuit_type, src_id, holdtimer, pdu_len, prio, lan_id, vfields)
 
 #-------------------------------------------------------------------------------
 
-def parseIsisPPIsh(msg_len, msg, verbose=1, level=0):
+def parseIsisPPIsh(msg_len, msg, verbose=1, level=0, types=None, skip=0):
 
     (circuit_type, src_id, holdtimer,
      pdu_len, local_circuit_id) = struct.unpack(">B 6s H H B",
@@ -426,12 +496,13 @@ def parseIsisPPIsh(msg_len, msg, verbose=1, level=0):
         print (level+1)*INDENT + "src id: %s,  local circuit id: %s" %\
               (str2hex(src_id), local_circuit_id)
 
-    vfields = parseVLenFields(msg[ISIS_PP_HELLO_HDR_LEN:], verbose, level)
+    vfields = parseVLenFields(msg, verbose, level, types,
+                              ISIS_PP_HELLO_HDR_LEN, skip)
     return (circuit_type, src_id, holdtimer, pdu_len, local_circuit_id, vfields)
 
 #-------------------------------------------------------------------------------
 
-def parseIsisLsp(msg_len, msg, verbose=1, level=0):
+def parseIsisLsp(msg_len, msg, verbose=1, level=0, types=None, skip=0):
 
     (pdu_len, lifetime, lsp_id, seq_no, cksm, bits) = parseLspHdr(msg)
 
@@ -460,12 +531,15 @@ def parseIsisLsp(msg_len, msg, verbose=1, level=0):
                ("UNUSED", "L1", "UNUSED", "L1+L2")[ist])
         print (level+1)*INDENT + "attached: %s" % att
 
-    vfields = parseVLenFields(msg[ISIS_LSP_HDR_LEN:], verbose, level) if cksm_ok else {}
-    return (pdu_len, lifetime, lsp_id, seq_no, cksm, bits, vfields)
+    vfields = { }
+    if cksm_ok:
+        vfields = parseVLenFields(msg, verbose, level, types,
+                                  ISIS_LSP_HDR_LEN, skip)
+    return (pdu_len, lifetime, lsp_id, seq_no, cksm, bits, cksm_ok, vfields)
 
 #-------------------------------------------------------------------------------
 
-def parseIsisCsn(msg_len, msg, verbose=1, level=0):
+def parseIsisCsn(msg_len, msg, verbose=1, level=0, types=None, skip=0):
 
     (pdu_len, src_id, start_lsp_id, end_lsp_id) = parseCsnHdr(msg)
 
@@ -480,12 +554,13 @@ def parseIsisCsn(msg_len, msg, verbose=1, level=0):
         print (level+1)*INDENT +\
               "end LSP ID: %s" % (str2hex(end_lsp_id),)
 
-    vfields = parseVLenFields(msg[ISIS_CSN_HDR_LEN:], verbose, level)
+    vfields = parseVLenFields(msg, verbose, level, types, ISIS_CSN_HDR_LEN,
+                              skip)
     return (pdu_len, src_id, start_lsp_id, end_lsp_id, vfields)
 
 #-------------------------------------------------------------------------------
 
-def parseIsisPsn(msg_len, msg, verbose=1, level=0):
+def parseIsisPsn(msg_len, msg, verbose=1, level=0, types=None, skip=0):
 
     (pdu_len, src_id) = parsePsnHdr(msg)
 
@@ -496,28 +571,62 @@ def parseIsisPsn(msg_len, msg, verbose=1, level=0):
         print (level+1)*INDENT +\
               "PDU len: %d, src ID: %s" % (pdu_len, str2hex(src_id))
 
-    vfields = parseVLenFields(msg[ISIS_PSN_HDR_LEN:], verbose, level)
+    vfields = parseVLenFields(msg, verbose, level, types, ISIS_PSN_HDR_LEN,
+                              skip)
     return (pdu_len, src_id, vfields)
 
 ################################################################################
 
-def parseVLenFields(fields, verbose=1, level=0):
+def iterVLenFields(msg, off=0, end=None, types=None):
 
-    vfields = {}
+    ## generates (type, start, end) for each TLV in msg[off:end],
+    ## walking by offset without copying anything; msg may be a string
+    ## or a memoryview.  If types (a dict) is given, TLVs of other
+    ## types are stepped over.
+
+    if end == None:
+        end = len(msg)
 
-    while len(fields) > 1:
+    unpack = VLEN_HDR.unpack_from
+    while off + 1 < end:
         # XXX: strange -- have seen single null byte vfields...
 
-        (ftype, flen) = struct.unpack(">BB", fields[0:2])
+        (ftype, flen) = unpack(msg, off)
+        start = off + 2
+        off   = start + flen
+        if types == None or types.has_key(ftype):
+            yield (ftype, start, min(off, end))
+
+def parseVLenFields(fields, verbose=1, level=0, types=None, off=0, skip=0):
+
+    ## decodes the TLVs in fields[off:]; if types (a dict) is given,
+    ## TLVs of other types are not decoded but returned as
+    ## { "L": len, "R": (start, end) }, a byte range of fields (ie. of
+    ## the PDU after its MAC and ISIS headers, via parseIsisMsg()) --
+    ## or, if skip, are stepped over and left out altogether
+
+    vfields = {}
+
+    if skip:
+        tlvs = iterVLenFields(fields, off, None, types)
+    else:
+        tlvs = iterVLenFields(fields, off)
+
+    for (ftype, start, end) in tlvs:
 
         if not vfields.has_key(ftype):
             vfields[ftype] = []
 
-        vfields[ftype].append(
-            parseVLenField(ftype, flen, fields[2:2+flen], verbose, level+1)
-            )
+        if types == None or types.has_key(ftype):
+            fval = fields[start:end]
+            if type(fval) != type(""):
+                fval = fval.tobytes()
+            vfields[ftype].append(
+                parseVLenField(ftype, end-start, fval, verbose, level+1)
+                )
 
-        fields = fields[2+flen:]
+        else:
+            vfields[ftype].append({ "L": end-start, "R": (start, end) })
 
     return vfields
 
@@ -1116,6 +1225,302 @@ class LLCExc(Exception): pass
 class VLenFieldExc(Exception): pass
 class InvalidIPAddrExc(Exception): pass
 class NoIPAddrExc(Exception): pass
+class PsnTypeExc(Exception): pass
+
+#-------------------------------------------------------------------------------
+
+# LSP IDs are kept as their 8 octet lspKey(), which sort in LSP ID
+# order, so a sorted list of keys alongside the dictionary lets CSNP
+# START_LSP_ID..END_LSP_ID ranges be found by bisection.
+
+class LspTable:
+
+    def __init__(self):
+
+        self._keys = [ ] # sorted
+        self._lsps = { } # key -> value
+
+    def __repr__(self):
+
+        return "LSP table: %d LSPs" % len(self._keys)
+
+    def __len__(self):
+
+        return len(self._keys)
+
+    def has_key(self, key):
+
+        return self._lsps.has_key(key)
+
+    def get(self, key, default=None):
+
+        return self._lsps.get(key, default)
+
+    def keys(self):
+
+        return self._keys[:]
+
+    def insert(self, key, value):
+
+        if not self._lsps.has_key(key):
+            bisect.insort(self._keys, key)
+        self._lsps[key] = value
+
+    def remove(self, key):
+
+        del self._lsps[key]
+        del self._keys[bisect.bisect_left(self._keys, key)]
+
+    def range(self, start, end):
+
+        ## keys from start to end inclusive, in order
+
+        return self._keys[bisect.bisect_left(self._keys, start):
+                          bisect.bisect_right(self._keys, end)]
+
+#-------------------------------------------------------------------------------
+
+# Link state database for one level.  Holds the newest instance of each
+# LSP fragment seen, reduced to what routeing calculations need: IS
+# neighbours as (node ID, metric) and IP prefixes as (addr, plen,
+# metric, flags), narrow and wide metric TLVs alike.  Merged per-node
+# views across fragments are built on demand and cached until one of
+# the node's fragments changes.
+
+class Lsp(object):
+
+    __slots__ = ("_seq_no", "_lifetime", "_cksm", "_bits", "_rcvd",
+                 "_nbrs", "_pfxs", "_hostname")
+
+    def __init__(self, seq_no, lifetime, cksm, bits, rcvd, vfields):
+
+        self._seq_no   = seq_no
+        self._lifetime = lifetime
+        self._cksm     = cksm
+        self._bits     = bits
+        self._rcvd     = rcvd
+        self._hostname = None
+
+        nbrs = []
+        for f in vfields.get(VLEN_FIELDS["LSPIISNeighbor"], ()):
+            for n in f["V"]:
+                nbrs.append((n["NID"], n["DEFAULT"] & 0x3f))
+        for f in vfields.get(VLEN_FIELDS["TEIISNeighbor"], ()):
+            for n in f["V"]:
+                nbrs.append((n["NID"], str2int(n["METRIC"])))
+
+        pfxs = []
+        for (ftype, ext) in ((VLEN_FIELDS["IPIntReach"], 0),
+                             (VLEN_FIELDS["IPExtReach"], PFX_EXTERNAL)):
+            for f in vfields.get(ftype, ()):
+                for p in f["V"]:
+                    flags = ext
+                    if p["DEFAULT"] & 0x40: flags = flags | PFX_EXTERNAL
+                    if p["DEFAULT"] & 0x80: flags = flags | PFX_DOWN
+                    plen = 0
+                    if p["MASK"]: plen = mask2plen(p["MASK"])
+                    pfxs.append((p["ADDR"] & p["MASK"], plen,
+                                 p["DEFAULT"] & 0x3f, flags))
+        for f in vfields.get(VLEN_FIELDS["TEIPReach"], ()):
+            for p in f["V"]:
+                flags = 0
+                if p["UPDOWN"]: flags = PFX_DOWN
+                pfxs.append((str2id(p["ADDR"]), p["PLEN"], p["METRIC"], flags))
+
+        for f in vfields.get(VLEN_FIELDS["DynamicHostname"], ()):
+            self._hostname = f["V"]
+
+        self._nbrs = tuple(nbrs)
+        self._pfxs = tuple(pfxs)
+
+    def __repr__(self):
+
+        return "seq.no: %d, lifetime: %d, cksm: %s, nbrs: %d, pfxs: %d" %\
+               (self._seq_no, self._lifetime, int2hex(self._cksm),
+                len(self._nbrs), len(self._pfxs))
+
+    def remaining(self, now):
+
+        return self._lifetime - (now - self._rcvd)
+
+    def expiry(self):
+
+        ## when this LSP next needs aging: when its lifetime runs out,
+        ## or if already purged, when it should be forgotten
+
+        if self._lifetime == 0:
+            return self._rcvd + ZERO_AGE_LIFETIME
+        return self._rcvd + self._lifetime
+
+#-------------------------------------------------------------------------------
+
+class Lsdb:
+
+    def __init__(self, level):
+
+        self._level = level
+        self._lsps  = { } # LSP ID -> Lsp
+        self._frags = { } # node ID -> { fragment no -> Lsp }
+        self._views = { } # node ID -> merged view (or None), on demand
+
+        self._stats = { "INSTALLED": 0,
+                        "NOT_NEWER": 0,
+                        "BAD_CKSM":  0,
+                        "EXPIRED":   0,
+                        "REMOVED":   0,
+                        }
+
+    def __repr__(self):
+
+        return "L%d LSDB: %d LSPs, %d nodes, stats: %s" %\
+               (self._level, len(self._lsps), len(self._frags), `self._stats`)
+
+    #---------------------------------------------------------------------------
+
+    def isNewer(self, seq_no, lifetime, old, now):
+
+        # ISO 10589 7.3.16: higher sequence number wins; on a tie, a
+        # purge beats a live copy
+        if seq_no != old._seq_no:
+            return seq_no > old._seq_no
+
+        return lifetime == 0 and old.remaining(now) > 0
+
+    def update(self, rv, now=None):
+
+        ## rv is an LSP as returned by parseIsisMsg(); returns its key if
+        ## it was installed, else None
+
+        if now == None:
+            now = time.time()
+
+        v = rv["V"]
+
+        # purges needn't carry a valid checksum
+        if v["LIFETIME"] != 0 and not v.get("CKSM_OK", 1):
+            self._stats["BAD_CKSM"] = self._stats["BAD_CKSM"] + 1
+            return None
+
+        key = lspKey(v["LSP_ID"])
+        if self._lsps.has_key(key) and\
+           not self.isNewer(v["SEQ_NO"], v["LIFETIME"], self._lsps[key], now):
+            self._stats["NOT_NEWER"] = self._stats["NOT_NEWER"] + 1
+            return None
+
+        lsp = Lsp(v["SEQ_NO"], v["LIFETIME"], v["CKSM"], v["BITS"], now,
+                  v["VFIELDS"])
+
+        nid = key[:7]
+        self._lsps[key] = lsp
+        if not self._frags.has_key(nid):
+            self._frags[nid] = { }
+        self._frags[nid][ord(key[7])] = lsp
+        if self._views.has_key(nid):
+            del self._views[nid]
+
+        self._stats["INSTALLED"] = self._stats["INSTALLED"] + 1
+        return key
+
+    def remove(self, key):
+
+        nid = key[:7]
+        del self._lsps[key]
+        del self._frags[nid][ord(key[7])]
+        if not self._frags[nid]:
+            del self._frags[nid]
+        if self._views.has_key(nid):
+            del self._views[nid]
+
+    def age(self, key, lsp, now=None):
+
+        ## called when lsp, installed as key, reaches its expiry(); an
+        ## LSP whose lifetime has run out is kept as a purge for
+        ## ZERO_AGE_LIFETIME and then removed.  Returns lsp if it needs
+        ## aging again, else None
+
+        if now == None:
+            now = time.time()
+
+        if self._lsps.get(key) is not lsp:
+            return None # since replaced
+
+        if lsp._lifetime == 0:
+            self.remove(key)
+            self._stats["REMOVED"] = self._stats["REMOVED"] + 1
+            return None
+
+        lsp._lifetime = 0
+        lsp._rcvd     = now
+        nid = key[:7]
+        if self._views.has_key(nid):
+            del self._views[nid]
+        self._stats["EXPIRED"] = self._stats["EXPIRED"] + 1
+        return lsp
+
+    #---------------------------------------------------------------------------
+
+    def get(self, key):
+
+        return self._lsps.get(key)
+
+    def keys(self):
+
+        return self._lsps.keys()
+
+    def nodes(self):
+
+        return self._frags.keys()
+
+    def fragments(self, nid):
+
+        return self._frags.get(nid, { })
+
+    def node(self, nid):
+
+        ## merged view of node nid's live fragments, or None if it has no
+        ## live fragment 0 (in which case ISO 10589 7.2.5 says to
+        ## ignore the rest)
+
+        if self._views.has_key(nid):
+            return self._views[nid]
+
+        frags = self._frags.get(nid, { })
+        if not frags.has_key(0) or frags[0]._lifetime == 0:
+            self._views[nid] = None
+            return None
+
+        nbrs = { }
+        pfxs = [ ]
+        hostname = None
+        frag_nos = frags.keys()
+        frag_nos.sort()
+        for no in frag_nos:
+            lsp = frags[no]
+            if lsp._lifetime == 0:
+                continue
+
+            for (n, metric) in lsp._nbrs:
+                if not nbrs.has_key(n) or metric < nbrs[n]:
+                    nbrs[n] = metric
+            pfxs.extend(lsp._pfxs)
+            if lsp._hostname and not hostname:
+                hostname = lsp._hostname
+
+        view = { "NBRS":     nbrs,
+                 "PFXS":     pfxs,
+                 "OVERLOAD": frags[0]._bits & LSP_OVERLOAD,
+                 "ATTACHED": frags[0]._bits & LSP_ATTACHED,
+                 "HOSTNAME": hostname,
+                 }
+        self._views[nid] = view
+        return view
+
+    def nodeStr(self, nid):
+
+        view = self.node(nid)
+        if view and view["HOSTNAME"]:
+            return view["HOSTNAME"]
+        return "%s.%s" % (str2hex(nid[:6]), int2hex(ord(nid[6])))
 
 #-------------------------------------------------------------------------------
 
@@ -1134,13 +1539,19 @@ class Isis:
 
     class Adj:
 
-        def __init__(self, atype, ish_rv, tx_ish):
+        def __init__(self, atype, ish_rv, tx_ish=None, tx_off=0):
 
             self._state  = STATES["INITIALIZING"]
             self._type   = atype
-            self._tx_ish = tx_ish
+            self._tx_ish = tx_ish # bytearray, patched as things change
+            self._tx_off = tx_off # neighbours (LAN)/3-way state (P2P) offset
+            self._tx_gen = 0      # neighbour list generation it reflects
+
+            self._rtx_timer  = None
+            self._hold_timer = None
 
-            self._rtx_at = 0
+            self._acks      = { 1: { }, 2: { } } # level -> LSP ID -> entry
+            self._ack_timer = None
 
             self._nbr_mac_addr = ish_rv["H"]["SRC_MAC"]
 
@@ -1160,8 +1571,11 @@ class Isis:
 
         def __repr__(self):
 
+            rtx_at = 0
+            if self._rtx_timer:
+                rtx_at = max(self._rtx_timer[0] - time.time(), 0)
             ret = "st: %s, ht: %d, retx: %d, " %\
-                    (STATES[self._state], self._holdtimer, self._rtx_at)
+                    (STATES[self._state], self._holdtimer, rtx_at)
 
             ret += "neighbour areas: %s, nbr src id: %s, " %\
                     (`map(str2hex, self._nbr_areas)`, str2hex(self._nbr_src_id))
@@ -1177,25 +1591,22 @@ class Isis:
 
     class LSP:
 
-        def __init__(self, lsp_id, lifetime, seq_no, cksm):
+        def __init__(self, key, lifetime, seq_no, cksm):
 
-            self._id_src   = lsp_id[0]
-            self._id_pn    = lsp_id[1]
-            self._id_no    = lsp_id[2]
+            self._key      = key
             self._lifetime = lifetime
             self._seq_no   = seq_no
             self._cksm     = cksm
 
         def __repr__(self):
 
-            ret = "LSP ID: src: %s, pn: %s, no: %d\n" %\
-                  (str2hex(self._id_src), int2hex(self._id_pn), self._id_no)
-            ret += "lifetime: %d, seq.no: %d, cksm: %s" %\
-                   (self._lifetime, self._seq_no, int2hex(self._cksm))
+            return "LSP ID: %s, lifetime: %d, seq.no: %d, cksm: %s" %\
+                   (lspKeyStr(self._key), self._lifetime, self._seq_no,
+                    int2hex(self._cksm))
 
     #---------------------------------------------------------------------------
 
-    def __init__(self, area_addr, dev=None, src_id=None, lan_id=None, src_ip=None, passwd=None):
+    def __init__(self, area_addr, dev=None, src_id=None, lan_id=None, src_ip=None, passwd=None, ring=0):
 
         if not dev:
             dev = Isis._dev_str
@@ -1205,6 +1616,23 @@ class Isis:
         self._sock.bind(self._sockaddr)
         self._sockname = self._sock.getsockname()
 
+        # have the kernel drop anything that isn't ISIS; parseMacHdr()
+        # still checks, for frames that got in before this
+        try:
+            attach_filter(self._sock, ISIS_FILTER)
+        except (sockError), e:
+            error("no socket filter (%s)\n" % e)
+
+        # frames read a block at a time from a shared memory ring if
+        # asked for and the kernel supports it; else one recv() each
+        self._ring    = None
+        self._pending = [ ]
+        if ring:
+            try:
+                self._ring = PacketRing(self._sock)
+            except (RingError), e:
+                error("no rx ring (%s), using recv()\n" % e)
+
         if src_ip:
             try:
                 self._src_ip = (inet_pton(AF_INET, src_ip),)
@@ -1258,8 +1686,11 @@ class Isis:
 
         self._auth_passwd = passwd
 
-        self._adjs  = { }
-        self._lsps  = { }
+        self._adjs   = { }
+        self._isns   = { 1: 0, 2: 0 } # per-level neighbour list generation
+        self._lsps   = { 1: LspTable(), 2: LspTable() }
+        self._lsdb   = { 1: Lsdb(1), 2: Lsdb(2) }
+        self._timers = Timers()
         self._rcvd  = ""
         self._mrtd  = None
         self._dump_mrtd = 0
@@ -1278,12 +1709,16 @@ class Isis:
         ret += "\tArea address: %s\n" % str2hex(self._area_addr)
         ret += "\tSrc ID: %s\n" % str2hex(self._src_id)
         ret += "\tLAN ID: %s\n" % str2hex(self._lan_id)
+        if self._ring:
+            ret += "\tRx ring: %s\n" % `self._ring`
         ret += "\tAdjs: %s" % `self._adjs`
 
         return ret
 
     def close(self):
 
+        if self._ring:
+            self._ring.close()
         self._sock.close()
         self._mrtd.close()
 
@@ -1291,7 +1726,17 @@ class Isis:
 
     def recvMsg(self, verbose=1, level=0):
 
-        self._rcvd = self._sock.recv(RCV_BUF_SZ)
+        if self._ring:
+            if not self._pending:
+                self._pending = self._ring.read()
+                self._pending.reverse()
+            if not self._pending:
+                return (0, "")
+            self._rcvd = self._pending.pop()[0]
+
+        else:
+            self._rcvd = self._sock.recv(RCV_BUF_SZ)
+
         (src_mac, dst_mac, length, dsap, ssap, ctrl) = parseMacHdr(self._rcvd)
 
         if verbose > 2:
@@ -1310,9 +1755,11 @@ class Isis:
 
     def sendMsg(self, pkt, verbose=1, level=0):
 
-        (src_mac, dst_mac, length, dsap, ssap, ctrl) = parseMacHdr(pkt)
-        (nlpid, hdr_len, ver_proto_id, resvd,
-         msg_type, ver, eco, user_eco) = parseIsisHdr(pkt[MAC_HDR_LEN:])
+        # we built it, so no need to parse it unless it's to be shown;
+        # hellos are bytearrays, and are copied only if that's needed
+        (msg_type, ) = struct.unpack_from("B", pkt, MAC_HDR_LEN+4)
+        if (self._dump_mrtd or verbose > 0) and type(pkt) != type(""):
+            pkt = str(pkt)
 
         if self._dump_mrtd == 1:
             self._mrtd.writeIsisMsg(msg_type, len(pkt), pkt)
@@ -1325,6 +1772,7 @@ class Isis:
                   (level*INDENT, len(pkt), prthex((level+1)*INDENT, pkt))
 
         if verbose > 1:
+            (src_mac, dst_mac, length, dsap, ssap, ctrl) = parseMacHdr(pkt)
             print "%ssendMsg: src: %s\n         dst: %s" %\
                   (level*INDENT, str2hex(src_mac), str2hex(dst_mac))
             print "         len: %d" % (length, )
@@ -1347,6 +1795,9 @@ class Isis:
                 print "[ *** Non ISIS frame received *** ]"
             return
 
+        if msg_len == 0:
+            return
+
         (nlpid, hdr_len, ver_proto_id, resvd,
          msg_type, ver, eco, user_eco) = parseIsisHdr(msg[MAC_HDR_LEN:])
 
@@ -1360,7 +1811,13 @@ class Isis:
             print "%sparseMsg: len=%d%s" %\
                   (level*INDENT, msg_len, prthex((level+1)*INDENT, msg))
 
-        rv = parseIsisMsg(msg_len, msg, verbose, level)
+        # unless the PDU is to be printed, only the TLVs the FSM needs
+        # are decoded, and the rest aren't even kept as byte ranges
+        types = None
+        if verbose == 0:
+            types = FSM_VFIELDS.get(msg_type)
+
+        rv = parseIsisMsg(msg_len, msg, verbose, level, types, 1)
         self.processFsm(rv, verbose, level)
 
         return rv
@@ -1408,8 +1865,8 @@ class Isis:
 
         elif ftype == VLEN_FIELDS["LSPEntries"]:
             for entry in values:
-                fval += struct.pack(">H 6sBB L H", entry[0], entry[1][0],
-                              entry[1][1], entry[1][2], entry[2], entry[3])
+                fval += struct.pack(">H 8s L H", entry[0], entry[1],
+                                    entry[2], entry[3])
 
         elif ftype == VLEN_FIELDS["Authentication"]:
             fval = struct.pack("B %ds" % len(values[1]), values[0], values[1])
@@ -1448,23 +1905,33 @@ class Isis:
 
         return fhdr + fval
 
-    def mkIsh(self, ln, lan_id, holdtimer):
+    def mkIshNbrs(self, ln, tgt_len):
+
+        ## the IIHIISNeighbor fields for level ln's adjacencies, padded
+        ## out to tgt_len
 
         isns = []
+        for adj in self._adjs.keys():
+            if self._adjs[adj].has_key(ln):
+                isns.append(str2mac(adj))
+
+        fields = ""
+        for i in range(0, len(isns), ISNS_PER_FIELD):
+            fields = fields +\
+                     self.mkVLenField("IIHIISNeighbor", isns[i:i+ISNS_PER_FIELD])
+
+        return padPkt(tgt_len, fields)
+
+    def mkIsh(self, ln, lan_id, holdtimer):
+
+        ## returns (LAN hello as a bytearray, offset of its neighbours)
+
         if ln == 1:
             dst_mac = AllL1ISs
-            for adj in self._adjs.keys():
-                if self._adjs[adj].has_key(1):
-                    isns.append(str2mac(adj))
-
             msg_type = MSG_TYPES["L1LANHello"]
 
         elif ln == 2:
             dst_mac = AllL2ISs
-            for adj in self._adjs.keys():
-                if self._adjs[adj].has_key(2):
-                    isns.append(str2mac(adj))
-
             msg_type = MSG_TYPES["L2LANHello"]
 
         ish = self.mkMacHdr(dst_mac, self._src_mac)
@@ -1489,14 +1956,30 @@ class Isis:
         ish = ish + self.mkVLenField("MultipleTopologies",
               (MTID["IPv4 routing topology"], MTID["IPv6 routing topology"]))
 
-        if len(isns) > 0:
-            ish = ish + self.mkVLenField("IIHIISNeighbor", isns)
-        ish  = padPkt(MAC_PKT_LEN, ish)
+        off = len(ish)
+        ish = ish + self.mkIshNbrs(ln, MAC_PKT_LEN - off)
 
-        return ish
+        return (bytearray(ish), off)
+
+    def patchIsh(self, adj, lan_id, holdtimer):
+
+        ## brings adj's LAN hello up to date, rewriting the neighbours
+        ## only if the level's adjacencies have changed since it was built
+
+        ish = adj._tx_ish
+        if adj._tx_gen != self._isns[adj._type]:
+            ish[adj._tx_off:] = self.mkIshNbrs(adj._type,
+                                               MAC_PKT_LEN - adj._tx_off)
+            adj._tx_gen = self._isns[adj._type]
+
+        if lan_id != None:
+            struct.pack_into(">H", ish, ISH_HOLDTIMER_OFF, holdtimer)
+            struct.pack_into("7s", ish, ISH_LAN_ID_OFF, lan_id)
 
     def mkPPIsh(self, dst_mac, holdtimer, local_circuit_id, state):
 
+        ## returns (P2P hello as a bytearray, offset of its 3-way state)
+
         ish = self.mkMacHdr(dst_mac, self._src_mac)
         ish = ish + self.mkIsisHdr(MSG_TYPES["PPHello"], ISIS_HDR_LEN + ISIS_PP_HELLO_HDR_LEN)
         ish = ish + self.mkPPIshHdr(CIRCUIT_TYPES["L1L2Circuit"], self._src_id,
@@ -1505,6 +1988,7 @@ class Isis:
         if self._auth_passwd:
             ish += self.mkVLenField("Authentication", (1, self._auth_passwd))
 
+        off = len(ish) + 2
         ish += self.mkVLenField("ThreeWayHello", state)
 
         ish = ish + self.mkVLenField("ProtoSupported", self._proto)
@@ -1518,7 +2002,14 @@ class Isis:
 
         ish  = padPkt(MAC_PKT_LEN, ish)
 
-        return ish
+        return (bytearray(ish), off)
+
+    def patchPPIsh(self, adj, holdtimer, local_circuit_id, state):
+
+        ish = adj._tx_ish
+        struct.pack_into(">H", ish, ISH_HOLDTIMER_OFF, holdtimer)
+        struct.pack_into("B", ish, ISH_CIRCUIT_ID_OFF, local_circuit_id)
+        struct.pack_into("B", ish, adj._tx_off, state)
 
     def mkPsn(self, ln, dst_mac, lsp_entries):
 
@@ -1549,6 +2040,26 @@ class Isis:
 
         return psn
 
+    def psnCapacity(self):
+
+        ## how many LSP entries fit in one PSN
+
+        room = ISIS_PDU_LEN - ISIS_HDR_LEN - ISIS_PSN_HDR_LEN
+        if self._auth_passwd:
+            room = room - 3 - len(self._auth_passwd)
+
+        field = 2 + 15*LSP_ENTRY_LEN
+        return (room / field)*15 + max((room % field - 2) / LSP_ENTRY_LEN, 0)
+
+    def mkPsns(self, ln, dst_mac, lsp_entries):
+
+        ## as few PSNs as will carry lsp_entries
+
+        n = self.psnCapacity()
+        return map(lambda i, s=self, ln=ln, dst_mac=dst_mac, e=lsp_entries, n=n:
+                   s.mkPsn(ln, dst_mac, e[i:i+n]),
+                   range(0, len(lsp_entries), n))
+
     ############################################################################
 
     def processFsm(self, rv, verbose=1, level=0):
@@ -1557,26 +2068,30 @@ class Isis:
         msg_type = rv["T"]
 
         smac = str2hex(src_mac)
-        if not self._adjs.has_key(smac):
-            self._adjs[smac] = { }
+        now  = time.time()
 
         if msg_type in (MSG_TYPES["L1LANHello"], MSG_TYPES["L2LANHello"]):
 
             lan_id = rv["V"]["LAN_ID"]
 
             k = msg_type - 14 # L1 or L2?
-            if not self._adjs[smac].has_key(k):
-                # new adjacency
-                adj = Isis.Adj(k, rv, self.mkIsh(k, self._lan_id, rv["V"]["HOLDTIMER"]))
-                self._adjs[smac][k] = adj
+            if not self._adjs.get(smac, { }).has_key(k):
+                # new adjacency: the level's neighbour list changes
+                adj = Isis.Adj(k, rv)
+                self._adjs.setdefault(smac, { })[k] = adj
+                self._isns[k] = self._isns[k] + 1
+
+                (adj._tx_ish, adj._tx_off) = self.mkIsh(
+                    k, self._lan_id, rv["V"]["HOLDTIMER"])
+                adj._tx_gen = self._isns[k]
 
             else:
                 # existing adjacency
                 adj = self._adjs[smac][k]
                 adj._state = STATES["UP"]
-                adj._tx_ish = self.mkIsh(k, lan_id, rv["V"]["HOLDTIMER"])
+                self.patchIsh(adj, lan_id, rv["V"]["HOLDTIMER"])
 
-            adj._rtx_at = 0
+            self.heardHello(smac, k, adj, rv["V"]["HOLDTIMER"], now)
 
         elif msg_type == MSG_TYPES["PPHello"]:
 
@@ -1600,83 +2115,184 @@ class Isis:
             else:
                 tx_state = STATES["UP"]
 
-            if not self._adjs[smac].has_key(3):
+            if not self._adjs.get(smac, { }).has_key(3):
                 # new adjacency
-                adj = Isis.Adj(3, rv, self.mkPPIsh(src_mac, rv["V"]["HOLDTIMER"],
-                                                   Neighbor_local_circuit_id,
-                                                   tx_state))
-                self._adjs[smac][3] = adj
+                (tx_ish, tx_off) = self.mkPPIsh(src_mac, rv["V"]["HOLDTIMER"],
+                                                Neighbor_local_circuit_id,
+                                                tx_state)
+                adj = Isis.Adj(3, rv, tx_ish, tx_off)
+                self._adjs.setdefault(smac, { })[3] = adj
 
             else:
                 # existing adjacency
                 adj = self._adjs[smac][3]
                 adj._state = STATES["UP"]
-                adj._tx_ish = self.mkPPIsh(src_mac, rv["V"]["HOLDTIMER"],
-                                         Neighbor_local_circuit_id,
-                                         tx_state)
+                self.patchPPIsh(adj, rv["V"]["HOLDTIMER"],
+                                Neighbor_local_circuit_id, tx_state)
 
-            adj._rtx_at = 0
+            self.heardHello(smac, 3, adj, rv["V"]["HOLDTIMER"], now)
 
         elif msg_type in (MSG_TYPES["L1LSP"], MSG_TYPES["L2LSP"]):
 
             lifetime = rv["V"]["LIFETIME"]
-            lsp_id = rv["V"]["LSP_ID"]
+            lsp_key = lspKey(rv["V"]["LSP_ID"])
             seq_no = rv["V"]["SEQ_NO"]
             cksm = rv["V"]["CKSM"]
 
-            id_str = "%s.%s-%s" %\
-                (str2hex(lsp_id[0]), int2hex(lsp_id[1]), int2hex(lsp_id[2]))
-
-            if self._lsps.has_key(id_str):
-                lsp = self._lsps[id_str]
+            ln  = (msg_type - 16) / 2
+            lsp = self._lsps[ln].get(lsp_key)
+            if lsp:
                 lsp._lifetime = lifetime
                 lsp._seq_no   = seq_no
                 lsp._cksm     = cksm
             else:
-                lsp = Isis.LSP(lsp_id, lifetime, seq_no, cksm)
-                self._lsps[id_str] = lsp
+                lsp = Isis.LSP(lsp_key, lifetime, seq_no, cksm)
+                self._lsps[ln].insert(lsp_key, lsp)
 
-            # Check whether a point-to-point adjacency exists with this host
-            if self._adjs[smac].has_key(MSG_TYPES["PPHello"] - 14):
+            if self._lsdb[ln].update(rv, now):
+                entry = self._lsdb[ln].get(lsp_key)
+                self._timers.schedule(entry.expiry(), self.lspTimer,
+                                      (ln, lsp_key, entry))
 
-                psnp_entry = [ lifetime, lsp_id, seq_no, cksm ]
+            # Check whether a point-to-point adjacency exists with this
+            # host, and if so queue an ack; later acks for the same LSP
+            # replace earlier ones
+            adj = self._adjs.get(smac, { }).get(MSG_TYPES["PPHello"] - 14)
+            if adj:
+                adj._acks[ln][lsp_key] = [ lifetime, lsp_key, seq_no, cksm ]
 
-                psnp = self.mkPsn (msg_type - 17, src_mac, [ psnp_entry ])
-                self.sendMsg(psnp, verbose, level)
+                if len(adj._acks[ln]) >= self.psnCapacity():
+                    self.ackTimer(src_mac, adj, verbose, level)
+
+                elif not adj._ack_timer:
+                    adj._ack_timer = self._timers.schedule(
+                        now + PSNP_DELAY, self.ackTimer, (src_mac, adj))
 
         elif msg_type in (MSG_TYPES["L1CSN"], MSG_TYPES["L2CSN"]):
 
-            if rv["V"]["VFIELDS"].has_key(VLEN_FIELDS["LSPEntries"]):
+            lsps = self._lsps[msg_type - 23]
+            psnp_entries = []
+            listed = { }
 
-                psnp_entries = []
+            for field in rv["V"]["VFIELDS"].get(VLEN_FIELDS["LSPEntries"], ()):
 
-                for field in rv["V"]["VFIELDS"][VLEN_FIELDS["LSPEntries"]]:
+                for entry in field["V"]:
 
-                    for entry in field["V"]:
+                    lsp_key = lspKey((entry["ID"], entry["PN"], entry["NM"]))
+                    seq_no = entry["SEQ_NO"]
+                    cksm = entry["CKSM"]
+                    listed[lsp_key] = 1
 
-                        lsp_id = (entry["ID"], entry["PN"], entry["NM"])
-                        seq_no = entry["SEQ_NO"]
-                        cksm = entry["CKSM"]
+                    lsp = lsps.get(lsp_key)
+                    if not lsp:
+                        lsp = Isis.LSP(lsp_key, 0, 0, 0)
+                        lsps.insert(lsp_key, lsp)
 
-                        id_str = "%s.%s-%s" % (str2hex(lsp_id[0]),
-                                  int2hex(lsp_id[1]), int2hex(lsp_id[2]))
+                    if lsp._seq_no < seq_no or lsp._cksm != cksm:
+                        lsp_entry = [ 0, lsp_key, 0, 0 ]
+                        psnp_entries.append(lsp_entry)
 
-                        if self._lsps.has_key(id_str):
-                            lsp = self._lsps[id_str]
-                        else:
-                            lsp = Isis.LSP(lsp_id, 0, 0, 0)
-                            self._lsps[id_str] = lsp
+            # anything we hold in the range the CSNP covers but which it
+            # doesn't list, the neighbour lacks; a router would send it
+            # to them (ISO 10589 7.3.15.2 b), but we're a passive speaker
+            # that never sends LSPs, so it's only noted -- and kept,
+            # since the neighbour lacking it doesn't make it stale
+            if verbose > 1:
+                for lsp_key in lsps.range(rv["V"]["START_LSP_ID"],
+                                          rv["V"]["END_LSP_ID"]):
+                    if not listed.has_key(lsp_key) and \
+                           lsps.get(lsp_key)._seq_no:
+                        print "%sLSP %s not held by neighbour" %\
+                              (level*INDENT, lspKeyStr(lsp_key))
+
+            for psnp in self.mkPsns(msg_type - 23, src_mac, psnp_entries):
+                self.sendMsg(psnp, verbose, level)
+
+        else:
+            pass
+
+    #---------------------------------------------------------------------------
+
+    def heardHello(self, smac, k, adj, holdtimer, now):
+
+        # answer straight away, and restart the hold timer
+        adj._holdtimer = holdtimer
+
+        self._timers.cancel(adj._rtx_timer)
+        adj._rtx_timer = self._timers.schedule(now, self.helloTimer, (adj,))
+
+        self._timers.cancel(adj._hold_timer)
+        adj._hold_timer = self._timers.schedule(now + holdtimer,
+                                                self.holdTimer, (smac, k, adj))
+
+    def helloTimer(self, adj, verbose=1, level=0):
+
+        if adj._type != 3:
+            self.patchIsh(adj, None, None)
+
+        self.sendMsg(adj._tx_ish, verbose, level)
+        adj._rtx_timer = self._timers.schedule(
+            time.time() + max(adj._holdtimer - RETX_THRESH, 1),
+            self.helloTimer, (adj,))
 
-                        if lsp._seq_no < seq_no or lsp._cksm != cksm:
-                            lsp_entry = [ 0, lsp_id, 0, 0 ]
-                            psnp_entries.append(lsp_entry)
+    def ackTimer(self, src_mac, adj, verbose=1, level=0):
 
-                if psnp_entries:
-                    psnp = self.mkPsn (msg_type - 23, src_mac, psnp_entries)
-                    self.sendMsg(psnp, verbose, level)
+        ## sends the acks queued on adj
 
+        self._timers.cancel(adj._ack_timer)
+        adj._ack_timer = None
+
+        for ln in (1, 2):
+            if not adj._acks[ln]:
+                continue
+
+            keys = adj._acks[ln].keys()
+            keys.sort()
+            entries = map(adj._acks[ln].get, keys)
+            adj._acks[ln] = { }
+
+            for psnp in self.mkPsns(ln, src_mac, entries):
+                self.sendMsg(psnp, verbose, level)
+
+    def holdTimer(self, smac, k, adj, verbose=1, level=0):
+
+        self._timers.cancel(adj._rtx_timer)
+        self._timers.cancel(adj._ack_timer)
+        del self._adjs[smac][k]
+        if not self._adjs[smac]:
+            del self._adjs[smac]
+        if k != 3:
+            self._isns[k] = self._isns[k] + 1
+
+        if verbose > 1:
+            print "%sadjacency %s (%d) timed out" % (level*INDENT, smac, k)
+
+    def lspTimer(self, ln, key, lsp, verbose=1, level=0):
+
+        lsdb = self._lsdb[ln]
+        if lsdb.get(key) is not lsp:
+            return # since replaced
+
+        if lsdb.age(key, lsp):
+            self._timers.schedule(lsp.expiry(), self.lspTimer, (ln, key, lsp))
+            what = "expired"
         else:
-            pass
+            what = "removed"
+
+        if verbose > 1:
+            print "%sL%d LSP %s %s" % (level*INDENT, ln, lspKeyStr(key), what)
+
+    def runTimers(self, verbose=1, level=0):
+
+        ## fires any timers due; returns seconds until the next, or None
+
+        now = time.time()
+        self._timers.run(now, verbose, level)
+
+        when = self._timers.next()
+        if when == None:
+            return None
+        return max(when - time.time(), 0)
 
     #---------------------------------------------------------------------------
 
@@ -1700,6 +2316,7 @@ if __name__ == "__main__":
     lan_id    = None
     src_ip    = None
     passwd    = None
+    ring      = 0
 
     #---------------------------------------------------------------------------
 
@@ -1717,6 +2334,7 @@ if __name__ == "__main__":
         -p|--cleartext-password  : set the cleartext password on this interface IIS messages
 
         --device        : Set the device to receive on (def: %s)
+        --ring          : Receive via a PACKET_MMAP ring, if available
 
         -d|--dump       : Dump MRTd::PROTOCOL_ISIS format
         -y|--dump-isis2 : Dump MRTd::PROTOCOL_ISIS2 format
@@ -1737,7 +2355,7 @@ if __name__ == "__main__":
                                    ("help", "quiet", "verbose", "VERBOSE",
                                     "dump", "dump-isis2",
                                     "file-pfx=", "file-size=", "device=",
-                                    "src-id=", "lan-id=", "area-addr=", "ip-addr=",
+                                    "src-id=", "lan-id=", "area-addr=", "ip-addr=", "ring",
 				    "cleartext-password="))
     except (getopt.error):
         usage()
@@ -1769,6 +2387,9 @@ if __name__ == "__main__":
         elif x in ('--device', ):
             device = y
 
+        elif x in ('--ring', ):
+            ring = 1
+
         elif x in ('-s', '--src-id'):
             src_id = map(lambda x: int(x, 16), string.split(y, '.'))
             src_id = struct.pack("6B",
@@ -1808,40 +2429,27 @@ if __name__ == "__main__":
     if not area_addr:
         usage()
 
-    isis = Isis(area_addr, device, src_id, lan_id, src_ip, passwd)
+    isis = Isis(area_addr, device, src_id, lan_id, src_ip, passwd, ring)
     isis._mrtd = mrtd.Mrtd(file_pfx, "w+b", file_sz, mrtd_type, isis)
     isis._dump_mrtd = dump_mrtd
     if verbose > 1:
         print `isis`
 
     try:
-        timeout = Isis._holdtimer - RETX_THRESH
         while 1: # main loop
 
-            before  = time.time()
+            timeout = isis.runTimers(verbose, 0)
             rfds, _, _ = select.select([isis._sock], [], [], timeout)
 
             if rfds != []:
-                # need to rx pkt(s)
+                # need to rx pkt(s), maybe a ring block's worth
                 rv = isis.parseMsg(verbose, 0)
-
-            else:
-                # need to tx pkt(s) of some sort
-                timeout = Isis._holdtimer - RETX_THRESH
-
-            after   = time.time()
-            elapsed = after - before
-
-            for mac in isis._adjs.keys():
-                for a in isis._adjs[mac].keys():
-                    adj = isis._adjs[mac][a]
-                    adj._rtx_at = adj._rtx_at - elapsed
-                    if adj._rtx_at <= RETX_THRESH:
-                        isis.sendMsg(adj._tx_ish, verbose, 0)
-                        adj._rtx_at = adj._holdtimer
-                    timeout = min(timeout, adj._rtx_at-RETX_THRESH)
+                while isis._pending:
+                    rv = isis.parseMsg(verbose, 0)
 
     except (KeyboardInterrupt):
+        if isis._ring and verbose > 0:
+            error("rx ring: %s\n" % `isis._ring.stats()`)
         isis.close()
         sys.exit(1)
 
@@ -1,20 +1,31 @@
 #! /usr/bin/env python
 
 from ctypes import *
-from socket import AF_INET, AF_INET6, AF_PACKET, inet_ntop
+from socket import AF_INET, AF_INET6, AF_PACKET, SOL_SOCKET, inet_ntop
 from sys import platform
+from array import array
+from itertools import imap
+from operator import mul
+import struct, mmap
 
-def calculate_iso_checksum (data, length, offset_check):
+try:
+    import numpy
+except ImportError:
+    numpy = None
 
-    c0 = 0
-    c1 = 0
+# ISO 8473 (Annex C) Fletcher checksum.  The running sums are only
+# reduced modulo 255 once per block of ISO_CKSUM_BLOCK bytes -- the
+# most that can be summed before c1 overflows a 32 bit accumulator --
+# and within a block c1 is worked out from a weighted sum rather than
+# byte by byte, since the contribution of each byte to c1 is just the
+# byte times the number of bytes from it to the end of the block.
+
+ISO_CKSUM_BLOCK = 5802
 
-    for i in range(length):
+CKSUM_WEIGHTS = range (ISO_CKSUM_BLOCK, 0, -1)
 
-        b = 0 if i == offset_check or i == offset_check + 1 else ord(data[i])
 
-        c0 = (c0 + b) % 255
-        c1 = (c1 + c0) % 255
+def iso_checksum_result (length, offset_check, c0, c1):
 
     factor = (length - offset_check) * c0
 
@@ -27,74 +38,60 @@ def calculate_iso_checksum (data, length, offset_check):
     return (ck1 << 8) | ck2
 
 
-def old_cksum (buff, length, offset_check):
+def calculate_iso_checksum (data, length, offset_check):
 
-    init_len = length
-    block = offset_check / 5803
+    buf = array ('B', data[:length])
+    buf[offset_check] = 0
+    buf[offset_check + 1] = 0
 
-    p = 0
     c0 = 0
     c1 = 0
 
-    while length != 0:
-        seglen = length
-        if block == 0:
-            seglen = offset_check % 5803
-            discard = True
-        elif seglen > 5803:
-            seglen = 5803
-        block -= 1
-
-        for i in range (seglen):
-            c0 += ord (buff[p])
-            c1 += c0
-            p += 1
+    for p in xrange (0, length, ISO_CKSUM_BLOCK):
 
-        if discard:
-            p += 2
-            c1 += 2 * c0
-            length -= 2
-            discard = False
+        block = buf[p:p + ISO_CKSUM_BLOCK]
+        n = len (block)
 
-        c0 %= 255
-        c1 %= 255
+        c1 = (c1 + n * c0 +
+              sum (imap (mul, CKSUM_WEIGHTS[ISO_CKSUM_BLOCK - n:], block))) % 255
+        c0 = (c0 + sum (block)) % 255
 
-        length -= seglen
+    return iso_checksum_result (length, offset_check, c0, c1)
 
-    factor = (init_len - offset_check) * c0
-    x = factor - c0 - c1
-    #y = c1 - factor - 1
-    y = c1 - factor
 
-    if x < 0:
-        x -= 1
+def calculate_iso_checksum_np (data, length, offset_check):
 
-    if y > 0:
-        y += 1
+    buf = numpy.frombuffer (data, numpy.uint8, length).astype (numpy.int64)
+    buf[offset_check:offset_check + 2] = 0
 
-    x %= 255
-    y %= 255
+    c0 = int (buf.sum ()) % 255
+    c1 = int (numpy.dot (numpy.arange (length, 0, -1, dtype=numpy.int64),
+                         buf)) % 255
 
-    if x == 0:
-        x = 0xFF
+    return iso_checksum_result (length, offset_check, c0, c1)
 
-    if y == 0:
-        y = 0x01
 
-    return (x << 8) | (y & 0xFF)
-
-
-def check_cksum (data, offset, length, checksum, offset_check):
+def cksum_args_error (data, offset, length, checksum, offset_check):
 
     if checksum == 0:
-        return False, 'no checksum'
+        return 'no checksum'
 
     available_len = len (data[offset:])
     offset_check -= offset
     if available_len < length or offset_check < 0 or offset_check + 2 > length:
-        return False, 'data missing'
+        return 'data missing'
+
+    return None
 
-    result = calculate_iso_checksum (data[offset:], length, offset_check)
+
+def check_cksum (data, offset, length, checksum, offset_check):
+
+    err = cksum_args_error (data, offset, length, checksum, offset_check)
+    if err:
+        return False, err
+
+    result = calculate_iso_checksum (data[offset:], length,
+                                     offset_check - offset)
 
     if result != checksum:
         return False, 'incorrect'
@@ -102,6 +99,223 @@ def check_cksum (data, offset, length, checksum, offset_check):
     return True, 'ok'
 
 
+def check_cksums (pdus):
+
+    # Bulk verification: pdus is a sequence of (data, offset, length,
+    # checksum, offset_check) tuples as for check_cksum, and the result
+    # a list of its return values.  With NumPy the checksummed ranges
+    # are concatenated and every sum done in one pass over the lot.
+
+    if numpy is None:
+        return [ check_cksum (*pdu) for pdu in pdus ]
+
+    rv = [ None ] * len (pdus)
+    todo = []
+    for i in range (len (pdus)):
+        (data, offset, length, checksum, offset_check) = pdus[i]
+        err = cksum_args_error (data, offset, length, checksum, offset_check)
+        if err:
+            rv[i] = (False, err)
+        else:
+            todo.append ((i, data[offset:offset + length], offset_check - offset))
+
+    if not todo:
+        return rv
+
+    buf = numpy.frombuffer (''.join ([ t[1] for t in todo ]),
+                            numpy.uint8).astype (numpy.int64)
+    lens = numpy.array ([ len (t[1]) for t in todo ], numpy.int64)
+    starts = numpy.cumsum (lens) - lens
+
+    checks = starts + numpy.array ([ t[2] for t in todo ], numpy.int64)
+    buf[checks] = 0
+    buf[checks + 1] = 0
+
+    # weight of each byte is its distance from the end of its range
+    weights = numpy.repeat (starts + lens, lens) - numpy.arange (len (buf))
+
+    c0s = numpy.add.reduceat (buf, starts) % 255
+    c1s = numpy.add.reduceat (buf * weights, starts) % 255
+
+    for j in range (len (todo)):
+        (i, pdu, offset_check) = todo[j]
+        result = iso_checksum_result (len (pdu), offset_check,
+                                      int (c0s[j]), int (c1s[j]))
+        if result != pdus[i][3]:
+            rv[i] = (False, 'incorrect')
+        else:
+            rv[i] = (True, 'ok')
+
+    return rv
+
+
+# PACKET_MMAP (TPACKET_V3) receive ring for a PF_PACKET socket: the
+# kernel fills blocks of frames in memory shared with us and hands over
+# a whole block at a time, so reading frames costs no syscall apiece.
+# Blocks are handed over when full or after retire_tov milliseconds,
+# whichever comes first; the socket polls readable when one is ready.
+# See Documentation/networking/packet_mmap.txt.  Anything unsupported
+# raises RingError, and the caller should fall back to recv().
+
+SOL_PACKET        = 263
+PACKET_RX_RING    = 5
+PACKET_STATISTICS = 6
+PACKET_VERSION    = 10
+TPACKET_V3        = 2
+
+TP_STATUS_KERNEL  = 0
+TP_STATUS_USER    = 1
+
+TPACKET_REQ3      = struct.Struct ('7I')
+TPACKET_STATS_V3  = struct.Struct ('3I')
+BLOCK_HDR         = struct.Struct ('4I')    # version .. offset_to_first_pkt
+BLOCK_STATUS_OFF  = 8
+FRAME_HDR         = struct.Struct ('6I2H')  # tp_next_offset .. tp_net
+
+
+class RingError (Exception): pass
+
+
+class PacketRing:
+
+    def __init__ (self, sock, block_size=1<<18, block_nr=16,
+                  frame_size=2048, retire_tov=50):
+
+        self._sock = sock
+        self._block_size = block_size
+        self._block_nr = block_nr
+        self._next = 0
+
+        self._stats = { 'packets': 0, 'drops': 0, 'freeze_q_cnt': 0,
+                        'blocks': 0, 'frames': 0, 'max_frames_per_block': 0 }
+
+        try:
+            sock.setsockopt (SOL_PACKET, PACKET_VERSION, TPACKET_V3)
+            sock.setsockopt (SOL_PACKET, PACKET_RX_RING,
+                             TPACKET_REQ3.pack (block_size, block_nr,
+                                                frame_size,
+                                                block_size / frame_size * block_nr,
+                                                retire_tov, 0, 0))
+            self._ring = mmap.mmap (sock.fileno (), block_size * block_nr,
+                                    mmap.MAP_SHARED,
+                                    mmap.PROT_READ | mmap.PROT_WRITE)
+        except (EnvironmentError, ValueError), e:
+            raise RingError (str (e))
+
+    def __repr__ (self):
+
+        return 'TPACKET_V3 ring: %d x %d byte blocks, stats: %s' % \
+               (self._block_nr, self._block_size, repr (self.stats ()))
+
+    def close (self):
+
+        self._ring.close ()
+
+    def read (self):
+
+        # All frames in blocks the kernel has handed over, oldest first,
+        # as (frame, (sec, nsec)); the blocks are handed straight back.
+
+        ring = self._ring
+        rv = []
+
+        while 1:
+            base = self._next * self._block_size
+            status = struct.unpack_from ('I', ring, base + BLOCK_STATUS_OFF)[0]
+            if not status & TP_STATUS_USER:
+                break
+
+            (version, offset_to_priv, status, num_pkts) = \
+                      BLOCK_HDR.unpack_from (ring, base)
+            off = base + struct.unpack_from ('I', ring, base + 16)[0]
+            for i in xrange (num_pkts):
+                (next_off, sec, nsec, snaplen, length, fstatus, mac, net) = \
+                           FRAME_HDR.unpack_from (ring, off)
+                rv.append ((ring[off + mac:off + mac + snaplen], (sec, nsec)))
+                off += next_off
+
+            struct.pack_into ('I', ring, base + BLOCK_STATUS_OFF,
+                              TP_STATUS_KERNEL)
+            self._next = (self._next + 1) % self._block_nr
+
+            self._stats['blocks'] += 1
+            self._stats['frames'] += num_pkts
+            self._stats['max_frames_per_block'] = \
+                max (self._stats['max_frames_per_block'], num_pkts)
+
+        return rv
+
+    def stats (self):
+
+        # kernel counters are reset on each read, so accumulate them
+
+        try:
+            (packets, drops, freeze_q_cnt) = TPACKET_STATS_V3.unpack (
+                self._sock.getsockopt (SOL_PACKET, PACKET_STATISTICS,
+                                       TPACKET_STATS_V3.size))
+            self._stats['packets'] += packets
+            self._stats['drops'] += drops
+            self._stats['freeze_q_cnt'] += freeze_q_cnt
+        except EnvironmentError:
+            pass
+
+        rv = dict (self._stats)
+        if rv['blocks']:
+            rv['frames_per_block'] = float (rv['frames']) / rv['blocks']
+        else:
+            rv['frames_per_block'] = 0.0
+        return rv
+
+
+# Classic BPF socket filters.  A program is a list of (code, jt, jf, k)
+# instructions, see Documentation/networking/filter.txt; the kernel
+# runs it on each frame before it is queued to the socket, and drops
+# the frame if it returns 0.
+
+SO_ATTACH_FILTER = 26
+
+BPF_LD_B_ABS  = 0x30
+BPF_LD_H_ABS  = 0x28
+BPF_LD_W_ABS  = 0x20
+BPF_LD_B_IND  = 0x50
+BPF_LDX_B_MSH = 0xb1    # X = 4 * (P[k] & 0xf), ie. the IP header length
+BPF_JGT_K     = 0x25
+BPF_JEQ_K     = 0x15
+BPF_RET_K     = 0x06
+
+BPF_ACCEPT    = 0x40000 # snap length, ie. the whole frame
+
+# 802.3 length (not an Ethertype), then LLC fe/fe/03 and NLPID 0x83
+ISIS_FILTER = [
+    (BPF_LD_H_ABS, 0, 0, 12),
+    (BPF_JGT_K,    3, 0, 1500),
+    (BPF_LD_W_ABS, 0, 0, 14),
+    (BPF_JEQ_K,    0, 1, 0xfefe0383),
+    (BPF_RET_K,    0, 0, BPF_ACCEPT),
+    (BPF_RET_K,    0, 0, 0),
+]
+
+# a raw IPv4 socket sees the IP header first: protocol 89, then OSPF
+# version 2 just past the (variable length) IP header
+OSPF_FILTER = [
+    (BPF_LD_B_ABS,  0, 0, 9),
+    (BPF_JEQ_K,     0, 4, 89),
+    (BPF_LDX_B_MSH, 0, 0, 0),
+    (BPF_LD_B_IND,  0, 0, 0),
+    (BPF_JEQ_K,     0, 1, 2),
+    (BPF_RET_K,     0, 0, BPF_ACCEPT),
+    (BPF_RET_K,     0, 0, 0),
+]
+
+
+def attach_filter (sock, prog):
+
+    insns = ''.join ([ struct.pack ('HBBI', *insn) for insn in prog ])
+    buf = create_string_buffer (insns, len (insns))
+    fprog = struct.pack ('HL', len (prog), addressof (buf))
+    sock.setsockopt (SOL_SOCKET, SO_ATTACH_FILTER, fprog)
+
+
 def getifaddrs():
     
     # Source code from carnivore.it
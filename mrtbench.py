@@ -0,0 +1,329 @@
+#! /usr/bin/env python2.5
+
+##     PyRT: Python Routeing Toolkit
+
+##     Benchmarks the MRTD parsers: records/sec and MB/sec for
+##     Mrtd.read(), Mrtd.parse() and each protocol decoder, over
+##     synthetic workloads or given dumps, against a stored baseline.
+
+##     Copyright (C) 2001 Richard Mortier <mort@sprintlabs.com>, Sprint ATL
+
+##     This program is free software; you can redistribute it and/or
+##     modify it under the terms of the GNU General Public License as
+##     published by the Free Software Foundation; either version 2 of the
+##     License, or (at your option) any later version.
+
+##     This program is distributed in the hope that it will be useful,
+##     but WITHOUT ANY WARRANTY; without even the implied warranty of
+##     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+##     General Public License for more details.
+
+##     You should have received a copy of the GNU General Public License
+##     along with this program; if not, write to the Free Software
+##     Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA
+##     02111-1307 USA
+
+# Each dump is timed in three stages, each over the whole file and the
+# best of several runs kept: reading (framing records with Mrtd.read()),
+# parsing (Mrtd.parse() of the records already read), and decoding (the
+# protocol module's own parser handed just the protocol message, so
+# without the MRTD layer).  Nothing is printed while timing; verbose is
+# 0 throughout, which is what a collector or a script working on the
+# returned values would use.
+
+# A baseline is a text file of "workload stage records/sec MB/sec"
+# lines as written by -o.  Rates depend on the machine, so baselines are
+# only comparable with runs on the machine that wrote them.
+
+import time, getopt, sys, string, os, struct, tempfile, glob
+import bgp, isis, ospf, mrtd, mrtgen
+from mutils import *
+
+DEFAULT_COUNT     = 10000
+DEFAULT_REPEAT    = 3
+DEFAULT_TOLERANCE = 10.0 # percent below the baseline counted as slower
+
+################################################################################
+
+def decodeTableDump(plen, entries):
+
+    while entries:
+        rv = bgp.parseTableEntry(plen, entries, 0)
+        entries = entries[rv["L"]:]
+
+def decoderArgs(msg):
+
+    ## returns (decoder name, function, args, octets) to decode the
+    ## protocol message in msg as read by Mrtd.read(), or None
+
+    (ptime, ptype, psubtype, plen, phdr, pdata) = msg
+
+    if ptype == mrtd.MSG_TYPES["TABLE_DUMP"]:
+        entries = pdata[mrtd.TABLE_DUMP_HDR_LEN:]
+        return ("bgp.parseTableEntry", decodeTableDump, (plen, entries),
+                len(entries))
+
+    elif ptype in (mrtd.MSG_TYPES["PROTOCOL_BGP4MP"],
+                   mrtd.MSG_TYPES["PROTOCOL_BGP4PY"]):
+        if psubtype != mrtd.BGP4MP_SUBTYPES["MESSAGE"]:
+            return None
+        if ptype == mrtd.MSG_TYPES["PROTOCOL_BGP4MP"]:
+            pdu = pdata[mrtd.BGP4MP_SUBTYPE_HDR_LEN:]
+        else:
+            pdu = pdata[mrtd.BGP4PY_SUBTYPE_HDR_LEN:]
+        (msg_len, msg_type) =\
+                  struct.unpack(">HB", pdu[bgp.BGP_MARKER_LEN:bgp.BGP_HDR_LEN])
+        return ("bgp.parseBgpPdu", bgp.parseBgpPdu,
+                (msg_type, msg_len, pdu, 0), len(pdu))
+
+    elif ptype == mrtd.MSG_TYPES["PROTOCOL_ISIS"]:
+        return ("isis.parseIsisMsg", isis.parseIsisMsg,
+                (plen, pdata, 0), plen)
+
+    elif ptype == mrtd.MSG_TYPES["PROTOCOL_ISIS2"]:
+        pdu = pdata[mrtd.ISIS2_SUBTYPE_HDR_LEN:]
+        return ("isis.parseIsisMsg", isis.parseIsisMsg,
+                (plen, pdu, 0), len(pdu))
+
+    elif ptype == mrtd.MSG_TYPES["PROTOCOL_OSPF2"]:
+        pkt = pdata[mrtd.OSPF2_SUBTYPE_HDR_LEN:]
+        return ("ospf.parseOspfMsg", ospf.parseOspfMsg, (pkt, 0), len(pkt))
+
+    return None
+
+#-------------------------------------------------------------------------------
+
+def benchFile(file_name, repeat=DEFAULT_REPEAT):
+
+    ## returns [ (stage, records, octets, seconds) ], the best of repeat
+    ## runs of each stage
+
+    best = { }
+    def keep(stage, n, octets, t, best=best):
+        if not best.has_key(stage) or t < best[stage][2]:
+            best[stage] = (n, octets, t)
+
+    for i in range(repeat):
+        mrt  = mrtd.Mrtd(file_name, "rb")
+        msgs = []
+        t0   = time.time()
+        try:
+            while 1:
+                msgs.append(mrt.read())
+        except (mrtd.EOFExc):
+            pass
+        t = time.time() - t0
+
+        octets = 0
+        for msg in msgs:
+            octets = octets + mrtd.COMMON_HDR_LEN + msg[3]
+        keep("read", len(msgs), octets, t)
+
+        t0 = time.time()
+        for msg in msgs:
+            mrt.parse(msg, 0)
+        keep("parse", len(msgs), octets, time.time() - t0)
+        mrt.close()
+
+        # group by decoder, so that each is timed over all its messages
+        decoders = { }
+        for msg in msgs:
+            d = decoderArgs(msg)
+            if d:
+                decoders.setdefault(d[0], []).append(d[1:])
+
+        for (name, calls) in decoders.items():
+            octets = 0
+            t0 = time.time()
+            for (func, args, n) in calls:
+                apply(func, args)
+            t = time.time() - t0
+            for (func, args, n) in calls:
+                octets = octets + n
+            keep(name, len(calls), octets, t)
+
+    # stages in the order run, decoders by name
+    stages = best.keys()
+    stages.sort(lambda x, y: cmp((x not in ("read", "parse"), x != "read", x),
+                                 (y not in ("read", "parse"), y != "read", y)))
+
+    return map(lambda s, best=best: (s, ) + best[s], stages)
+
+#-------------------------------------------------------------------------------
+
+def rates(n, octets, t):
+
+    t = max(t, 0.000001)
+    return (n/t, octets/t/(1024*1024))
+
+def readBaseline(file_name):
+
+    ## returns { (workload, stage): (records/sec, MB/sec) }
+
+    rv = { }
+    f  = open(file_name, "r")
+    for line in f.readlines():
+        line = string.strip(line)
+        if not line or line[0] == '#':
+            continue
+        (workload, stage, rps, mbps) = string.split(line)
+        rv[(workload, stage)] = (string.atof(rps), string.atof(mbps))
+    f.close()
+
+    return rv
+
+def writeBaseline(file_name, results):
+
+    f = open(file_name, "w")
+    f.write("# workload stage records/sec MB/sec\n")
+    for (workload, stage, n, octets, t) in results:
+        f.write("%s %s %.1f %.3f\n" % ((workload, stage) + rates(n, octets, t)))
+    f.close()
+
+def report(results, baseline=None, tolerance=DEFAULT_TOLERANCE):
+
+    ## returns the number of stages slower than the baseline
+
+    slower = 0
+    for (workload, stage, n, octets, t) in results:
+        (rps, mbps) = rates(n, octets, t)
+        line = "%-10s %-20s %7d recs %9d octets %10.1f recs/sec %6.2f MB/sec" %\
+               (workload, stage, n, octets, rps, mbps)
+
+        if baseline and baseline.has_key((workload, stage)):
+            base = baseline[(workload, stage)][0]
+            diff = 100.0*(rps - base)/max(base, 0.000001)
+            line = line + " (%+.1f%%)" % diff
+            if diff < -tolerance:
+                line = line + " SLOWER"
+                slower = slower + 1
+
+        print line
+
+    return slower
+
+################################################################################
+
+if __name__ == "__main__":
+
+    workloads = []
+    count     = DEFAULT_COUNT
+    seed      = mrtgen.DEFAULT_SEED
+    repeat    = DEFAULT_REPEAT
+    tolerance = DEFAULT_TOLERANCE
+    base_file = None
+    out_file  = None
+    keep      = 0
+
+    #---------------------------------------------------------------------------
+
+    def usage():
+
+        print """Usage: %s [ options ] [ <filenames> ]:
+        -h|--help       : Help
+
+        -w|--workload   : Synthetic workload to run, one of %s
+                          (may be given more than once) [def: all]
+        -c|--count      : Records per synthetic workload [def: %d]
+        -s|--seed       : Random seed for the workloads [def: %d]
+        -k|--keep       : Keep the synthetic dumps
+
+        -n|--repeat     : Runs of each stage, the best being kept [def: %d]
+        -b|--baseline   : Compare against this baseline
+        -t|--tolerance  : Percent below the baseline counted as slower
+                          [def: %.0f]
+        -o|--output     : Write the results as a baseline to this file
+
+        Times Mrtd.read(), Mrtd.parse() and the protocol decoders over
+        <filenames> (MRTD dumps) if any are given, else over synthetic
+        workloads from mrtgen.py.  Exits 1 if any stage is slower than
+        the baseline.""" %\
+            (os.path.basename(sys.argv[0]), string.join(mrtgen.WORKLOADS, ", "),
+             count, seed, repeat, tolerance)
+        sys.exit(0)
+
+    #---------------------------------------------------------------------------
+
+    try:
+        opts, args = getopt.getopt(sys.argv[1:],
+                                   "hw:c:s:kn:b:t:o:",
+                                   ("help", "workload=", "count=", "seed=",
+                                    "keep", "repeat=", "baseline=",
+                                    "tolerance=", "output=" ))
+    except (getopt.error):
+        usage()
+
+    for (x, y) in opts:
+        if x in ('-h', '--help'):
+            usage()
+
+        elif x in ('-w', '--workload'):
+            if y not in mrtgen.WORKLOADS:
+                usage()
+            workloads.append(y)
+
+        elif x in ('-c', '--count'):
+            count = string.atoi(y)
+
+        elif x in ('-s', '--seed'):
+            seed = string.atoi(y)
+
+        elif x in ('-k', '--keep'):
+            keep = 1
+
+        elif x in ('-n', '--repeat'):
+            repeat = max(string.atoi(y), 1)
+
+        elif x in ('-b', '--baseline'):
+            base_file = y
+
+        elif x in ('-t', '--tolerance'):
+            tolerance = string.atof(y)
+
+        elif x in ('-o', '--output'):
+            out_file = y
+
+        else:
+            usage()
+
+    #---------------------------------------------------------------------------
+
+    baseline = None
+    if base_file:
+        baseline = readBaseline(base_file)
+
+    tmpdir = None
+    if args:
+        files = map(lambda f: (os.path.basename(f), f), args)
+    else:
+        tmpdir = tempfile.mkdtemp()
+        files  = []
+        for workload in (workloads or mrtgen.WORKLOADS):
+            file_name = os.path.join(tmpdir, "%s.mrt" % workload)
+            mrtgen.writeWorkload(file_name, workload, count, seed)
+            files.append((workload, file_name))
+
+    try:
+        results = []
+        for (workload, file_name) in files:
+            for r in benchFile(file_name, repeat):
+                results.append((workload, ) + r)
+
+    finally:
+        if tmpdir:
+            for f in glob.glob(os.path.join(tmpdir, "*")):
+                if keep:
+                    error("kept %s\n" % f)
+                else:
+                    os.unlink(f)
+            if not keep:
+                os.rmdir(tmpdir)
+
+    slower = report(results, baseline, tolerance)
+    if out_file:
+        writeBaseline(out_file, results)
+
+    sys.exit(slower and 1 or 0)
+
+################################################################################
+################################################################################
@@ -247,7 +247,7 @@ class Mrtd:
     _extn_fmt = ".%Y-%m-%d_%H.%M.%S"
 
     def __init__(self, file_pfx=DEFAULT_FILE, file_mode="w+b",
-                 file_size=None, mrt_type=None, msg_src=None):
+                 file_size=None, mrt_type=None, msg_src=None, file_flush=1):
 
         self._mrt_type  = mrt_type
         self._msg_src   = msg_src # message source object, typed by mrt_type
@@ -261,6 +261,7 @@ class Mrtd:
 
         self._file_size = file_size
         self._file_mode = file_mode
+        self._file_flush = file_flush # flush after every message?
 
         self._of        = open(self._file_name, file_mode)
         self._read      = ""
@@ -275,7 +276,8 @@ class Mrtd:
             file: %s
             size: %s""" %\
             (MSG_TYPES[self._mrt_type],
-             self._msg_src._sock, self._file_pfx, self._file_name, self._file_size)
+             getattr(self._msg_src, "_sock", self._msg_src.__class__.__name__),
+             self._file_pfx, self._file_name, self._file_size)
         else:
             rs = """MRTD module:
             type: %s
@@ -307,7 +309,8 @@ class Mrtd:
             self._of = open(self._file_name, self._file_mode)
 
         self._of.write(msg)
-        self._of.flush()
+        if self._file_flush:
+            self._of.flush()
 
     def read(self):
 
@@ -412,9 +415,10 @@ class Mrtd:
 
         return rv
 
-    def mkHdr(self, subtype, msg_len):
+    def mkHdr(self, subtype, msg_len, ts=None):
 
-        ts = time.time()
+        if ts == None:
+            ts = time.time()
         hdr = struct.pack(">LHHL", int(ts), self._mrt_type, subtype, msg_len)
         return (ts, hdr)
 
@@ -692,9 +696,9 @@ class Mrtd:
 
     #---------------------------------------------------------------------------
 
-    def writeIsis2Msg(self, ptype, plen, pkt):
+    def writeIsis2Msg(self, ptype, plen, pkt, ts=None):
 
-        (ts, hdr) = self.mkHdr(ptype, plen+ISIS2_SUBTYPE_HDR_LEN)
+        (ts, hdr) = self.mkHdr(ptype, plen+ISIS2_SUBTYPE_HDR_LEN, ts)
         (ts_frac, ts_int) = math.modf(ts)
         msg = struct.pack(">%ds L %ds" % (COMMON_HDR_LEN, len(pkt)),
                           hdr, ts_frac*1000000, pkt)
@@ -717,9 +721,9 @@ class Mrtd:
 
     #---------------------------------------------------------------------------
 
-    def writeOspfMsg(self, ptype, plen, pkt):
+    def writeOspfMsg(self, ptype, plen, pkt, ts=None):
 
-        (ts, hdr) = self.mkHdr(ptype, plen+OSPF2_SUBTYPE_HDR_LEN)
+        (ts, hdr) = self.mkHdr(ptype, plen+OSPF2_SUBTYPE_HDR_LEN, ts)
         (ts_frac, ts_int) = math.modf(ts)
         msg = struct.pack(">%ds L %ds" %(
             COMMON_HDR_LEN, len(pkt)), hdr, ts_frac*1000000, pkt)
@@ -0,0 +1,544 @@
+#! /usr/bin/env python2.5
+
+##     PyRT: Python Routeing Toolkit
+
+##     Synthetic MRTD workload generator: writes deterministic TABLE_DUMP,
+##     BGP4MP/BGP4PY UPDATE, ISIS2 and OSPF2 dumps for benchmarking the
+##     parsers.
+
+##     Copyright (C) 2001 Richard Mortier <mort@sprintlabs.com>, Sprint ATL
+
+##     This program is free software; you can redistribute it and/or
+##     modify it under the terms of the GNU General Public License as
+##     published by the Free Software Foundation; either version 2 of the
+##     License, or (at your option) any later version.
+
+##     This program is distributed in the hope that it will be useful,
+##     but WITHOUT ANY WARRANTY; without even the implied warranty of
+##     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+##     General Public License for more details.
+
+##     You should have received a copy of the GNU General Public License
+##     along with this program; if not, write to the Free Software
+##     Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA
+##     02111-1307 USA
+
+# Each workload is a generator of complete MRTD records (common header
+# included) driven by a random.Random seeded by the caller, so that a
+# given workload, count and seed always produce the same file.  Sizes
+# are drawn from the (value, weight) mixes below, in the same format as
+# fakepeer's prefix length mix: prefix lengths, AS path lengths,
+# prefixes per UPDATE and communities per route for BGP; neighbours,
+# prefixes and metric style per LSP for ISIS; and LSA types, LSAs per
+# LSUPD and links per router LSA for OSPF.  They are roughly the shape
+# of what collectors see, not measurements of any particular network.
+
+import struct, sys, getopt, string, os, random
+import bgp, isis, ospf, mrtd, fakepeer
+from isis_extra import calculate_iso_checksum
+from mutils import *
+
+#-------------------------------------------------------------------------------
+
+BASE_TIME    = 1000000000L # first record's time stamp
+DEFAULT_SEED = 0
+
+# BGP
+PLEN_MIX     = fakepeer.DEFAULT_MIX
+ASPATH_MIX   = "1:2,2:12,3:30,4:28,5:15,6:7,7:3,8:2,10:1"
+NLRI_MIX     = "1:60,2:15,3:7,4:5,6:5,10:4,20:3,50:1"
+COMM_MIX     = "0:40,1:15,2:15,3:10,5:10,10:7,20:3"
+PEERS_MIX    = "1:20,2:20,4:30,8:30" # TABLE_DUMP entries per prefix
+WITHDRAW_PCT = 20                    # UPDATEs that only withdraw
+PREPEND_PCT  = 10                    # AS paths with the origin prepended
+NPEERS       = 8
+
+DST_AS       = 65000
+DST_IP       = str2id("10.0.0.1")
+
+# ISIS
+ISIS_LEVEL_MIX = "1:30,2:70"
+ISIS_NBRS_MIX  = "1:10,2:30,3:25,4:15,6:10,10:7,20:3"
+ISIS_PFXS_MIX  = "1:10,2:20,4:25,8:20,16:15,32:7,64:3"
+ISIS_WIDE_PCT  = 80                  # LSPs using wide metrics
+ISIS_NSYSTEMS  = 1000
+ISIS_AREA      = "\x49\x00\x01"
+ISIS_LSP_BITS  = 3                   # L1/L2 IS type
+
+# OSPF
+OSPF_LSA_MIX   = "1:30,2:10,3:25,4:3,5:32"
+OSPF_NLSAS_MIX = "1:55,2:15,3:10,5:8,10:7,20:4,40:1"
+OSPF_LINKS_MIX = "1:10,2:25,3:25,4:15,6:12,10:8,20:5"
+OSPF_NRTRS     = 500
+OSPF_MAX_LEN   = 1480                # keep LSUPDs within an Ethernet MTU
+OSPF_AREAS     = (0L, 1L, 2L)
+
+WORKLOADS = ("table", "bgp4mp", "bgp4py", "isis", "ospf")
+
+################################################################################
+
+def mkMix(mix):
+
+    ## mix as for fakepeer.parseMix(); returns (total weight, mix)
+
+    mix = fakepeer.parseMix(mix)
+    return (reduce(lambda x, y: x+y, map(lambda x: x[1], mix)), mix)
+
+def choose(rnd, (total, mix)):
+
+    r = rnd.randrange(total)
+    for (v, weight) in mix:
+        if r < weight: break
+        r = r - weight
+    return v
+
+def mkRecord(ts, mrt_type, subtype, body):
+
+    return struct.pack(">LHHL", ts, mrt_type, subtype, len(body)) + body
+
+#-------------------------------------------------------------------------------
+
+def mkPeers(rnd):
+
+    ## [ (AS, address), ... ] of the peers the BGP workloads come from
+
+    rv = []
+    for i in range(NPEERS):
+        rv.append((rnd.randrange(1, 64512),
+                   rnd.randrange(0x01000000, 0xe0000000)))
+    return rv
+
+def mkAsPath(rnd, peer_as, origin, lens):
+
+    n    = choose(rnd, lens)
+    path = [ peer_as ]
+    for i in range(n-2):
+        path.append(rnd.randrange(1, 64512))
+    if n > 1:
+        path.append(origin)
+    if rnd.randrange(100) < PREPEND_PCT:
+        path = path + [ path[-1] ] * rnd.randrange(1, 4)
+
+    return path
+
+def mkBgpAttrs(rnd, peer, origin, mixes):
+
+    (lens, comms) = mixes
+    (peer_as, peer_ip) = peer
+
+    attrs = { bgp.PATH_ATTRIBUTES["ORIGIN"]:
+                  { "V": rnd.choice((bgp.NLRI_SRC["IGP"], bgp.NLRI_SRC["IGP"],
+                                     bgp.NLRI_SRC["INCOMPLETE"])) },
+              bgp.PATH_ATTRIBUTES["AS_PATH"]:
+                  { "V": [ { "T": bgp.AS_PATH_SEG_TYPES["SEQUENCE"],
+                             "V": mkAsPath(rnd, peer_as, origin, lens) } ] },
+              bgp.PATH_ATTRIBUTES["NEXT_HOP"]: { "V": peer_ip },
+              }
+
+    if rnd.randrange(3) == 0:
+        attrs[bgp.PATH_ATTRIBUTES["MULTI_EXIT_DISCRIMINATOR"]] =\
+            { "V": rnd.randrange(1000) }
+
+    n = choose(rnd, comms)
+    if n:
+        attrs[bgp.PATH_ATTRIBUTES["COMMUNITY"]] =\
+            { "V": map(lambda i, r=rnd, a=peer_as:
+                           (a << 16) | r.randrange(1000), range(n)) }
+
+    if rnd.randrange(20) == 0:
+        attrs[bgp.PATH_ATTRIBUTES["ATOMIC_AGGR"]] = { "V": None }
+        attrs[bgp.PATH_ATTRIBUTES["AGGREGATOR"]]  =\
+            { "V": (origin, rnd.randrange(0x01000000, 0xe0000000)) }
+
+    return bgp.mkPathAttrs(attrs, 0)
+
+#-------------------------------------------------------------------------------
+
+def synthTableDump(count, seed=DEFAULT_SEED):
+
+    ## a TABLE_DUMP (RIB snapshot) record per peer per prefix
+
+    rnd    = random.Random(seed)
+    peers  = mkPeers(rnd)
+    plens  = mkMix(PLEN_MIX)
+    npeers = mkMix(PEERS_MIX)
+    mixes  = (mkMix(ASPATH_MIX), mkMix(COMM_MIX))
+    subtype = bgp.AFI_TYPES["IP"]
+
+    n = 0 ; seqno = 0
+    while n < count:
+        key    = id2key(rnd.randrange(0x01000000, 0xe0000000),
+                        choose(rnd, plens))
+        origin = rnd.randrange(1, 64512)
+
+        for peer in rnd.sample(peers, choose(rnd, npeers)):
+            attrs = mkBgpAttrs(rnd, peer, origin, mixes)
+            body  = struct.pack(">HH LBBLLHH", 0, seqno & 0xffff,
+                                key2id(key), key2plen(key), 1,
+                                BASE_TIME - rnd.randrange(1<<20),
+                                peer[1], peer[0], len(attrs)) + attrs
+            yield mkRecord(BASE_TIME, mrtd.MSG_TYPES["TABLE_DUMP"], subtype,
+                           body)
+            n = n + 1
+            if n >= count:
+                break
+        seqno = seqno + 1
+
+#-------------------------------------------------------------------------------
+
+def synthBgpUpdates(count, seed=DEFAULT_SEED, mrt_type="PROTOCOL_BGP4MP"):
+
+    ## UPDATE messages as recorded by a collector; with PROTOCOL_BGP4PY
+    ## the header carries microseconds as well
+
+    rnd   = random.Random(seed)
+    peers = mkPeers(rnd)
+    plens = mkMix(PLEN_MIX)
+    nlri  = mkMix(NLRI_MIX)
+    mixes = (mkMix(ASPATH_MIX), mkMix(COMM_MIX))
+
+    mrt_type = mrtd.MSG_TYPES[mrt_type]
+    if mrt_type == mrtd.MSG_TYPES["PROTOCOL_BGP4PY"]:
+        subtype = mrtd.BGP4PY_SUBTYPES["MESSAGE"]
+    else:
+        subtype = mrtd.BGP4MP_SUBTYPES["MESSAGE"]
+
+    announced = [ ] # recently announced, to withdraw from
+    ts = BASE_TIME
+    for n in range(count):
+        ts   = ts + rnd.randrange(2)
+        peer = rnd.choice(peers)
+        npfxs = choose(rnd, nlri)
+
+        if announced and rnd.randrange(100) < WITHDRAW_PCT:
+            (unfeasible, attrs, feasible) =\
+                (rnd.sample(announced, min(npfxs, len(announced))), "", ())
+        else:
+            feasible = []
+            for i in range(npfxs):
+                feasible.append(id2key(rnd.randrange(0x01000000, 0xe0000000),
+                                       choose(rnd, plens)))
+            attrs = mkBgpAttrs(rnd, peer, rnd.randrange(1, 64512), mixes)
+            unfeasible = ()
+            announced = (announced + feasible)[-1024:]
+
+        pdu = bgp.mkBgpPdu(bgp.MSG_TYPES["UPDATE"],
+                           bgp.mkUpdates(unfeasible, attrs, feasible)[0])
+
+        hdr = struct.pack(">HHHHLL", peer[0], DST_AS, 0, bgp.AFI_TYPES["IP"],
+                          peer[1], DST_IP)
+        if mrt_type == mrtd.MSG_TYPES["PROTOCOL_BGP4PY"]:
+            hdr = hdr + struct.pack(">L", rnd.randrange(1000000))
+
+        yield mkRecord(ts, mrt_type, subtype, hdr + pdu)
+
+#-------------------------------------------------------------------------------
+
+def mkTlvs(ftype, entries, size):
+
+    ## entries packed into as many TLVs of type ftype as it takes, each
+    ## holding at most 255 octets of entries of at most size octets
+
+    per = 255 / size
+    rv  = []
+    for i in range(0, len(entries), per):
+        v = string.join(entries[i:i+per], '')
+        rv.append(struct.pack("BB", ftype, len(v)) + v)
+    return string.join(rv, '')
+
+def mkLsp(rnd, sysid, seq, level, wide, nbrs, pfxs):
+
+    ## returns the LSP as captured: MAC and LLC headers, ISIS header,
+    ## LSP header and TLVs, with a correct checksum
+
+    F = isis.VLEN_FIELDS
+    tlvs = [ struct.pack("BBB", F["AreaAddress"], len(ISIS_AREA)+1,
+                         len(ISIS_AREA)) + ISIS_AREA,
+             struct.pack("BBB", F["ProtoSupported"], 1, isis.NLPIDS["IP"]),
+             struct.pack(">BBL", F["IPIfAddr"], 4, 0x0a000000L | sysid),
+             ]
+    if rnd.randrange(10):
+        name = "r%d" % sysid
+        tlvs.append(struct.pack("BB", F["DynamicHostname"], len(name)) + name)
+
+    if wide:
+        tlvs.append(struct.pack(">BBL", F["TERouterID"], 4,
+                                0x0a000000L | sysid))
+        tlvs.append(mkTlvs(F["TEIISNeighbor"],
+                           map(lambda (n, m): struct.pack(">7sL", n, m << 8),
+                               nbrs), 11))
+        entries = []
+        for (addr, plen, metric) in pfxs:
+            entries.append(struct.pack(">LB", metric, plen) +
+                           struct.pack(">L", addr)[:(plen+7)/8])
+        tlvs.append(mkTlvs(F["TEIPReach"], entries, 9))
+
+    else:
+        # the narrow IS neighbour TLV starts with a virtual flag octet
+        v = string.join(map(lambda (n, m): struct.pack("4B7s", m & 0x3f,
+                                                       0x80, 0x80, 0x80, n),
+                            nbrs), '')
+        tlvs.append(struct.pack("BBB", F["LSPIISNeighbor"], len(v)+1, 0) + v)
+        tlvs.append(mkTlvs(F["IPIntReach"],
+                           map(lambda (a, l, m): struct.pack(">4BLL", m & 0x3f,
+                                                             0x80, 0x80, 0x80,
+                                                             a, MASKS[l]),
+                               pfxs), 12))
+
+    tlvs    = string.join(tlvs, '')
+    pdu_len = isis.ISIS_HDR_LEN + isis.ISIS_LSP_HDR_LEN + len(tlvs)
+    lsp_id  = struct.pack(">HLBB", 0x1000, sysid, 0, 0)
+
+    lsp = struct.pack(">HH8sLHB", pdu_len, 1200, lsp_id, seq, 0,
+                      ISIS_LSP_BITS) + tlvs
+    cksum = calculate_iso_checksum(lsp[4:], len(lsp)-4, 12)
+    lsp = lsp[:16] + struct.pack(">H", cksum) + lsp[18:]
+
+    msg_type = isis.MSG_TYPES["L%dLSP" % level]
+    dst_mac  = (level == 1) and isis.AllL1ISs or isis.AllL2ISs
+    src_mac  = struct.pack(">HL", 0x0200, sysid)
+
+    return struct.pack(">6s6sH3B", dst_mac, src_mac, 3+pdu_len,
+                       isis.ISIS_LLC_HDR[0], isis.ISIS_LLC_HDR[1],
+                       isis.ISIS_LLC_HDR[2]) +\
+           struct.pack("8B", isis.NLPIDS["ISIS"],
+                       isis.ISIS_HDR_LEN + isis.ISIS_LSP_HDR_LEN, 1, 0,
+                       msg_type, 1, 0, 0) + lsp
+
+def synthLsps(count, seed=DEFAULT_SEED):
+
+    ## PROTOCOL_ISIS2 records of LSPs flooded through a network of
+    ## ISIS_NSYSTEMS systems, each reissued with a higher sequence number
+
+    rnd    = random.Random(seed)
+    levels = mkMix(ISIS_LEVEL_MIX)
+    nnbrs  = mkMix(ISIS_NBRS_MIX)
+    npfxs  = mkMix(ISIS_PFXS_MIX)
+    plens  = mkMix(PLEN_MIX)
+    seqs   = { }
+
+    ts = BASE_TIME
+    for n in range(count):
+        ts     = ts + rnd.randrange(2)
+        sysid  = rnd.randrange(1, ISIS_NSYSTEMS+1)
+        seq    = seqs[sysid] = seqs.get(sysid, 0) + 1
+        level  = choose(rnd, levels)
+        wide   = rnd.randrange(100) < ISIS_WIDE_PCT
+
+        nbrs = []
+        for i in range(choose(rnd, nnbrs)):
+            nbrs.append((struct.pack(">HLB", 0x1000,
+                                     rnd.randrange(1, ISIS_NSYSTEMS+1), 0),
+                         rnd.randrange(1, 64)))
+        pfxs = []
+        for i in range(choose(rnd, npfxs)):
+            plen = choose(rnd, plens)
+            pfxs.append((rnd.randrange(0x01000000, 0xe0000000) & MASKS[plen],
+                         plen, rnd.randrange(1, 64)))
+
+        msg = mkLsp(rnd, sysid, seq, level, wide, nbrs, pfxs)
+        yield mkRecord(ts, mrtd.MSG_TYPES["PROTOCOL_ISIS2"],
+                       isis.MSG_TYPES["L%dLSP" % level],
+                       struct.pack(">L", rnd.randrange(1000000)) + msg)
+
+#-------------------------------------------------------------------------------
+
+def mkLsa(lsa_type, lsid, advrtr, seq, body):
+
+    l   = ospf.OSPF_LSAHDR_LEN + len(body)
+    lsa = struct.pack(ospf.OSPF_LSAHDR, 1, 0x02, lsa_type, lsid, advrtr,
+                      seq, 0, l) + body
+    cksum = calculate_iso_checksum(lsa[2:], l-2, 14)
+    return lsa[:16] + struct.pack(">H", cksum) + lsa[18:]
+
+def synthLsa(rnd, rtrs, mixes):
+
+    (types, nlinks, plens) = mixes
+    lsa_type = choose(rnd, types)
+    advrtr   = rnd.choice(rtrs)
+    seq      = 0x80000001L + rnd.randrange(1000)
+    metric   = rnd.randrange(1, 100)
+
+    plen = choose(rnd, plens)
+    addr = rnd.randrange(0x01000000, 0xe0000000) & MASKS[plen]
+
+    if lsa_type == ospf.LSA_TYPES["ROUTER"]:
+        links = []
+        for i in range(choose(rnd, nlinks)):
+            link_type = rnd.choice((1, 2, 3, 3))
+            links.append(struct.pack(ospf.OSPF_LINK, rnd.choice(rtrs),
+                                     rnd.randrange(1<<32), link_type, 0,
+                                     rnd.randrange(1, 100)))
+        # mostly internal routers, some ASBRs and ABRs (E and B bits)
+        bits = rnd.choice((0, 0, 0, 1, 2, 3))
+        return mkLsa(lsa_type, advrtr, advrtr, seq,
+                     struct.pack(ospf.OSPF_LSARTR, bits, 0, len(links)) +
+                     string.join(links, ''))
+
+    elif lsa_type == ospf.LSA_TYPES["NETWORK"]:
+        attached = rnd.sample(rtrs, rnd.randrange(2, 7))
+        return mkLsa(lsa_type, addr | 1, advrtr, seq,
+                     struct.pack(">L%dL" % len(attached), MASKS[plen],
+                                 *attached))
+
+    elif lsa_type in (ospf.LSA_TYPES["SUMMARY (IP)"],
+                      ospf.LSA_TYPES["SUMMARY (ASBR)"]):
+        if lsa_type == ospf.LSA_TYPES["SUMMARY (ASBR)"]:
+            (addr, plen) = (rnd.choice(rtrs), 32)
+        return mkLsa(lsa_type, addr, advrtr, seq,
+                     struct.pack(">L BBH", MASKS[plen], 0, 0, metric))
+
+    # AS external, mostly type 2 and without a forwarding address
+    fwd = (rnd.randrange(10) == 0) and rnd.randrange(1<<32) or 0
+    return mkLsa(lsa_type, addr, advrtr, seq,
+                 struct.pack(">L BBH LL", MASKS[plen],
+                             (rnd.randrange(4) != 0) << 7, 0, metric,
+                             fwd, 0))
+
+def synthLsUpds(count, seed=DEFAULT_SEED):
+
+    ## PROTOCOL_OSPF2 records of LSUPDs, IP header included, from
+    ## OSPF_NRTRS routers spread across OSPF_AREAS
+
+    rnd    = random.Random(seed)
+    rtrs   = map(lambda i: 0x0a000000L | i, range(1, OSPF_NRTRS+1))
+    nlsas  = mkMix(OSPF_NLSAS_MIX)
+    mixes  = (mkMix(OSPF_LSA_MIX), mkMix(OSPF_LINKS_MIX), mkMix(PLEN_MIX))
+    room   = OSPF_MAX_LEN - ospf.IP_HDR_LEN - ospf.OSPF_HDR_LEN -\
+             ospf.OSPF_LSUPD_LEN
+    dst    = str2id("224.0.0.5")
+
+    ts = BASE_TIME
+    for n in range(count):
+        ts  = ts + rnd.randrange(2)
+        rid = rnd.choice(rtrs)
+        aid = rnd.choice(OSPF_AREAS)
+
+        lsas = [] ; used = 0
+        for i in range(choose(rnd, nlsas)):
+            lsa = synthLsa(rnd, rtrs, mixes)
+            if lsas and used + len(lsa) > room:
+                break
+            lsas.append(lsa)
+            used = used + len(lsa)
+
+        body = struct.pack(ospf.OSPF_LSUPD, len(lsas)) + string.join(lsas, '')
+        olen = ospf.OSPF_HDR_LEN + len(body)
+        msg  = struct.pack(ospf.IP_HDR, 0x45, 0xc0, ospf.IP_HDR_LEN + olen,
+                           n & 0xffff, 0, 1, ospf.IPPROTO_OSPFIGP, 0,
+                           rid, dst) +\
+               struct.pack(ospf.OSPF_HDR, 2, ospf.MSG_TYPES["LSUPD"], olen,
+                           rid, aid, 0, 0, 0, 0) + body
+
+        yield mkRecord(ts, mrtd.MSG_TYPES["PROTOCOL_OSPF2"],
+                       ospf.MSG_TYPES["LSUPD"],
+                       struct.pack(">L", rnd.randrange(1000000)) + msg)
+
+#-------------------------------------------------------------------------------
+
+def synthRecords(workload, count, seed=DEFAULT_SEED):
+
+    if   workload == "table":
+        return synthTableDump(count, seed)
+    elif workload == "bgp4mp":
+        return synthBgpUpdates(count, seed, "PROTOCOL_BGP4MP")
+    elif workload == "bgp4py":
+        return synthBgpUpdates(count, seed, "PROTOCOL_BGP4PY")
+    elif workload == "isis":
+        return synthLsps(count, seed)
+    elif workload == "ospf":
+        return synthLsUpds(count, seed)
+
+    raise ValueError("unknown workload: %s" % workload)
+
+def writeWorkload(file_name, workload, count, seed=DEFAULT_SEED):
+
+    ## returns (records, octets) written
+
+    f = open(file_name, "wb")
+    n = octets = 0
+    for rec in synthRecords(workload, count, seed):
+        f.write(rec)
+        n = n + 1
+        octets = octets + len(rec)
+    f.close()
+
+    return (n, octets)
+
+################################################################################
+
+if __name__ == "__main__":
+
+    workloads = []
+    count     = 10000
+    seed      = DEFAULT_SEED
+    file_pfx  = "synth"
+
+    #---------------------------------------------------------------------------
+
+    def usage():
+
+        print """Usage: %s [ options ]:
+        -h|--help       : Help
+        -q|--quiet      : Be quiet
+
+        -w|--workload   : Workload to generate, one of %s
+                          (may be given more than once) [def: all]
+        -c|--count      : Number of records per workload [def: %d]
+        -s|--seed       : Random seed [def: %d]
+        -f|--file       : Filename prefix for output [def: %s]
+
+        Writes a synthetic MRTD dump <prefix>.<workload>.mrt for each
+        workload; a given count and seed always give the same file.""" %\
+            (os.path.basename(sys.argv[0]), string.join(WORKLOADS, ", "),
+             count, seed, file_pfx)
+        sys.exit(0)
+
+    #---------------------------------------------------------------------------
+
+    VERBOSE = 1
+
+    try:
+        opts, args = getopt.getopt(sys.argv[1:],
+                                   "hqw:c:s:f:",
+                                   ("help", "quiet", "workload=", "count=",
+                                    "seed=", "file=" ))
+    except (getopt.error):
+        usage()
+
+    for (x, y) in opts:
+        if x in ('-h', '--help'):
+            usage()
+
+        elif x in ('-q', '--quiet'):
+            VERBOSE = 0
+
+        elif x in ('-w', '--workload'):
+            if y not in WORKLOADS:
+                usage()
+            workloads.append(y)
+
+        elif x in ('-c', '--count'):
+            count = string.atoi(y)
+
+        elif x in ('-s', '--seed'):
+            seed = string.atoi(y)
+
+        elif x in ('-f', '--file'):
+            file_pfx = y
+
+        else:
+            usage()
+
+    #---------------------------------------------------------------------------
+
+    for workload in (workloads or WORKLOADS):
+        file_name = "%s.%s.mrt" % (file_pfx, workload)
+        (n, octets) = writeWorkload(file_name, workload, count, seed)
+        if VERBOSE > 0:
+            print "%s: %d records, %d octets" % (file_name, n, octets)
+
+    sys.exit(0)
+
+################################################################################
+################################################################################
@@ -24,7 +24,13 @@
 # $Id: mutils.py,v 1.11 2002/02/26 01:57:03 mort Exp $
 #
 
-import string, struct, sys
+import string, struct, sys, time, heapq
+from socket import inet_ntoa, inet_aton
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
 
 #-------------------------------------------------------------------------------
 
@@ -35,8 +41,72 @@ def error(message):
 
 ################################################################################
 
+# Least recently used cache of up to size results of func, keyed by its
+# (hashable) arguments.  Entries are [ prev, next, args, result ] links
+# in a circular list, most recent last, so that a hit costs a dict
+# lookup and a few pointer swaps and a miss when full reuses the
+# oldest entry.
+
+LRU_SIZE = 1<<16
+
+class Lru:
+
+    def __init__(self, func, size=LRU_SIZE):
+
+        self._func  = func
+        self._size  = size
+        self._cache = { }
+        self._root  = [ None, None, None, None ]
+        self._root[0] = self._root[1] = self._root
+
+        self._hits   = 0
+        self._misses = 0
+
+    def __repr__(self):
+
+        return "LRU cache of %s: %d/%d entries, %d hits, %d misses" %\
+               (self._func.__name__, len(self._cache), self._size,
+                self._hits, self._misses)
+
+    def __call__(self, *args):
+
+        root = self._root
+        link = self._cache.get(args)
+        if link is not None:
+            (prev, next, _, rv) = link
+            prev[1] = next
+            next[0] = prev
+            last    = root[0]
+            last[1] = root[0] = link
+            link[0] = last
+            link[1] = root
+            self._hits = self._hits + 1
+            return rv
+
+        rv = self._func(*args)
+        self._misses = self._misses + 1
+        if len(self._cache) >= self._size:
+            oldest = root[1]
+            del self._cache[oldest[2]]
+            root[1] = oldest[1]
+            oldest[1][0] = root
+
+        last = root[0]
+        last[1] = root[0] = self._cache[args] = [ last, root, args, rv ]
+        return rv
+
+    def clear(self):
+
+        self._cache = { }
+        self._root[0] = self._root[1] = self._root
+
+################################################################################
+
 def mask2plen(mask):
 
+    if mask == 0:
+        return 0
+
     rv = 32
     while mask % 2 == 0:
         rv = rv - 1
@@ -50,23 +120,25 @@ def plen2mask(plen):
 
     return pow(2L, 32) - pow(2L, 32-plen)
 
+MASKS = map(plen2mask, range(33))
+
 #-------------------------------------------------------------------------------
 
+def _pfx2id(pfx, plen):
+
+    # pfx is the significant octets only; pad to a whole address
+    (p, ) = struct.unpack(">L", (pfx + '\000\000\000\000')[:4])
+    return p & MASKS[plen]
+
+_pfx2id = Lru(_pfx2id)
+
 def pfx2id(pfx, plen=None):
 
     if plen == None:
         plen = pfx[1]
         pfx  = pfx[0]
 
-    mask = plen2mask(plen)
-    p    = 0
-    for i in range(len(pfx)):
-        p = p << 8
-        p = p | ord(pfx[i])
-    p = p << (8 * (4-len(pfx)))
-    p = p & mask
-
-    return p
+    return _pfx2id(pfx, int(plen))
 
 #-------------------------------------------------------------------------------
 
@@ -79,56 +151,93 @@ def addrmask2str(addr, mask):
 
 #-------------------------------------------------------------------------------
 
+def _pfx2str(pfx, plen):
+
+    (p, ) = struct.unpack(">L", (pfx + '\000\000\000\000')[:4])
+    return "%s/%d" % (inet_ntoa(struct.pack(">L", p & MASKS[plen])), plen)
+
+_pfx2str = Lru(_pfx2str)
+
 def pfx2str(pfx, plen=None):
 
     if plen == None:
-        plen = int(pfx[1])
+        plen = pfx[1]
         pfx  = pfx[0]
 
-    mask = plen2mask(plen)
-    p = 0
-    for i in range(len(pfx)):
-        p = p << 8
-        p = p | ord(pfx[i])
-    p = p << (8 * (4-len(pfx)))
-    p = p & mask
-
-    return "%s/%d" % (id2str(p), plen)
+    return _pfx2str(pfx, int(plen))
 
 #-------------------------------------------------------------------------------
 
+def _rpfx2str(plen, pfx):
+
+    return "%s/%d" % (inet_ntoa((pfx + '\000\000\000\000')[:4]), plen)
+
+_rpfx2str = Lru(_rpfx2str)
+
 def rpfx2str(pfxtup):
 
     plen, pfx = pfxtup
 
-    p = 0
-    for i in range(len(pfx)):
-        p = p << 8
-        p = p | ord(pfx[i])
-    p = p << (8 * (4-len(pfx)))
+    return _rpfx2str(plen, pfx)
+
+#-------------------------------------------------------------------------------
+
+# Packed prefix keys: a prefix as one integer, (address << 8) | length,
+# the address masked to the length.  Unlike (octets, length) pairs they
+# are canonical, whatever number of octets the prefix came in, and are
+# small and quick to hash and compare; sorted, they are in address
+# order with covering prefixes first.
+
+def id2key(id, plen):
+
+    return ((id & MASKS[plen]) << 8) | plen
+
+def pfx2key(pfx, plen=None):
 
-    return "%s/%d" % (id2str(p), plen)
+    ## from (significant octets, length), as pfx2id()
+
+    if plen == None:
+        plen = pfx[1]
+        pfx  = pfx[0]
+
+    plen = int(plen)
+    return (_pfx2id(pfx, plen) << 8) | plen
+
+def key2id(key):
+
+    return key >> 8
+
+def key2plen(key):
+
+    return int(key & 0xff)
+
+def key2pfx(key):
+
+    ## (significant octets, length), as on the wire
+
+    plen = int(key & 0xff)
+    return (struct.pack('>L', key >> 8)[:(plen+7)/8], plen)
+
+def key2str(key):
+
+    return "%s/%d" % (inet_ntoa(struct.pack('>L', key >> 8)), key & 0xff)
+
+def str2key(strng):
+
+    (addr, plen) = string.split(strng, '/')
+    return id2key(str2id(addr), int(plen))
 
 #-------------------------------------------------------------------------------
 
 def id2pfx(id):
 
-    a = int( ((id & 0xff000000L) >> 24) & 0xff)
-    b = int( ((id & 0x00ff0000)  >> 16) & 0xff)
-    c = int( ((id & 0x0000ff00)  >>  8) & 0xff)
-    d = int( ((id & 0x000000ff))        & 0xff)
-
-    return struct.pack('4B', a, b, c, d)
+    return struct.pack('>L', id & 0xffffffffL)
 
 #-------------------------------------------------------------------------------
 
 def id2str(id):
 
-    return "%d.%d.%d.%d" %\
-           (int( ((id & 0xff000000L) >> 24) & 0xff),
-            int( ((id & 0x00ff0000)  >> 16) & 0xff),
-            int( ((id & 0x0000ff00)  >>  8) & 0xff),
-            int( (id  & 0x000000ff)         & 0xff) )
+    return inet_ntoa(struct.pack('>L', id & 0xffffffffL))
 
 #-------------------------------------------------------------------------------
 
@@ -163,35 +272,205 @@ def isid2id(str):
 
     return str2id(str)
 
+#-------------------------------------------------------------------------------
+
+# Batch versions of the above, for dumping or loading many addresses at
+# once.  Addresses and prefix lengths may be given as lists (or other
+# sequences) of integers, or as NumPy arrays; the conversion to and
+# from network order is done for the whole batch in one go (by struct,
+# or by NumPy if the input is an array), leaving only inet_ntoa() or
+# inet_aton() per address.
+
+def _packIds(ids):
+
+    if numpy is not None and isinstance(ids, numpy.ndarray):
+        return ids.astype('>u4').tostring()
+    return struct.pack(">%dL" % len(ids), *ids)
+
+def _unpackIds(buf, asarray):
+
+    if asarray and numpy is not None:
+        return numpy.frombuffer(buf, '>u4').astype(numpy.uint32)
+    return list(struct.unpack(">%dL" % (len(buf)/4), buf))
+
+def _maskIds(ids, plens):
+
+    ## ids masked by their prefix lengths
+
+    if numpy is not None and isinstance(ids, numpy.ndarray):
+        shifts = 32 - numpy.asarray(plens, numpy.uint64)
+        masks  = (numpy.uint64(0xffffffffL) << shifts) & 0xffffffffL
+        return (ids.astype(numpy.uint64) & masks).astype(numpy.uint32)
+    return map(lambda id, plen: id & MASKS[plen], ids, plens)
+
+def ids2strs(ids):
+
+    buf = _packIds(ids)
+    return [ inet_ntoa(buf[i:i+4]) for i in xrange(0, len(buf), 4) ]
+
+def pfxs2strs(ids, plens):
+
+    ## "a.b.c.d/len" for each (ids[i], plens[i]), masking the address
+
+    strs = ids2strs(_maskIds(ids, plens))
+    if numpy is not None and isinstance(plens, numpy.ndarray):
+        plens = plens.tolist()
+    return map(lambda s, plen: "%s/%d" % (s, plen), strs, plens)
+
+def strs2ids(strs, asarray=0):
+
+    ## integer addresses for dotted quads; a NumPy uint32 array if
+    ## asarray and NumPy is available, else a list
+
+    return _unpackIds(string.join(map(inet_aton, strs), ''), asarray)
+
+def strs2pfxs(strs, asarray=0):
+
+    ## (addresses, prefix lengths) for "a.b.c.d/len" strings, the
+    ## addresses masked
+
+    addrs = [ ] ; plens = [ ]
+    for s in strs:
+        (a, p) = string.split(s, '/')
+        addrs.append(a)
+        plens.append(int(p))
+
+    ids = strs2ids(addrs, asarray)
+    if asarray and numpy is not None:
+        plens = numpy.array(plens, numpy.uint8)
+    return (_maskIds(ids, plens), plens)
+
+def ids2keys(ids, plens):
+
+    ## packed prefix keys for (ids[i], plens[i]); a NumPy uint64 array
+    ## if ids is an array, else a list
+
+    ids = _maskIds(ids, plens)
+    if numpy is not None and isinstance(ids, numpy.ndarray):
+        return (ids.astype(numpy.uint64) << 8) |\
+               numpy.asarray(plens, numpy.uint64)
+    return map(lambda id, plen: (id << 8) | plen, ids, plens)
+
+def keys2strs(keys):
+
+    ## "a.b.c.d/len" for each packed prefix key
+
+    if numpy is not None and isinstance(keys, numpy.ndarray):
+        keys  = keys.astype(numpy.uint64)
+        plens = (keys & 0xff).tolist()
+        strs  = ids2strs((keys >> 8).astype(numpy.uint32))
+    else:
+        plens = map(lambda key: key & 0xff, keys)
+        strs  = ids2strs(map(lambda key: key >> 8, keys))
+    return map(lambda s, plen: "%s/%d" % (s, plen), strs, plens)
+
+def pfxs2keys(pfxs, asarray=0):
+
+    ## packed prefix keys for (significant octets, length) prefixes
+
+    ids   = pfxs2ids(pfxs, asarray)
+    plens = map(lambda (pfx, plen): int(plen), pfxs)
+    return ids2keys(ids, plens)
+
+def pfxs2ids(pfxs, asarray=0):
+
+    ## integer addresses for (significant octets, prefix length)
+    ## prefixes, as pfx2id()
+
+    buf = string.join(map(lambda (pfx, plen): (pfx + '\000\000\000\000')[:4],
+                          pfxs), '')
+    plens = map(lambda (pfx, plen): int(plen), pfxs)
+    ids   = _unpackIds(buf, asarray)
+    if asarray and numpy is not None:
+        plens = numpy.array(plens, numpy.uint8)
+    return _maskIds(ids, plens)
+
 ################################################################################
 
+# Hex and binary dumps.  Octets are converted by table lookup, and
+# prthex()/prtbin() return a Dump, which only renders (once) when it is
+# turned into a string -- printed, formatted with %s, or added to a
+# string -- so that a dump built and then never shown costs next to
+# nothing.
+
+HEX_OCTETS = map(lambda i: '%0.2x' % i, range(256))
+BIN_OCTETS = map(lambda i: string.join(map(lambda j, i=i: `(i >> j) & 1`,
+                                           range(7, -1, -1)), ''),
+                 range(256))
+BIN_OCTETS_DOT = map(lambda b: b + '.', BIN_OCTETS)
+
+class Dump:
+
+    def __init__(self, render, pfx, data):
+
+        # a snapshot, since buffers may be changed before rendering
+        if isinstance(data, memoryview):
+            data = data.tobytes()
+        elif isinstance(data, bytearray):
+            data = str(data)
+
+        self._render = render
+        self._pfx    = pfx
+        self._data   = data
+        self._str    = None
+
+    def __str__(self):
+
+        if self._str == None:
+            self._str = self._render(self._pfx, self._data)
+        return self._str
+
+    def __repr__(self):
+
+        return `str(self)`
+
+    def __add__(self, other):
+
+        return str(self) + other
+
+    def __radd__(self, other):
+
+        return other + str(self)
+
+    def __len__(self):
+
+        return len(str(self))
+
+    def __nonzero__(self):
+
+        return self._data != None and len(self._data) > 0
+
+#-------------------------------------------------------------------------------
+
 def str2hex(str):
 
     if str == None or str == "":
         return ""
 
-    ret = map(lambda x: '%0.2x' % x, map(ord, str))
-    ret = string.join(ret, '.')
-
-    return ret
+    return string.join(map(HEX_OCTETS.__getitem__, bytearray(str)), '.')
 
 #-------------------------------------------------------------------------------
 
 def str2int(string):
 
-    return reduce(lambda x, y: 255*x + y, map(ord, string), 0L)
+    return reduce(lambda x, y: 256*x + y, map(ord, string), 0L)
 
 #-------------------------------------------------------------------------------
 
-def prthex(pfx, str):
+def _prthex(pfx, str):
 
     if str == None or str == "":
         return ""
 
-    ret = ""
-    for i in range(0, len(str), 16):
-        ret = ret + '\n' + pfx + '0x' + str2hex(str[i:i+16])
-    return ret
+    octs = map(HEX_OCTETS.__getitem__, bytearray(str))
+    pfx  = '\n' + pfx + '0x'
+    return string.join(map(lambda i, octs=octs, pfx=pfx:
+                           pfx + string.join(octs[i:i+16], '.'),
+                           range(0, len(octs), 16)), '')
+
+def prthex(pfx, str):
+
+    return Dump(_prthex, pfx, str)
 
 #-------------------------------------------------------------------------------
 
@@ -213,29 +492,24 @@ def str2bin(str):
     if str == None or str == "":
         return ""
 
-    ret = ""
-    for i in range(len(str)):
-        s = ""
-        n = ord(str[i])
-        for j in range(7, -1, -1):
-            b = n / (2**j)
-            n = n % (2**j)
-            s = s + `b`
-        ret = ret + ("%s." % s)
-
-    return ret
+    return string.join(map(BIN_OCTETS_DOT.__getitem__, bytearray(str)), '')
 
 #-------------------------------------------------------------------------------
 
-def prtbin(pfx, str):
+def _prtbin(pfx, str):
 
     if str == None or str == "":
         return ""
 
-    ret = ""
-    for i in range(0, len(str), 8):
-        ret = ret + '\n' + pfx + str2bin(str[i:i+8])
-    return ret
+    octs = map(BIN_OCTETS_DOT.__getitem__, bytearray(str))
+    pfx  = '\n' + pfx
+    return string.join(map(lambda i, octs=octs, pfx=pfx:
+                           pfx + string.join(octs[i:i+8], ''),
+                           range(0, len(octs), 8)), '')
+
+def prtbin(pfx, str):
+
+    return Dump(_prtbin, pfx, str)
 
 ################################################################################
 
@@ -271,5 +545,71 @@ def int2hex(i):
 
     return ret[:-1]
 
+################################################################################
+
+# Timers are kept on a heap ordered by expiry time, so finding the next
+# one due and scheduling another are both O(log n), however many there
+# are.  Cancelling is lazy: the entry is marked dead and discarded when
+# it reaches the top.  Callbacks get the arguments given to schedule()
+# followed by those given to run().
+
+class Timers:
+
+    def __init__(self):
+
+        self._heap = [ ]
+        self._seq  = 0 # breaks ties, so callbacks are never compared
+
+    def __repr__(self):
+
+        return "timers: %d pending, next: %s" % (len(self._heap), self.next())
+
+    def __len__(self):
+
+        return len(self._heap)
+
+    def schedule(self, when, func, args=()):
+
+        ## returns the timer, for cancel()
+
+        self._seq = self._seq + 1
+        timer = [ when, self._seq, func, args ]
+        heapq.heappush(self._heap, timer)
+        return timer
+
+    def cancel(self, timer):
+
+        if timer:
+            timer[2] = None
+
+    def next(self):
+
+        ## time the earliest live timer is due, or None
+
+        heap = self._heap
+        while heap and heap[0][2] == None:
+            heapq.heappop(heap)
+        if heap:
+            return heap[0][0]
+        return None
+
+    def run(self, now=None, *extra):
+
+        ## fires everything due by now; returns how many fired
+
+        if now == None:
+            now = time.time()
+
+        heap = self._heap
+        cnt  = 0
+        while heap and heap[0][0] <= now:
+            (when, seq, func, args) = heapq.heappop(heap)
+            if func == None:
+                continue
+            func(*(args + extra))
+            cnt = cnt + 1
+
+        return cnt
+
 ################################################################################
 ################################################################################
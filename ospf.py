@@ -65,7 +65,9 @@
 #    prefix outside area, type 4 report cost to ASBR
 
 import struct, socket, sys, math, getopt, string, os.path, time, select, traceback
+import fcntl
 from mutils import *
+from isis_extra import check_cksums, getifaddrs, attach_filter, OSPF_FILTER
 
 #-------------------------------------------------------------------------------
 
@@ -74,9 +76,21 @@ VERSION         = "2.9"
 
 RECV_BUF_SZ      = 8192
 OSPF_LISTEN_PORT = 89
+IPPROTO_OSPFIGP  = 89
+
+SO_BINDTODEVICE  = 25     # Linux; not exported by the socket module
+SIOCGIFINDEX     = 0x8933
+IP_MREQN         = "4s4si" # struct ip_mreqn: group, address, ifindex
 LS_INFINITY      = 0xffff
 LS_STUB_RTR      = 0xffffff
 
+MAX_AGE          = 3600   # RFC 2328 appendix B
+MAX_AGE_DIFF     = 900
+MAX_AGE_HOLD     = 60     # how long flushed LSAs are kept before removal
+DO_NOT_AGE       = 0x8000 # RFC 1793
+
+AS_SCOPE         = None   # "area" of the LSDB holding AS scoped LSAs
+
 IP_HDR     = "> BBH HH BBH LL"
 IP_HDR_LEN = struct.calcsize(IP_HDR)
 
@@ -119,6 +133,9 @@ OSPF_LSAEXT_LEN = struct.calcsize(OSPF_LSAEXT)
 OSPF_LSAEXT_METRIC     = "> BBH L L"
 OSPF_LSAEXT_METRIC_LEN = struct.calcsize(OSPF_LSAEXT_METRIC)
 
+OSPF_TLV     = "> HH"
+OSPF_TLV_LEN = struct.calcsize(OSPF_TLV)
+
 ################################################################################
 
 DLIST = []
@@ -188,6 +205,8 @@ TE_LINK_SUBTYPES = { 1L: "TYPE",
                      }
 DLIST += [TE_LINK_SUBTYPES]
 
+# a decoded TE link is a tuple of its sub-TLV values (None if absent)
+# indexed by subtype-1, ie. in TE_LINK_SUBTYPES order
 TE_LINK_SUBTYPE_LS = { 1L: 1,
                        2L: 4,
                        3L: 4,
@@ -229,6 +248,8 @@ for d in DLIST:
     for k in d.keys():
         d[ d[k] ] = k
 
+AS_SCOPED_LSAS = (LSA_TYPES["EXTERNAL AS"], LSA_TYPES["OPAQUE AS LOCAL"])
+
 ################################################################################
 
 def parseIpHdr(msg, verbose=1, level=0):
@@ -471,38 +492,159 @@ def parseOspfLsaExt(lsa, verbose=1, level=0):
              "METRICS": metrics,
              }
 
+def parseOspfTeLink(tlv, verbose=1, level=0):
+
+    link = [ None ] * len(TE_LINK_SUBTYPE_LS)
+
+    off = 0
+    while off + OSPF_TLV_LEN <= len(tlv):
+        (st, l) = struct.unpack_from(OSPF_TLV, tlv, off)
+        v   = tlv[off+OSPF_TLV_LEN:off+OSPF_TLV_LEN+l]
+        off = off + OSPF_TLV_LEN + ((l+3) & ~3)
+
+        vl = TE_LINK_SUBTYPE_LS.get(st)
+        if vl == None or len(v) != l or l < vl or l % vl:
+            if verbose > 0:
+                print level*INDENT + "*** bad/unknown sub-TLV %d, len:%d ***" % (st, l)
+            continue
+
+        if st == TE_LINK_SUBTYPES["TYPE"]:
+            val = ord(v[0])
+            vstr = RTR_LINK_TYPE.get(val, val)
+        elif st in (TE_LINK_SUBTYPES["LOCAL IF"], TE_LINK_SUBTYPES["REMOTE IF"]):
+            val = struct.unpack(">%dL" % (l/4), v)
+            vstr = string.join(map(id2str, val), ", ")
+        elif st == TE_LINK_SUBTYPES["UNRSVD BW"]:
+            val = struct.unpack(">8f", v)
+            vstr = string.join(map(lambda bw: "%.0f" % (bw*8), val), ", ")
+        elif st in (TE_LINK_SUBTYPES["MAX BW"], TE_LINK_SUBTYPES["MAX RSVBL BW"]):
+            (val, ) = struct.unpack(">f", v)
+            vstr = "%.0f" % (val*8)
+        else:
+            (val, ) = struct.unpack(">L", v)
+            if st == TE_LINK_SUBTYPES["ID"]: vstr = id2str(val)
+            elif st == TE_LINK_SUBTYPES["ADMIN GROUP"]: vstr = "0x%.8x" % val
+            else: vstr = `val`
+
+        if verbose > 0:
+            print level*INDENT + "%s: %s" % (TE_LINK_SUBTYPES[st], vstr)
+        link[st-1] = val
+
+    return tuple(link)
+
+def parseOspfLsaTe(lsa, verbose=1, level=0):
+
+    ## RFC 3630: one top level TLV, a router address or a link;
+    ## bandwidths are in bytes/s, printed in bits/s
+
+    rv = { "RTR ADDR" : None,
+           "LINKS"    : [],
+           }
+
+    off = 0
+    while off + OSPF_TLV_LEN <= len(lsa):
+        (t, l) = struct.unpack_from(OSPF_TLV, lsa, off)
+        v   = lsa[off+OSPF_TLV_LEN:off+OSPF_TLV_LEN+l]
+        off = off + OSPF_TLV_LEN + ((l+3) & ~3)
+
+        if t == TE_TLV_TS["ROUTER ADDRESS"] and l == TE_TLV_LS[t]:
+            (rv["RTR ADDR"], ) = struct.unpack(">L", v)
+            if verbose > 0:
+                print level*INDENT + "router address:%s" % id2str(rv["RTR ADDR"])
+
+        elif t == TE_TLV_TS["LINK"]:
+            if verbose > 0: print level*INDENT + "link:"
+            rv["LINKS"].append(parseOspfTeLink(v, verbose, level+1))
+
+        elif verbose > 0:
+            print level*INDENT + "*** bad/unknown TLV %d, len:%d ***" % (t, l)
+
+    return rv
+
+def parseOspfLsaOpaque(t, lsid, lsa, verbose=1, level=0):
+
+    ## RFC 5250: the LSID is the opaque type and an opaque ID; only TE
+    ## (area scoped) is decoded, anything else is kept raw
+
+    otype = lsid >> 24
+    oid   = lsid & 0xffffff
+    if verbose > 0:
+        print level*INDENT + "opaque type:%s, id:%d" %\
+              (OPAQUE_TYPES.get(otype, otype), oid)
+
+    if t == LSA_TYPES["OPAQUE AREA LOCAL"] and\
+       otype == OPAQUE_TYPES["TRAFFIC ENGINEERING"]:
+        v = parseOspfLsaTe(lsa, verbose, level)
+    else:
+        if verbose > 1: print prtbin(level*INDENT, lsa)
+        v = lsa
+
+    return { "OTYPE" : otype,
+             "OID"   : oid,
+             "V"     : v,
+             }
+
 def parseOspfLsas(lsas, verbose=1, level=0):
 
+    ## LSAs with a bad checksum are returned with CKSUM_OK false and
+    ## their bodies undecoded
+
+    # find every LSA from the headers, then check all their Fletcher
+    # checksums (over all but the age, as for ISIS LSPs) in one go
+    hdrs = [] ; off = 0
+    while off + OSPF_LSAHDR_LEN <= len(lsas):
+        (cksum, l) = struct.unpack_from(">HH", lsas, off+16)
+        hdrs.append((off, l, cksum))
+        if l < OSPF_LSAHDR_LEN:
+            break
+        off = off + l
+
+    cksms = check_cksums(map(lambda (off, l, cksum), lsas=lsas:
+                             (lsas, off+2, l-2, cksum, off+16), hdrs))
+
     rv = {}
 
     cnt = 0
-    while len(lsas) > 0:
+    for (off, l, cksum) in hdrs:
         cnt += 1
         rv[cnt] = {}
 
         if verbose > 0: print level*INDENT + "LSA %s" % cnt
-        rv[cnt]["H"] = parseOspfLsaHdr(lsas[:OSPF_LSAHDR_LEN], verbose, level+1)
+        rv[cnt]["H"] = parseOspfLsaHdr(lsas[off:off+OSPF_LSAHDR_LEN], verbose, level+1)
         t = rv[cnt]["H"]["T"]
-        l = rv[cnt]["H"]["L"]
         rv[cnt]["T"] = t
         rv[cnt]["L"] = l
 
+        cksm_ok, cksm_msg = cksms[cnt-1]
+        rv[cnt]["CKSUM_OK"] = cksm_ok
+        if verbose > 0:
+            print (level+1)*INDENT + "cksum: %s" % cksm_msg
+
+        if not cksm_ok:
+            rv[cnt]["V"] = None
+            continue
+
+        lsa = lsas[off+OSPF_LSAHDR_LEN:off+l]
         if t == LSA_TYPES["ROUTER"]:
-            rv[cnt]["V"] = parseOspfLsaRtr(lsas[OSPF_LSAHDR_LEN:l], verbose, level+1)
+            rv[cnt]["V"] = parseOspfLsaRtr(lsa, verbose, level+1)
         elif t == LSA_TYPES["NETWORK"]:
-            rv[cnt]["V"] = parseOspfLsaNet(lsas[OSPF_LSAHDR_LEN:l], verbose, level+1)
+            rv[cnt]["V"] = parseOspfLsaNet(lsa, verbose, level+1)
         elif t == LSA_TYPES["SUMMARY (IP)"]:
-            rv[cnt]["V"] = parseOspfLsaSummary(lsas[OSPF_LSAHDR_LEN:l], verbose, level+1)
+            rv[cnt]["V"] = parseOspfLsaSummary(lsa, verbose, level+1)
         elif t == LSA_TYPES["SUMMARY (ASBR)"]:
-            rv[cnt]["V"] = parseOspfLsaSummary(lsas[OSPF_LSAHDR_LEN:l], verbose, level+1)
+            rv[cnt]["V"] = parseOspfLsaSummary(lsa, verbose, level+1)
         elif t == LSA_TYPES["EXTERNAL AS"]:
-            rv[cnt]["V"] = parseOspfLsaExt(lsas[OSPF_LSAHDR_LEN:l], verbose, level+1)
+            rv[cnt]["V"] = parseOspfLsaExt(lsa, verbose, level+1)
+        elif t in (LSA_TYPES["OPAQUE LINK LOCAL"],
+                   LSA_TYPES["OPAQUE AREA LOCAL"],
+                   LSA_TYPES["OPAQUE AS LOCAL"]):
+            rv[cnt]["V"] = parseOspfLsaOpaque(t, rv[cnt]["H"]["LSID"], lsa,
+                                              verbose, level+1)
 
         else:
             error("[ *** unknown LSA type %d*** ]\n" % (t, ))
-            error("%s\n" % prtbin(level*INDENT, msg))
-
-        lsas = lsas[l:]
+            error("%s\n" % prtbin(level*INDENT, lsa))
+            rv[cnt]["V"] = None
 
     return rv
 
@@ -617,6 +759,247 @@ def parseOspfMsg(msg, verbose=1, level=0):
 
     return rv
 
+def seqNo(lsseqno):
+
+    ## LS sequence numbers are signed (RFC 2328 12.1.6)
+
+    if lsseqno & 0x80000000L:
+        return lsseqno - 0x100000000L
+    return lsseqno
+
+def lsaKeyStr(key):
+
+    (t, lsid, advrtr) = key
+    return "%s %s/%s" % (LSA_TYPES.get(t, `t`), id2str(lsid), id2str(advrtr))
+
+################################################################################
+
+# Installed LSA instances keep their header fields, the age they had
+# when received (so their current age needs no updating), and the
+# parsed body.
+
+class Lsa(object):
+
+    __slots__ = ("_age", "_rcvd", "_seq_no", "_cksm", "_opts", "_len", "_v")
+
+    def __init__(self, hdr, v, rcvd):
+
+        self._age    = hdr["AGE"]
+        self._rcvd   = rcvd
+        self._seq_no = seqNo(hdr["LSSEQNO"])
+        self._cksm   = hdr["CKSUM"]
+        self._opts   = hdr["OPTS"]
+        self._len    = hdr["L"]
+        self._v      = v
+
+    def __repr__(self):
+
+        return "age: %d, seq.no: %#x, cksm: %#.4x, len: %d" %\
+               (self.age(time.time()), self._seq_no & 0xffffffffL,
+                self._cksm, self._len)
+
+    def age(self, now):
+
+        if self._age & DO_NOT_AGE:
+            return min(self._age & ~DO_NOT_AGE, MAX_AGE)
+        return min(self._age + int(now - self._rcvd), MAX_AGE)
+
+    def expiry(self):
+
+        ## when this LSA next needs aging: when it reaches MaxAge, or if
+        ## already there, when it should be forgotten; None if it
+        ## doesn't age
+
+        if self._age == MAX_AGE:
+            return self._rcvd + MAX_AGE_HOLD
+        if self._age & DO_NOT_AGE:
+            return None
+        return self._rcvd + MAX_AGE - self._age
+
+#-------------------------------------------------------------------------------
+
+# One LSDB is kept per area, plus one (area AS_SCOPE) for the AS scoped
+# external and opaque LSAs; each holds the newest instance of each LSA
+# by (type, LSID, advertising router), and an index by type.
+
+class Lsdb:
+
+    def __init__(self, area):
+
+        self._area  = area
+        self._lsas  = { } # (type, lsid, advrtr) -> Lsa
+        self._types = { } # type -> { key -> Lsa }
+
+        self._stats = { "INSTALLED": 0,
+                        "NOT_NEWER": 0,
+                        "NOT_HELD":  0,
+                        "BAD_CKSM":  0,
+                        "EXPIRED":   0,
+                        "REMOVED":   0,
+                        }
+
+    def __repr__(self):
+
+        if self._area == AS_SCOPE:
+            scope = "AS"
+        else:
+            scope = "area %s" % id2str(self._area)
+
+        return "%s LSDB: %d LSAs, stats: %s" %\
+               (scope, len(self._lsas), `self._stats`)
+
+    #---------------------------------------------------------------------------
+
+    def isNewer(self, hdr, old, now):
+
+        ## RFC 2328 13.1: higher sequence number, then higher checksum,
+        ## then MaxAge, then a much younger age wins
+
+        seq_no = seqNo(hdr["LSSEQNO"])
+        if seq_no != old._seq_no:
+            return seq_no > old._seq_no
+
+        if hdr["CKSUM"] != old._cksm:
+            return hdr["CKSUM"] > old._cksm
+
+        age     = min(hdr["AGE"] & ~DO_NOT_AGE, MAX_AGE)
+        old_age = old.age(now)
+        if (age == MAX_AGE) != (old_age == MAX_AGE):
+            return age == MAX_AGE
+
+        if abs(age - old_age) > MAX_AGE_DIFF:
+            return age < old_age
+
+        return 0
+
+    def update(self, rv, now=None):
+
+        ## rv is an LSA as returned by parseOspfLsas(); returns its key
+        ## if it was installed, else None
+
+        if now == None:
+            now = time.time()
+
+        if not rv.get("CKSUM_OK", 1):
+            self._stats["BAD_CKSM"] = self._stats["BAD_CKSM"] + 1
+            return None
+
+        hdr = rv["H"]
+        key = (hdr["T"], hdr["LSID"], hdr["ADVRTR"])
+        old = self._lsas.get(key)
+        if old:
+            if not self.isNewer(hdr, old, now):
+                self._stats["NOT_NEWER"] = self._stats["NOT_NEWER"] + 1
+                return None
+
+        elif hdr["AGE"] & ~DO_NOT_AGE >= MAX_AGE:
+            # RFC 2328 13 (4): a flush for something we don't hold
+            self._stats["NOT_HELD"] = self._stats["NOT_HELD"] + 1
+            return None
+
+        lsa = Lsa(hdr, rv.get("V"), now)
+        if lsa._age & ~DO_NOT_AGE >= MAX_AGE:
+            lsa._age = MAX_AGE
+
+        self._lsas[key] = lsa
+        if not self._types.has_key(key[0]):
+            self._types[key[0]] = { }
+        self._types[key[0]][key] = lsa
+
+        self._stats["INSTALLED"] = self._stats["INSTALLED"] + 1
+        return key
+
+    def remove(self, key):
+
+        del self._lsas[key]
+        del self._types[key[0]][key]
+
+    def age(self, key, lsa, now=None):
+
+        ## called when lsa, installed as key, reaches its expiry(); an
+        ## LSA reaching MaxAge is kept for MAX_AGE_HOLD and then
+        ## removed.  Returns lsa if it needs aging again, else None
+
+        if now == None:
+            now = time.time()
+
+        if self._lsas.get(key) is not lsa:
+            return None # since replaced
+
+        if lsa._age == MAX_AGE:
+            self.remove(key)
+            self._stats["REMOVED"] = self._stats["REMOVED"] + 1
+            return None
+
+        lsa._age  = MAX_AGE
+        lsa._rcvd = now
+        self._stats["EXPIRED"] = self._stats["EXPIRED"] + 1
+        return lsa
+
+    #---------------------------------------------------------------------------
+
+    def get(self, key):
+
+        return self._lsas.get(key)
+
+    def keys(self):
+
+        return self._lsas.keys()
+
+    def lsas(self, t):
+
+        ## the installed LSAs of type t, as { key -> Lsa }
+
+        return self._types.get(t, { })
+
+    def teLinks(self):
+
+        ## the links in the area's TE LSAs, as { (advertising router,
+        ## link ID, first local address): link tuple }
+
+        rv = { }
+        for ((t, lsid, advrtr), lsa) in\
+                self.lsas(LSA_TYPES["OPAQUE AREA LOCAL"]).items():
+            if lsa._age == MAX_AGE or not lsa._v or\
+               lsa._v["OTYPE"] != OPAQUE_TYPES["TRAFFIC ENGINEERING"]:
+                continue
+
+            for link in lsa._v["V"]["LINKS"]:
+                local = link[TE_LINK_SUBTYPES["LOCAL IF"]-1]
+                if local:
+                    local = local[0]
+                rv[(advrtr, link[TE_LINK_SUBTYPES["ID"]-1], local)] = link
+
+        return rv
+
+#-------------------------------------------------------------------------------
+
+def updateLsdbs(lsdbs, rv, now=None):
+
+    ## installs the LSAs in LSUPD rv (as returned by parseOspfMsg()) in
+    ## lsdbs, { area -> Lsdb }, creating LSDBs as needed; returns the
+    ## (LSDB, key) of each LSA installed
+
+    if now == None:
+        now = time.time()
+
+    aid  = rv["V"]["AID"]
+    lsas = rv["V"]["V"]["LSAS"]
+
+    installed = []
+    for i in range(1, len(lsas)+1):
+        area = aid
+        if lsas[i]["T"] in AS_SCOPED_LSAS:
+            area = AS_SCOPE
+        if not lsdbs.has_key(area):
+            lsdbs[area] = Lsdb(area)
+
+        key = lsdbs[area].update(lsas[i], now)
+        if key:
+            installed.append((lsdbs[area], key))
+
+    return installed
+
 ################################################################################
 
 class OspfExc(Exception): pass
@@ -635,48 +1018,96 @@ class Ospf:
 
     #---------------------------------------------------------------------------
 
-    def __init__(self):
-
-        ## XXX raw sockets are broken in Windows Python (some madness
-        ## about linking against winsock1, etc); applied "patch" from
-        ## https://sourceforge.net/tracker/?func=detail&atid=355470&aid=889544&group_id=5470,
-        ## http://www.rs.fromadia.com/newsread.php?newsid=254,
-        ## http://www.rs.fromadia.com/files/pyraw.exe to fix this
+    def __init__(self, ifnames):
 
-        self._sock = socket.socket(socket.AF_INET, socket.SOCK_RAW, socket.IPPROTO_IP)
+        ## one raw IPPROTO_OSPFIGP socket per interface, each bound to
+        ## its interface (else every socket gets a copy of every
+        ## packet) and joined to AllSPFRouters and AllDRouters there
 
-        self._addr = (ADDRESS, 0)
-        self._sock.bind(self._addr)
-        self._name = self._sock.getsockname()
+        self._socks = { } # fd -> (interface name, socket)
+        for ifname in ifnames:
+            sock = self.openSock(ifname)
+            self._socks[sock.fileno()] = (ifname, sock)
 
-        self._sock.setsockopt(socket.IPPROTO_IP, socket.IP_HDRINCL, 1)
-        self._sock.ioctl(socket.SIO_RCVALL, 1)
+        if hasattr(select, "epoll"):
+            self._poll = select.epoll()
+            for fd in self._socks.keys():
+                self._poll.register(fd, select.EPOLLIN)
+        else:
+            self._poll = None
 
-        self._adjs = {}
-        self._rcvd = ""
-        self._mrtd = None
+        self._adjs   = {}
+        self._lsdbs  = {} # area -> Lsdb
+        self._timers = Timers()
+        self._rcvd   = ""
+        self._mrtd   = None
 
     def __repr__(self):
 
+        ifnames = map(lambda x: x[0], self._socks.values())
+        ifnames.sort()
+
         rs = """OSPF listener, version %s:
         %s
-        socket:  %s
-        address: %s, name: %s""" %\
-            (self._version, self._mrtd, self._sock, self._addr, self._name)
+        interfaces: %s""" %\
+            (self._version, self._mrtd, string.join(ifnames, ", "))
 
         return rs
 
     def close(self):
 
-        self._sock.close()
-        self._mrtd.close()
+        if self._poll:
+            self._poll.close()
+        for (ifname, sock) in self._socks.values():
+            sock.close()
+        if self._mrtd:
+            self._mrtd.close()
+
+    def openSock(self, ifname):
+
+        sock = socket.socket(socket.AF_INET, socket.SOCK_RAW, IPPROTO_OSPFIGP)
+        sock.setsockopt(socket.SOL_SOCKET, SO_BINDTODEVICE, ifname + '\000')
+
+        ifr = fcntl.ioctl(sock.fileno(), SIOCGIFINDEX,
+                          struct.pack("16si", ifname, 0))
+        (_, ifindex) = struct.unpack("16si", ifr)
+        for group in ("AllSPFRouters", "AllDRouters"):
+            mreq = struct.pack(IP_MREQN, struct.pack(">L", ADDRS[group]),
+                               '\000'*4, ifindex)
+            sock.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP, mreq)
+
+        # have the kernel drop anything that isn't OSPFv2; parseMsg()
+        # still checks, for packets that got in before this
+        try:
+            attach_filter(sock, OSPF_FILTER)
+        except (socket.error), e:
+            error("%s: no socket filter (%s)\n" % (ifname, e))
+
+        return sock
+
+    def poll(self, timeout):
+
+        ## the (interface name, socket) of each socket with a packet
+        ## waiting, waiting up to timeout seconds (None: forever)
+
+        if self._poll:
+            if timeout == None:
+                timeout = -1
+            try:
+                evs = self._poll.poll(timeout)
+            except (IOError), e:
+                return [ ] # EINTR
+            return map(lambda (fd, ev), s=self._socks: s[fd], evs)
+
+        (rfds, _, _) = select.select(self._socks.keys(), [], [], timeout)
+        return map(lambda fd, s=self._socks: s[fd], rfds)
 
     #---------------------------------------------------------------------------
 
-    def parseMsg(self, verbose=1, level=0):
+    def parseMsg(self, sock, verbose=1, level=0):
 
         try:
-            (msg_len, msg) = self.recvMsg(verbose, level)
+            (msg_len, msg) = self.recvMsg(sock, verbose, level)
 
         except OspfExc, oe:
             if verbose > 1: print "[ *** Non OSPF packet received *** ]"
@@ -699,12 +1130,16 @@ class Ospf:
                 tb = stk[0]
                 error("[ *** exception parsing OSPF packet ***]\n")
                 error("### File: %s, Line: %s, Exc: %s " % (tb[0], tb[1], exc ))
+                return None
+
+            if rv["T"] == MSG_TYPES["LSUPD"]:
+                self.processLsUpd(rv, verbose, level)
 
             return rv
 
-    def recvMsg(self, verbose=1, level=0):
+    def recvMsg(self, sock, verbose=1, level=0):
 
-        self._rcvd = self._sock.recv(RECV_BUF_SZ)
+        self._rcvd = sock.recv(RECV_BUF_SZ)
 
         if verbose > 2:
             print "%srecvMsg: recv: len=%d%s" %\
@@ -720,17 +1155,59 @@ class Ospf:
 
     #---------------------------------------------------------------------------
 
+    def processLsUpd(self, rv, verbose=1, level=0):
+
+        ## installs the LSAs in an LSUPD, in order; returns the
+        ## (LSDB, key) of each one installed
+
+        installed = updateLsdbs(self._lsdbs, rv)
+        for (lsdb, key) in installed:
+            lsa = lsdb.get(key)
+            if lsa.expiry() != None:
+                self._timers.schedule(lsa.expiry(), self.lsaTimer,
+                                      (lsdb, key, lsa))
+            if verbose > 1:
+                print "%sinstalled %s" % (level*INDENT, lsaKeyStr(key))
+
+        return installed
+
+    def lsaTimer(self, lsdb, key, lsa, verbose=1, level=0):
+
+        if lsdb.get(key) is not lsa:
+            return # since replaced
+
+        if lsdb.age(key, lsa):
+            self._timers.schedule(lsa.expiry(), self.lsaTimer, (lsdb, key, lsa))
+            what = "reached MaxAge"
+        else:
+            what = "removed"
+
+        if verbose > 1:
+            print "%sLSA %s %s" % (level*INDENT, lsaKeyStr(key), what)
+
+    def runTimers(self, verbose=1, level=0):
+
+        ## fires any timers due; returns seconds until the next, or None
+
+        now = time.time()
+        self._timers.run(now, verbose, level)
+
+        when = self._timers.next()
+        if when == None:
+            return None
+        return max(when - time.time(), 0)
+
+    #---------------------------------------------------------------------------
+
 ################################################################################
 
 if __name__ == "__main__":
 
     import mrtd
 
-    global VERBOSE, DUMP_MRTD, ADDRESS
-
     VERBOSE   = 1
     DUMP_MRTD = 0
-    ADDRESS   = None
+    ifnames   = [ ]
 
     file_pfx  = mrtd.DEFAULT_FILE
     file_sz   = mrtd.DEFAULT_SIZE
@@ -749,7 +1226,9 @@ if __name__ == "__main__":
         -d|--dump     : Dump protocol MRTD file
         -f|--file     : Set file prefix for MRTd dump [def: %s]
         -z|--size     : Size of output file(s) [min: %d]
-        -b|--bind <ipaddr> : local IP address for bind """ %\
+        -i|--interface <ifname> : [*] listen on this interface (may be
+                                  given more than once)
+        -b|--bind <ipaddr> : listen on the interface with this address""" %\
             (os.path.basename(sys.argv[0]),
              mrtd.DEFAULT_FILE,
              mrtd.MIN_FILE_SZ)
@@ -759,9 +1238,10 @@ if __name__ == "__main__":
 
     try:
         opts, args = getopt.getopt(sys.argv[1:],
-                                   "hqvVdf:z:",
+                                   "hqvVdf:z:i:b:",
                                    ("help", "quiet", "verbose", "VERBOSE",
-                                    "dump", "file=", "size=", ))
+                                    "dump", "file=", "size=",
+                                    "interface=", "bind=", ))
     except (getopt.error):
         usage()
 
@@ -788,37 +1268,47 @@ if __name__ == "__main__":
         elif x in ('-z', '--file-size'):
             file_sz = max(string.atof(y), mrtd.MIN_FILE_SZ)
 
+        elif x in ('-i', '--interface'):
+            ifnames.append(y)
+
         elif x in ('-b', '--bind'):
-            ADDRESS = y
+            for (ifname, afs) in (getifaddrs() or { }).items():
+                for a in afs.get(socket.AF_INET, [ ]):
+                    if a.get('addr') == y and ifname not in ifnames:
+                        ifnames.append(ifname)
 
         else:
             usage()
 
-    if not ADDRESS: usage()
+    if not ifnames: usage()
 
     #---------------------------------------------------------------------------
 
-    ospf       = Ospf()
+    ospf       = Ospf(ifnames)
     ospf._mrtd = mrtd.Mrtd(file_pfx, "w+b", file_sz, mrtd.MSG_TYPES["PROTOCOL_OSPF2"], ospf)
 
     if VERBOSE > 0: print ospf
 
     try:
-        timeout = Ospf._holdtimer
-
         rv = None
         while 1:
-            before = time.time()
-            rfds, _, _ = select.select([ospf._sock], [], [], timeout)
-            after = time.time()
-            elapsed = after - before
+            timeout = ospf.runTimers(VERBOSE, 0)
+            if timeout == None:
+                timeout = Ospf._holdtimer
+
+            ready = ospf.poll(timeout)
+            for (ifname, sock) in ready:
+                if VERBOSE > 2: print "[ %s ]" % ifname
+                rv = ospf.parseMsg(sock, VERBOSE, 0)
 
-            if len(rfds) > 0: rv = ospf.parseMsg(VERBOSE, 0)
-            else:
+            if not ready:
                 ## tx some pkts to form adjacency
                 pass
 
     except (KeyboardInterrupt):
+        if VERBOSE > 0:
+            for lsdb in ospf._lsdbs.values():
+                error("%s\n" % `lsdb`)
         ospf.close()
         sys.exit(1)
 
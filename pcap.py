@@ -0,0 +1,589 @@
+#! /usr/bin/env python2.5
+
+##     PyRT: Python Routeing Toolkit
+
+##     pcap/pcapng module: reads packet captures (without libpcap),
+##     picks out the ISIS and OSPF packets in them, and either decodes
+##     them or converts them to MRTD PROTOCOL_ISIS2/OSPF2 dumps.
+
+##     Copyright (C) 2001 Richard Mortier <mort@sprintlabs.com>, Sprint ATL
+
+##     This program is free software; you can redistribute it and/or
+##     modify it under the terms of the GNU General Public License as
+##     published by the Free Software Foundation; either version 2 of the
+##     License, or (at your option) any later version.
+
+##     This program is distributed in the hope that it will be useful,
+##     but WITHOUT ANY WARRANTY; without even the implied warranty of
+##     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+##     General Public License for more details.
+
+##     You should have received a copy of the GNU General Public License
+##     along with this program; if not, write to the Free Software
+##     Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA
+##     02111-1307 USA
+
+# Classic pcap files (either byte order, microsecond or nanosecond
+# timestamps) and pcapng files (any number of sections and interfaces,
+# each with its own link type and timestamp resolution) are read.  The
+# file is read in large blocks and records are unpacked in place, so
+# that converting a capture costs little more than copying it.
+
+# ISIS PDUs are picked out of Ethernet (possibly VLAN tagged) and
+# Linux cooked captures, and are returned as the 802.3/LLC frame that
+# isis.parseIsisMsg() expects; cooked captures don't keep the
+# destination MAC, so the AllL1ISs/AllL2ISs address for the PDU's
+# level is filled in.  OSPF packets are picked out of Ethernet, Linux
+# cooked, raw IP and BSD loopback captures, and are returned as the
+# IPv4 packet that ospf.parseOspfMsg() expects (with any IP options
+# removed, since the parsers assume a 20 byte header).  IP fragments
+# are not reassembled and are ignored.
+
+import struct, sys, getopt, string, os, time
+import mrtd, isis, ospf
+from mutils import *
+
+#-------------------------------------------------------------------------------
+
+INDENT = "    "
+
+BUF_SZ     = 1024*1024
+MAX_SNAPLEN = 256*1024
+
+PCAP_MAGIC    = 0xa1b2c3d4L # microsecond timestamps
+PCAP_MAGIC_NS = 0xa1b23c4dL # nanosecond timestamps
+
+PCAP_HDR      = "LHHlLLL"
+PCAP_HDR_LEN  = struct.calcsize("<" + PCAP_HDR)
+PCAP_REC      = "LLLL"
+PCAP_REC_LEN  = struct.calcsize("<" + PCAP_REC)
+
+PCAPNG_BOM    = 0x1a2b3c4dL
+PCAPNG_BLOCKS = { 0x0a0d0d0aL: "SHB", # section header
+                  0x00000001L: "IDB", # interface description
+                  0x00000002L: "PB",  # packet (obsolete)
+                  0x00000003L: "SPB", # simple packet
+                  0x00000006L: "EPB", # enhanced packet
+                  }
+for k in PCAPNG_BLOCKS.keys():
+    PCAPNG_BLOCKS[PCAPNG_BLOCKS[k]] = k
+
+PCAPNG_OPT_END    = 0
+PCAPNG_IF_TSRESOL = 9
+
+LINK_TYPES = { 0L:   "NULL",       # BSD loopback, host byte order family
+               1L:   "ETHERNET",
+               12L:  "RAW_BSD",    # raw IP, as some BSDs number it
+               14L:  "RAW_BSDOS",
+               101L: "RAW",
+               108L: "LOOP",       # BSD loopback, network byte order family
+               113L: "LINUX_SLL",
+               276L: "LINUX_SLL2",
+               }
+for k in LINK_TYPES.keys():
+    LINK_TYPES[LINK_TYPES[k]] = k
+
+RAW_LINK_TYPES = (12L, 14L, 101L)
+
+ETH_HDR_LEN    = 14
+ETH_MAX_LEN    = 1500
+ETH_P_IP       = 0x0800
+ETH_P_802_2    = 0x0004
+VLAN_ETHERTYPES = (0x8100, 0x88a8, 0x9100)
+
+SLL_HDR_LEN  = 16
+SLL2_HDR_LEN = 20
+AF_INET      = 2
+
+IP_PROTO_OSPF = 89
+IP_MF_OFFSET  = 0x3fff
+
+ISIS_LLC   = struct.pack("4B", *isis.ISIS_LLC_HDR)
+ISIS_L2_PDUS = (16, 20, 25, 27)
+
+################################################################################
+
+def isisFrame(linktype, frame):
+
+    ## returns the 802.3 frame carrying an ISIS PDU, or None
+
+    flen = len(frame)
+    if linktype == 1:
+        if flen < isis.MAC_HDR_LEN + isis.ISIS_HDR_LEN:
+            return None
+
+        (etype, ) = struct.unpack(">H", frame[12:14])
+        while etype in VLAN_ETHERTYPES and flen >= 18:
+            frame = frame[:12] + frame[16:]
+            flen  = flen - 4
+            (etype, ) = struct.unpack(">H", frame[12:14])
+
+        if etype <= ETH_MAX_LEN and frame[14:18] == ISIS_LLC:
+            return frame
+        return None
+
+    if linktype == 113:
+        if flen < SLL_HDR_LEN + 4: return None
+        (proto, ) = struct.unpack(">H", frame[14:16])
+        src_mac = frame[6:12]
+        pdu = frame[SLL_HDR_LEN:]
+
+    elif linktype == 276:
+        if flen < SLL2_HDR_LEN + 4: return None
+        (proto, ) = struct.unpack(">H", frame[0:2])
+        src_mac = frame[12:18]
+        pdu = frame[SLL2_HDR_LEN:]
+
+    else:
+        return None
+
+    if proto != ETH_P_802_2 or pdu[:4] != ISIS_LLC or\
+           len(pdu) < isis.ISIS_HDR_LEN + 3:
+        return None
+
+    if (ord(pdu[7]) & 0x1f) in ISIS_L2_PDUS:
+        dst_mac = isis.AllL2ISs
+    else:
+        dst_mac = isis.AllL1ISs
+
+    return dst_mac + src_mac + struct.pack(">H", len(pdu)) + pdu
+
+#-------------------------------------------------------------------------------
+
+def ospfPacket(linktype, frame):
+
+    ## returns the IPv4 packet carrying an OSPF message, or None
+
+    if linktype == 1:
+        if len(frame) < ETH_HDR_LEN: return None
+        off = 12
+        (etype, ) = struct.unpack(">H", frame[off:off+2])
+        while etype in VLAN_ETHERTYPES and len(frame) >= off+6:
+            off = off + 4
+            (etype, ) = struct.unpack(">H", frame[off:off+2])
+        if etype != ETH_P_IP:
+            return None
+        off = off + 2
+
+    elif linktype in RAW_LINK_TYPES:
+        off = 0
+
+    elif linktype == 113:
+        if frame[14:16] != "\x08\x00": return None
+        off = SLL_HDR_LEN
+
+    elif linktype == 276:
+        if frame[0:2] != "\x08\x00": return None
+        off = SLL2_HDR_LEN
+
+    elif linktype == 0:
+        if frame[0:4] not in (struct.pack("<L", AF_INET),
+                              struct.pack(">L", AF_INET)):
+            return None
+        off = 4
+
+    elif linktype == 108:
+        if frame[0:4] != struct.pack(">L", AF_INET): return None
+        off = 4
+
+    else:
+        return None
+
+    if len(frame) < off + ospf.IP_HDR_LEN + ospf.OSPF_HDR_LEN:
+        return None
+
+    vihl = ord(frame[off])
+    if vihl >> 4 != 4 or ord(frame[off+9]) != IP_PROTO_OSPF:
+        return None
+
+    (ip_len, ) = struct.unpack(">H", frame[off+2:off+4])
+    (frag, )   = struct.unpack(">H", frame[off+6:off+8])
+    if frag & IP_MF_OFFSET:
+        return None
+
+    ihl = (vihl & 0x0f) * 4
+    if ihl == ospf.IP_HDR_LEN:
+        return frame[off:off+ip_len]
+
+    # drop the options; the header checksum is left as it was
+    return chr(0x45) + frame[off+1:off+2] +\
+           struct.pack(">H", ip_len-ihl+ospf.IP_HDR_LEN) +\
+           frame[off+4:off+ospf.IP_HDR_LEN] + frame[off+ihl:off+ip_len]
+
+################################################################################
+
+class EOFExc(Exception): pass
+class PcapExc(Exception): pass
+
+#-------------------------------------------------------------------------------
+
+class Pcap:
+
+    def __init__(self, file_name):
+
+        self._file_name = file_name
+        self._of   = open(file_name, "rb")
+        self._buf  = ""
+        self._off  = 0
+
+        self._bo   = "<"  # byte order of the file/current section
+        self._ifcs = []   # pcapng: (linktype, snaplen, ticks/sec) per interface
+        self._ts   = 0.0  # time of the last packet, for pcapng SPBs
+        self._cnt  = 0
+
+        if not self._fill(4):
+            raise PcapExc("%s: empty file" % file_name)
+
+        (magic, ) = struct.unpack("<L", self._buf[:4])
+        if magic == PCAPNG_BLOCKS["SHB"]:
+            self._ng = 1
+            return
+
+        self._ng = 0
+        for bo in ("<", ">"):
+            (magic, ) = struct.unpack(bo+"L", self._buf[:4])
+            if magic in (PCAP_MAGIC, PCAP_MAGIC_NS):
+                break
+        else:
+            raise PcapExc("%s: not a pcap/pcapng file" % file_name)
+
+        if not self._fill(PCAP_HDR_LEN):
+            raise PcapExc("%s: truncated file header" % file_name)
+
+        (magic, vmaj, vmin, zone, sigfigs, snaplen, linktype) =\
+                struct.unpack(bo+PCAP_HDR, self._buf[:PCAP_HDR_LEN])
+        self._off = PCAP_HDR_LEN
+        self._bo  = bo
+        self._rec = struct.Struct(bo+PCAP_REC)
+
+        if magic == PCAP_MAGIC_NS:
+            tps = 1000000000
+        else:
+            tps = 1000000
+        self._ifcs = [ (linktype & 0xffff, snaplen, float(tps)) ]
+
+    def __repr__(self):
+
+        if self._ng: fmt = "pcapng"
+        else:        fmt = "pcap"
+
+        return """Pcap module:
+        file:  %s
+        fmt:   %s
+        ifcs:  %s
+        count: %d""" %\
+        (self._file_name, fmt,
+         string.join(map(lambda x: LINK_TYPES.get(x[0], `x[0]`), self._ifcs),
+                     ", "),
+         self._cnt)
+
+    def close(self):
+
+        self._of.close()
+
+    #---------------------------------------------------------------------------
+
+    def _fill(self, n):
+
+        ## make sure there are n unread bytes in the buffer
+
+        avail = len(self._buf) - self._off
+        while avail < n:
+            data = self._of.read(max(BUF_SZ, n-avail))
+            if not data:
+                return 0
+            self._buf = self._buf[self._off:] + data
+            self._off = 0
+            avail     = len(self._buf)
+
+        return 1
+
+    def read(self):
+
+        ## returns (time, linktype, frame) for the next packet
+
+        if self._ng:
+            return self.readBlock()
+
+        if not self._fill(PCAP_REC_LEN):
+            raise EOFExc
+
+        (sec, frac, caplen, origlen) =\
+              self._rec.unpack_from(self._buf, self._off)
+        if caplen > MAX_SNAPLEN:
+            raise PcapExc("%s: bad record length %d" %
+                          (self._file_name, caplen))
+
+        if not self._fill(PCAP_REC_LEN+caplen):
+            raise EOFExc
+
+        off = self._off + PCAP_REC_LEN
+        self._off = off + caplen
+        self._cnt = self._cnt + 1
+
+        (linktype, snaplen, tps) = self._ifcs[0]
+        return (sec + frac/tps, linktype, self._buf[off:off+caplen])
+
+    def readBlock(self):
+
+        while 1:
+            if not self._fill(12):
+                raise EOFExc
+
+            off = self._off
+            (btype, ) = struct.unpack_from(self._bo+"L", self._buf, off)
+            if btype == PCAPNG_BLOCKS["SHB"]:
+                (bom, ) = struct.unpack_from("<L", self._buf, off+8)
+                if bom == PCAPNG_BOM:
+                    self._bo = "<"
+                else:
+                    self._bo = ">"
+                    (bom, ) = struct.unpack_from(">L", self._buf, off+8)
+                    if bom != PCAPNG_BOM:
+                        raise PcapExc("%s: bad byte order magic" %
+                                      self._file_name)
+                self._ifcs = []
+
+            bo = self._bo
+            (blen, ) = struct.unpack_from(bo+"L", self._buf, off+4)
+            if blen < 12 or blen & 3 or blen > MAX_SNAPLEN + 64:
+                raise PcapExc("%s: bad block length %d" %
+                              (self._file_name, blen))
+
+            if not self._fill(blen):
+                raise EOFExc
+
+            off = self._off
+            self._off = off + blen
+            body = off + 8
+
+            if btype == PCAPNG_BLOCKS["EPB"]:
+                (ifc, tshi, tslo, caplen, origlen) =\
+                      struct.unpack_from(bo+"5L", self._buf, body)
+                (linktype, snaplen, tps) = self._ifcs[ifc]
+                self._ts  = ((tshi << 32) | tslo) / tps
+                self._cnt = self._cnt + 1
+                return (self._ts, linktype,
+                        self._buf[body+20:body+20+min(caplen, blen-32)])
+
+            elif btype == PCAPNG_BLOCKS["SPB"]:
+                (origlen, ) = struct.unpack_from(bo+"L", self._buf, body)
+                (linktype, snaplen, tps) = self._ifcs[0]
+                caplen = min(origlen, blen-16)
+                if snaplen:
+                    caplen = min(caplen, snaplen)
+                self._cnt = self._cnt + 1
+                return (self._ts, linktype,
+                        self._buf[body+4:body+4+caplen])
+
+            elif btype == PCAPNG_BLOCKS["PB"]:
+                (ifc, drops, tshi, tslo, caplen, origlen) =\
+                      struct.unpack_from(bo+"HH4L", self._buf, body)
+                (linktype, snaplen, tps) = self._ifcs[ifc]
+                self._ts  = ((tshi << 32) | tslo) / tps
+                self._cnt = self._cnt + 1
+                return (self._ts, linktype,
+                        self._buf[body+20:body+20+min(caplen, blen-32)])
+
+            elif btype == PCAPNG_BLOCKS["IDB"]:
+                (linktype, resvd, snaplen) =\
+                           struct.unpack_from(bo+"HHL", self._buf, body)
+                tps = 1000000.0
+                opt = body + 8
+                end = off + blen - 4
+                while opt + 4 <= end:
+                    (code, olen) = struct.unpack_from(bo+"HH", self._buf, opt)
+                    if code == PCAPNG_OPT_END:
+                        break
+                    if code == PCAPNG_IF_TSRESOL and olen >= 1:
+                        res = ord(self._buf[opt+4])
+                        if res & 0x80: tps = float(1L << (res & 0x7f))
+                        else:          tps = float(10L ** res)
+                    opt = opt + 4 + ((olen+3) & ~3)
+
+                self._ifcs.append((linktype, snaplen, tps))
+
+            # anything else (statistics, name resolution, ...) is skipped
+
+    #---------------------------------------------------------------------------
+
+    def convert(self, isis_mrt=None, ospf_mrt=None):
+
+        ## writes the ISIS/OSPF packets to the given Mrtds; returns
+        ## { "ISIS": n, "OSPF": n, "OTHER": n, "BYTES": n }
+
+        nisis = nospf = nother = nbytes = 0
+        isis_off = isis.MAC_HDR_LEN + 4
+        ospf_off = ospf.IP_HDR_LEN + 1
+
+        read = self.read
+        try:
+            while 1:
+                (ts, linktype, frame) = read()
+                nbytes = nbytes + len(frame)
+
+                if isis_mrt:
+                    pkt = isisFrame(linktype, frame)
+                    if pkt:
+                        isis_mrt.writeIsis2Msg(ord(pkt[isis_off]) & 0x1f,
+                                               len(pkt), pkt, ts)
+                        nisis = nisis + 1
+                        continue
+
+                if ospf_mrt:
+                    pkt = ospfPacket(linktype, frame)
+                    if pkt:
+                        ospf_mrt.writeOspfMsg(ord(pkt[ospf_off]),
+                                              len(pkt), pkt, ts)
+                        nospf = nospf + 1
+                        continue
+
+                nother = nother + 1
+
+        except EOFExc:
+            pass
+
+        return { "ISIS": nisis, "OSPF": nospf, "OTHER": nother,
+                 "BYTES": nbytes }
+
+    def parse(self, msg, verbose=1, level=0):
+
+        ## decodes an ISIS or OSPF packet; returns the parser's rv, or
+        ## None if the packet is neither
+
+        (ts, linktype, frame) = msg
+
+        pkt = isisFrame(linktype, frame)
+        if pkt:
+            if verbose > 0:
+                print level*INDENT + "[ %s ] ISIS" % (time.ctime(ts), )
+            return isis.parseIsisMsg(len(pkt), pkt, verbose, level+1)
+
+        pkt = ospfPacket(linktype, frame)
+        if pkt:
+            if verbose > 0:
+                print level*INDENT + "[ %s ] OSPF" % (time.ctime(ts), )
+            return ospf.parseOspfMsg(pkt, verbose, level+1)
+
+        return None
+
+################################################################################
+
+if __name__ == "__main__":
+
+    VERBOSE = 1
+
+    isis_pfx  = None
+    ospf_pfx  = None
+    file_size = sys.maxint
+
+    #---------------------------------------------------------------------------
+
+    def usage():
+
+        print """Usage: %s [ options ] <filenames>:
+        -h|--help      : Help
+        -q|--quiet     : Be quiet
+        -v|--verbose   : Be verbose
+        -V|--VERBOSE   : Be very verbose
+
+        -i|--isis-file : Convert ISIS PDUs to PROTOCOL_ISIS2 dumps
+        -o|--ospf-file : Convert OSPF packets to PROTOCOL_OSPF2 dumps
+        -z|--file-size : Size of output file(s) [def: unlimited]
+
+        Reads pcap/pcapng captures and decodes the ISIS and OSPF
+        packets in them, or, if -i and/or -o are given, just writes
+        them out as MRTD records stamped with their capture time.""" %\
+            (os.path.basename(sys.argv[0]), )
+        sys.exit(0)
+
+    #---------------------------------------------------------------------------
+
+    if len(sys.argv) < 2:
+        usage()
+
+    try:
+        opts, args = getopt.getopt(sys.argv[1:],
+                                   "hqvVi:o:z:",
+                                   ("help", "quiet", "verbose", "VERBOSE",
+                                    "isis-file=", "ospf-file=", "file-size=", ))
+    except (getopt.error):
+        usage()
+
+    for (x, y) in opts:
+        if x in ('-h', '--help'):
+            usage()
+
+        elif x in ('-q', '--quiet'):
+            VERBOSE = 0
+
+        elif x in ('-v', '--verbose'):
+            VERBOSE = 2
+
+        elif x in ('-V', '--VERBOSE'):
+            VERBOSE = 3
+
+        elif x in ('-i', '--isis-file'):
+            isis_pfx = y
+
+        elif x in ('-o', '--ospf-file'):
+            ospf_pfx = y
+
+        elif x in ('-z', '--file-size'):
+            file_size = string.atol(y)
+
+        else:
+            usage()
+
+    filenames = args
+    if not filenames:
+        usage()
+
+    #---------------------------------------------------------------------------
+
+    isis_mrt = ospf_mrt = None
+    if isis_pfx:
+        isis_mrt = mrtd.Mrtd(isis_pfx, "w+b", file_size,
+                             mrtd.MSG_TYPES["PROTOCOL_ISIS2"], None, 0)
+    if ospf_pfx:
+        ospf_mrt = mrtd.Mrtd(ospf_pfx, "w+b", file_size,
+                             mrtd.MSG_TYPES["PROTOCOL_OSPF2"], None, 0)
+
+    for fn in filenames:
+        cnt  = 0
+        pcap = None
+        try:
+            pcap = Pcap(fn)
+            error('[ %s ] reading...\n' % fn)
+
+            if isis_mrt or ospf_mrt:
+                start = time.time()
+                rv = pcap.convert(isis_mrt, ospf_mrt)
+                elapsed = max(time.time() - start, 0.000001)
+                error("%d packets: %d ISIS, %d OSPF, %d other; %.1f MB/s\n" %
+                      (pcap._cnt, rv["ISIS"], rv["OSPF"], rv["OTHER"],
+                       rv["BYTES"]/elapsed/1000000.0))
+
+            else:
+                while 1:
+                    rv = pcap.parse(pcap.read(), VERBOSE)
+                    if rv:
+                        cnt = cnt + 1
+                    if VERBOSE > 2: print `rv`
+
+        except EOFExc:
+            error("end of file: %u messages\n" % cnt)
+        except PcapExc, e:
+            error("%s\n" % e)
+        except KeyboardInterrupt:
+            error("interrupted!\n")
+
+        if pcap: pcap.close()
+
+    if isis_mrt: isis_mrt.close()
+    if ospf_mrt: ospf_mrt.close()
+
+    sys.exit(0)
+
+################################################################################
+################################################################################
@@ -0,0 +1,265 @@
+#! /usr/bin/env python2.5
+
+##     PyRT: Python Routeing Toolkit
+
+##     Replays the BGP UPDATEs in MRTd dumps to a BGP peer, either at
+##     the rate they were recorded, some multiple of it, or as fast as
+##     possible.
+
+##     Copyright (C) 2001 Richard Mortier <mort@sprintlabs.com>, Sprint ATL
+
+##     This program is free software; you can redistribute it and/or
+##     modify it under the terms of the GNU General Public License as
+##     published by the Free Software Foundation; either version 2 of the
+##     License, or (at your option) any later version.
+
+##     This program is distributed in the hope that it will be useful,
+##     but WITHOUT ANY WARRANTY; without even the implied warranty of
+##     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+##     General Public License for more details.
+
+##     You should have received a copy of the GNU General Public License
+##     along with this program; if not, write to the Free Software
+##     Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA
+##     02111-1307 USA
+
+import time, getopt, sys, string, os, struct, socket
+import mrtd, bgp
+from mutils import *
+
+REPORT_INTERVAL = 10
+
+# octets in each of the source and destination addresses of a BGP4MP
+# MESSAGE header, by AFI
+AFI_ADDR_LEN = { bgp.AFI_TYPES["IP"]:  4,
+                 bgp.AFI_TYPES["IP6"]: 16,
+                 }
+
+################################################################################
+
+def getUpdate(msg):
+
+    ## returns (timestamp, UPDATE body) for a BGP4MP/BGP4PY MESSAGE record
+    ## carrying an UPDATE, else None.  Done by hand rather than through
+    ## Mrtd.parse() since we only want the raw PDU (and Mrtd.parse()
+    ## only knows IPv4 peers).
+
+    (ptime, ptype, psubtype, plen, phdr, pdata) = msg
+
+    if ptype == mrtd.MSG_TYPES["PROTOCOL_BGP4MP"]:
+        if psubtype != mrtd.BGP4MP_SUBTYPES["MESSAGE"]:
+            return None
+
+        # Zebra sometimes writes 4 null bytes instead of the subtype header
+        if pdata[0:4+bgp.BGP_MARKER_LEN] == ("\000\000\000\000" +
+                                             bgp.BGP_MARKER):
+            pdu = pdata[4:]
+        else:
+            # the header's addresses are as long as its AFI says
+            (afi, ) = struct.unpack(">H", pdata[6:8])
+            if not AFI_ADDR_LEN.has_key(afi):
+                return None
+            pdu = pdata[8+2*AFI_ADDR_LEN[afi]:]
+        ts = ptime
+
+    elif ptype == mrtd.MSG_TYPES["PROTOCOL_BGP4PY"]:
+        if psubtype != mrtd.BGP4PY_SUBTYPES["MESSAGE"]:
+            return None
+
+        (ts_frac, ) = struct.unpack(">L", pdata[16:mrtd.BGP4PY_SUBTYPE_HDR_LEN])
+        pdu = pdata[mrtd.BGP4PY_SUBTYPE_HDR_LEN:]
+        ts  = ptime + ts_frac*0.000001
+
+    else:
+        return None
+
+    if pdu[:bgp.BGP_MARKER_LEN] != bgp.BGP_MARKER:
+        return None
+
+    msg_len, msg_type =\
+             struct.unpack(">HB", pdu[bgp.BGP_MARKER_LEN:bgp.BGP_HDR_LEN])
+    if msg_type != bgp.MSG_TYPES["UPDATE"]:
+        return None
+
+    return (ts, pdu[bgp.BGP_HDR_LEN:msg_len])
+
+################################################################################
+
+if __name__ == "__main__":
+
+    VERBOSE = 1
+    SPEED   = 0 # as fast as possible
+
+    loc_name = None
+    rem_name = None
+    asn      = None
+    port     = bgp.BGP_LISTEN_PORT
+    holdtime = 0
+
+    #---------------------------------------------------------------------------
+
+    def usage():
+
+        print """Usage: %s [ options ] <filenames> ([*] options required):
+        -h|--help       : Help
+        -q|--quiet      : Be quiet
+        -v|--verbose    : Be verbose
+        -V|--VERBOSE    : Be very verbose
+
+        -p|--peer       : [*] BGP peer address/name
+        -a|--as         : [*] Local AS number
+        -l|--local      : Address/name for local bind
+        -t|--port       : BGP peer listening port [def: %d]
+        -o|--holdtime   : Holdtime to offer; if not 0, a KEEPALIVE is
+                          sent every holdtime/3 [def: 0, no KEEPALIVEs]
+
+        -r|--real-time  : Replay at the recorded rate
+        -x|--speed      : Replay at this multiple of the recorded rate
+                          [def: as fast as possible]""" %\
+            (os.path.basename(sys.argv[0]), bgp.BGP_LISTEN_PORT)
+        sys.exit(0)
+
+    #---------------------------------------------------------------------------
+
+    if len(sys.argv) < 2:
+        usage()
+
+    try:
+        opts, args = getopt.getopt(sys.argv[1:],
+                                   "hqvVp:a:l:t:o:rx:",
+                                   ("help", "quiet", "verbose", "VERBOSE",
+                                    "peer=", "as=", "local=", "port=",
+                                    "holdtime=", "real-time", "speed=" ))
+    except (getopt.error):
+        usage()
+
+    for (x, y) in opts:
+        if x in ('-h', '--help'):
+            usage()
+
+        elif x in ('-q', '--quiet'):
+            VERBOSE = 0
+
+        elif x in ('-v', '--verbose'):
+            VERBOSE = 2
+
+        elif x in ('-V', '--VERBOSE'):
+            VERBOSE = 3
+
+        elif x in ('-p', '--peer'):
+            rem_name = y
+
+        elif x in ('-a', '--as'):
+            asn = string.atoi(y)
+
+        elif x in ('-l', '--local'):
+            loc_name = y
+
+        elif x in ('-t', '--port'):
+            port = string.atoi(y)
+
+        elif x in ('-o', '--holdtime'):
+            holdtime = string.atoi(y)
+
+        elif x in ('-r', '--real-time'):
+            SPEED = 1.0
+
+        elif x in ('-x', '--speed'):
+            SPEED = string.atof(y)
+
+        else:
+            usage()
+
+    filenames = args
+    if not (filenames and rem_name and asn):
+        usage()
+
+    if not loc_name:
+        loc_name = socket.gethostname()
+
+    #---------------------------------------------------------------------------
+
+    peer = bgp.Bgp(loc_name, asn, rem_name, port, holdtime)
+    if VERBOSE > 0:
+        print `peer`
+
+    peer.sendOpen(VERBOSE, 0)
+    rv = peer.parseMsg(VERBOSE, 0)
+    peer._bgp_peer_as = rv["V"]["AS"]
+    peer.sendKeepalive(VERBOSE, 0)
+
+    # whatever the peer sends us from now on is only read so that its
+    # output doesn't back up; it's never queued or decoded
+    peer.startReceiver(0)
+
+    cnt = 0 ; octets = 0 ; last_cnt = 0
+    first_ts = None
+    start    = time.time()
+    last     = start
+    ka_next  = start + holdtime/3.0
+
+    closed = 0
+    try:
+        for fn in filenames:
+            mrt = mrtd.Mrtd(fn, "rb")
+            error('[ %s ] replaying...\n' % fn)
+            try:
+                while 1:
+                    upd = getUpdate(mrt.read())
+                    if not upd:
+                        continue
+                    (ts, body) = upd
+
+                    if SPEED > 0:
+                        if first_ts == None:
+                            first_ts = ts
+                        due = start + (ts-first_ts)/SPEED
+
+                        # sleep until it's due, waking to keep the
+                        # session up if it has a holdtime
+                        while 1:
+                            now = time.time()
+                            if holdtime and now >= ka_next:
+                                peer.sendKeepalive(VERBOSE, 0)
+                                ka_next = now + holdtime/3.0
+                            if now >= due:
+                                break
+                            if holdtime:
+                                time.sleep(min(due, ka_next) - now)
+                            else:
+                                time.sleep(due - now)
+
+                    peer.sendMsg(bgp.MSG_TYPES["UPDATE"], len(body), body,
+                                 VERBOSE, 0)
+                    cnt    = cnt + 1
+                    octets = octets + len(body) + bgp.BGP_HDR_LEN
+
+                    now = time.time()
+                    if holdtime and now >= ka_next:
+                        peer.sendKeepalive(VERBOSE, 0)
+                        ka_next = now + holdtime/3.0
+
+                    if VERBOSE > 0 and now - last >= REPORT_INTERVAL:
+                        error("%d updates, %.1f msgs/sec\n" %
+                              (cnt, (cnt-last_cnt)/(now-last)))
+                        last = now ; last_cnt = cnt
+
+            except (mrtd.EOFExc):
+                mrt.close()
+
+    except (KeyboardInterrupt):
+        error("interrupted!\n")
+
+    except (socket.error, bgp.ConnClosedExc), e:
+        error("session closed by peer: %s\n" % (e.args and e.args[-1] or "EOF"))
+        closed = 1
+
+    elapsed = max(time.time() - start, 0.000001)
+    error("replayed %d updates (%d octets) in %.3fs: %.1f msgs/sec, %.1f kB/sec\n" %
+          (cnt, octets, elapsed, cnt/elapsed, octets/elapsed/1024))
+
+    peer._sock.close()
+    sys.exit(closed)
+
+################################################################################
+################################################################################
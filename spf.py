@@ -0,0 +1,1423 @@
+#! /usr/bin/env python2.5
+
+##     PyRT: Python Routeing Toolkit
+
+##     SPF module: shortest path first calculations over the link state
+##     databases built by the ISIS module.
+
+##     Copyright (C) 2001 Richard Mortier <mort@sprintlabs.com>, Sprint ATL
+
+##     This program is free software; you can redistribute it and/or
+##     modify it under the terms of the GNU General Public License as
+##     published by the Free Software Foundation; either version 2 of the
+##     License, or (at your option) any later version.
+
+##     This program is distributed in the hope that it will be useful,
+##     but WITHOUT ANY WARRANTY; without even the implied warranty of
+##     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+##     General Public License for more details.
+
+##     You should have received a copy of the GNU General Public License
+##     along with this program; if not, write to the Free Software
+##     Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA
+##     02111-1307 USA
+
+# Nodes are numbered densely as they are added to a Graph, and all per
+# node state (adjacencies, distances, parents, first hops) is kept in
+# lists indexed by that number rather than in dictionaries keyed by
+# node ID.  The Dijkstra itself uses a binary heap (heapq) with lazy
+# deletion: a node may be on the heap several times, and stale entries
+# are skipped as they come off.
+
+# Pseudonodes (ISIS) and transit networks (OSPF) are flagged in the
+# graph; they are never a first hop themselves, so that the first hop
+# to anything beyond one is the router on the far side.  Nodes not
+# flagged as transit (eg. overloaded ISIS systems) are reachable but
+# not expanded.
+
+import sys, getopt, string, os, time, heapq
+import mrtd, isis, ospf
+from mutils import *
+
+#-------------------------------------------------------------------------------
+
+INDENT   = "    "
+VERSION  = "3.0"
+
+INFINITY = 1L<<62
+
+################################################################################
+
+class Graph:
+
+    def __init__(self):
+
+        self._ids     = [ ] # index -> node ID
+        self._index   = { } # node ID -> index
+        self._adj     = [ ] # index -> [ (index, metric), ... ]
+        self._radj    = [ ] # index -> [ (index, metric), ... ] inbound
+        self._pseudo  = [ ]
+        self._transit = [ ]
+        self._nedges  = 0
+
+    def __repr__(self):
+
+        return "graph: %d nodes, %d edges" % (len(self._ids), self._nedges)
+
+    def __len__(self):
+
+        return len(self._ids)
+
+    def index(self, nid, pseudo=0):
+
+        i = self._index.get(nid)
+        if i == None:
+            i = len(self._ids)
+            self._index[nid] = i
+            self._ids.append(nid)
+            self._adj.append([ ])
+            self._radj.append([ ])
+            self._pseudo.append(pseudo)
+            self._transit.append(1)
+
+        return i
+
+    def addEdge(self, u, v, metric):
+
+        self._adj[u].append((v, metric))
+        self._radj[v].append((u, metric))
+        self._nedges = self._nedges + 1
+
+    def setEdge(self, u, v, metric):
+
+        ## sets (metric None removes) edge u->v; returns its old metric
+
+        old = None
+        for (w, m) in self._adj[u]:
+            if w == v:
+                old = m
+                break
+
+        if old != metric:
+            if old != None:
+                self._adj[u].remove((v, old))
+                self._radj[v].remove((u, old))
+                self._nedges = self._nedges - 1
+            if metric != None:
+                self.addEdge(u, v, metric)
+
+        return old
+
+#-------------------------------------------------------------------------------
+
+def settle(graph, root, dist, parent, hops, heap, within=None):
+
+    ## runs Dijkstra from the (dist, node) entries on heap, relaxing only
+    ## nodes in within if given; dist, parent and hops are updated in
+    ## place, hops[i] being the sorted tuple of first hop nodes used by
+    ## the equal cost paths to i
+
+    adj     = graph._adj
+    pseudo  = graph._pseudo
+    transit = graph._transit
+    done    = { }
+
+    heappush = heapq.heappush
+    heappop  = heapq.heappop
+
+    while heap:
+        (d, u) = heappop(heap)
+        if done.has_key(u):
+            continue
+        done[u] = 1
+
+        if u != root and not transit[u]:
+            continue
+
+        # first hops of u's children: themselves if u is the root (or
+        # a pseudonode hanging off it), else whatever u's were
+        direct = (u == root) or (pseudo[u] and parent[u] == root)
+        uhops  = hops[u]
+
+        for (v, metric) in adj[u]:
+            if within != None and not within.has_key(v):
+                continue
+
+            nd = d + metric
+            if nd < dist[v]:
+                dist[v]   = nd
+                parent[v] = u
+                if direct and not pseudo[v]:
+                    hops[v] = (v, )
+                else:
+                    hops[v] = uhops
+                heappush(heap, (nd, v))
+
+            elif nd == dist[v] and not done.has_key(v):
+                if direct and not pseudo[v]:
+                    vhops = (v, )
+                else:
+                    vhops = uhops
+                if vhops != hops[v]:
+                    merged = { }
+                    for h in hops[v] + vhops:
+                        merged[h] = 1
+                    merged = merged.keys()
+                    merged.sort()
+                    hops[v] = tuple(merged)
+
+def dijkstra(graph, root):
+
+    ## returns (dist, parent, hops), lists indexed by node
+
+    n      = len(graph)
+    dist   = [ INFINITY ] * n
+    parent = [ -1 ] * n
+    hops   = [ () ] * n
+
+    dist[root] = 0
+    settle(graph, root, dist, parent, hops, [ (0, root) ])
+
+    return (dist, parent, hops)
+
+#-------------------------------------------------------------------------------
+
+# Incremental SPF.  Given the edges whose effective metric changed
+# (None meaning absent, or leaving a node that can't be transited) as
+# (u, v, old metric, new metric), and the graph already updated to
+# match, works out which nodes' distances or first hops might change
+# and recomputes only those:
+#
+#   - an edge that got worse or went away matters only if it was on a
+#     shortest path, in which case its far end is affected;
+#   - an edge that got better or appeared can shorten (or tie) paths
+#     beyond it, found by a Dijkstra from its far end that only goes
+#     where it does at least as well as before;
+#   - everything downstream of an affected node, following edges on
+#     the old shortest path DAG, is affected too.
+#
+# Affected nodes are then reset and re-settled from the unaffected
+# nodes bordering them.
+
+def repair(graph, root, dist, parent, hops, changed):
+
+    ## returns the affected nodes (as a dict); dist, parent and hops
+    ## are updated in place
+
+    adj     = graph._adj
+    radj    = graph._radj
+    transit = graph._transit
+
+    heappush = heapq.heappush
+    heappop  = heapq.heappop
+
+    affected = { }
+    probe    = [ ]
+    for (u, v, old, new) in changed:
+        if dist[u] == INFINITY:
+            continue
+        if old != None and (new == None or new > old) and\
+           dist[u] + old == dist[v]:
+            affected[v] = 1
+        if new != None and (old == None or new < old) and\
+           dist[u] + new <= dist[v]:
+            heappush(probe, (dist[u] + new, v))
+
+    probed = { }
+    while probe:
+        (d, v) = heappop(probe)
+        if probed.has_key(v):
+            continue
+        probed[v]   = 1
+        affected[v] = 1
+        if v == root or not transit[v]:
+            continue
+        for (w, metric) in adj[v]:
+            if d + metric <= dist[w] and not probed.has_key(w):
+                heappush(probe, (d + metric, w))
+
+    if affected.has_key(root):
+        del affected[root]
+
+    stack = affected.keys()
+    while stack:
+        u = stack.pop()
+        if dist[u] == INFINITY or not transit[u]:
+            continue
+        for (v, metric) in adj[u]:
+            if dist[u] + metric == dist[v] and not affected.has_key(v):
+                affected[v] = 1
+                stack.append(v)
+
+    for u in affected.keys():
+        dist[u]   = INFINITY
+        parent[u] = -1
+        hops[u]   = ()
+
+    # unaffected neighbours are already settled, so start from them
+    heap = [ ]
+    border = { }
+    for v in affected.keys():
+        for (u, metric) in radj[v]:
+            if dist[u] != INFINITY and not affected.has_key(u) and\
+               not border.has_key(u):
+                border[u] = 1
+                heap.append((dist[u], u))
+    heapq.heapify(heap)
+
+    settle(graph, root, dist, parent, hops, heap, affected)
+
+    return affected
+
+################################################################################
+
+# ISIS: the graph is built from the merged node views of an isis.Lsdb,
+# so both narrow (LSPIISNeighbor, IPIntReach) and wide (TEIISNeighbor,
+# TEIPReach) metric TLVs are used.  An adjacency is only used if both
+# ends report it (ISO 10589 7.2.8.2 two-way check).  Each level has its
+# own Lsdb and so its own IsisSpf; mergeRoutes() combines them, L1
+# routes being preferred over L2.
+
+# Once run, an IsisSpf can be kept up to date by calling change() with
+# the node ID of each LSP installed in the Lsdb.  A change that leaves
+# the node's adjacencies and overload bit alone only needs a partial
+# route calculation (PRC) for the prefixes it added or removed; others
+# go through repair().  Each change returns what it cost, and the
+# totals saved against rerunning everything are kept in _stats.
+
+class IsisSpf:
+
+    def __init__(self, lsdb, root):
+
+        if len(root) == 6:
+            root = root + '\000'
+
+        self._lsdb    = lsdb
+        self._root    = root
+        self._graph   = None
+        self._dist    = [ ]
+        self._parent  = [ ]
+        self._hops    = [ ]
+        self._views   = [ ] # index -> node view the graph was built from
+        self._pfxs    = [ ] # index -> { prefix key: (metric, flags) }
+        self._origins = { } # prefix key -> { index: 1 }
+        self._routes  = { }
+
+        self._stats = { "NODES":       0,
+                        "EDGES":       0,
+                        "ONE_WAY":     0,
+                        "BUILD_T":     0.0,
+                        "SPF_T":       0.0,
+                        "ROUTES_T":    0.0,
+
+                        "FULL":        0,
+                        "PRC":         0,
+                        "ISPF":        0,
+                        "NODES_SAVED": 0,
+                        "PFXS_SAVED":  0,
+                        "INCR_T":      0.0,
+                        }
+
+    def __repr__(self):
+
+        return "L%d SPF from %s: %d nodes, %d edges, %d routes" %\
+               (self._lsdb._level, self._lsdb.nodeStr(self._root),
+                self._stats["NODES"], self._stats["EDGES"], len(self._routes))
+
+    #---------------------------------------------------------------------------
+
+    def adjacencies(self, nid, view):
+
+        ## returns ({ nbr index: metric out }, { nbr index: metric in },
+        ## number of one-way adjacencies) for node nid
+
+        lsdb = self._lsdb
+        g    = self._graph
+        out  = { }
+        into = { }
+        one_way = 0
+
+        if view:
+            for (n, metric) in view["NBRS"].items():
+                nview = lsdb.node(n)
+                if not nview or not nview["NBRS"].has_key(nid):
+                    one_way = one_way + 1
+                    continue
+                j = g.index(n, n[6] != '\000')
+                out[j]  = metric
+                into[j] = nview["NBRS"][nid]
+
+        return (out, into, one_way)
+
+    def buildGraph(self):
+
+        lsdb = self._lsdb
+        g    = self._graph = Graph()
+        one_way = 0
+
+        for nid in lsdb.nodes():
+            view = lsdb.node(nid)
+            if not view:
+                continue
+
+            u = g.index(nid, nid[6] != '\000')
+            if view["OVERLOAD"]:
+                g._transit[u] = 0
+
+            (out, into, n) = self.adjacencies(nid, view)
+            one_way = one_way + n
+            for (v, metric) in out.items():
+                g.addEdge(u, v, metric)
+
+        self._views = map(lsdb.node, g._ids)
+        self._stats["NODES"]   = len(g)
+        self._stats["EDGES"]   = g._nedges
+        self._stats["ONE_WAY"] = one_way
+
+        return g
+
+    #---------------------------------------------------------------------------
+
+    def nodePfxs(self, view):
+
+        ## { prefix key: (metric, flags) }, best advertisement of each
+
+        rv = { }
+        if view:
+            for (addr, plen, metric, flags) in view["PFXS"]:
+                key = id2key(addr, plen)
+                ext = flags & isis.PFX_EXTERNAL
+                if not rv.has_key(key) or\
+                   (ext, metric) < (rv[key][1] & isis.PFX_EXTERNAL, rv[key][0]):
+                    rv[key] = (metric, flags)
+        return rv
+
+    def calcRoute(self, key):
+
+        ## (cost, flags, first hops, origins) for prefix key, or None;
+        ## internal routes beat external ones whatever their cost
+
+        ids  = self._graph._ids
+        dist = self._dist
+        best = None
+        for i in self._origins.get(key, ()):
+            if dist[i] == INFINITY:
+                continue
+
+            (metric, flags) = self._pfxs[i][key]
+            ext  = flags & isis.PFX_EXTERNAL
+            cost = dist[i] + metric
+            if best == None or (ext, cost) < best[0]:
+                best = ((ext, cost), flags, { i: 1 })
+            elif (ext, cost) == best[0]:
+                best[2][i] = 1
+
+        if best == None:
+            return None
+
+        nhops   = { }
+        origins = [ ]
+        for i in best[2].keys():
+            origins.append(ids[i])
+            for h in self._hops[i]:
+                nhops[ids[h]] = 1
+        nhops = nhops.keys()
+        nhops.sort()
+        origins.sort()
+
+        return (best[0][1], best[1], tuple(nhops), tuple(origins))
+
+    def updateRoute(self, key):
+
+        r = self.calcRoute(key)
+        if r == None:
+            if self._routes.has_key(key):
+                del self._routes[key]
+        else:
+            self._routes[key] = r
+
+    def calcRoutes(self):
+
+        ## routes as { prefix key: (cost, flags, first hops, origins) }
+
+        self._pfxs    = map(self.nodePfxs, self._views)
+        self._origins = { }
+        for i in range(len(self._pfxs)):
+            for key in self._pfxs[i].keys():
+                if not self._origins.has_key(key):
+                    self._origins[key] = { }
+                self._origins[key][i] = 1
+
+        self._routes = { }
+        for key in self._origins.keys():
+            self.updateRoute(key)
+
+        return self._routes
+
+    #---------------------------------------------------------------------------
+
+    def run(self):
+
+        t0 = time.time()
+        g  = self.buildGraph()
+        t1 = time.time()
+
+        if not g._index.has_key(self._root):
+            raise NoRootExc(self._lsdb.nodeStr(self._root))
+
+        (self._dist, self._parent, self._hops) =\
+                     dijkstra(g, g._index[self._root])
+        t2 = time.time()
+
+        self.calcRoutes()
+        t3 = time.time()
+
+        self._stats["BUILD_T"]  = t1 - t0
+        self._stats["SPF_T"]    = t2 - t1
+        self._stats["ROUTES_T"] = t3 - t2
+        self._stats["FULL"]     = self._stats["FULL"] + 1
+
+        return self._routes
+
+    def change(self, nid):
+
+        ## brings the SPF and routes up to date with the Lsdb after node
+        ## nid's LSPs changed; returns { "TYPE": "NONE"|"PRC"|"ISPF"|
+        ## "FULL", "NODES": nodes recomputed, "PFXS": prefixes
+        ## recomputed, "TIME": seconds taken }
+
+        t0   = time.time()
+        g    = self._graph
+        view = self._lsdb.node(nid)
+
+        i = None
+        if g:
+            i = g._index.get(nid)
+        if i != None and view is self._views[i]:
+            return { "TYPE": "NONE", "NODES": 0, "PFXS": 0, "TIME": 0.0 }
+
+        old = None
+        if i != None:
+            old = self._views[i]
+        topo = not (old and view and old["NBRS"] == view["NBRS"] and
+                    (not old["OVERLOAD"]) == (not view["OVERLOAD"]))
+
+        if not g or (topo and nid == self._root):
+            self.run()
+            return { "TYPE": "FULL",
+                     "NODES": len(self._graph), "PFXS": len(self._origins),
+                     "TIME": time.time() - t0 }
+
+        pfxs    = { }
+        changed = { }
+        if not topo:
+            self._views[i] = view
+        else:
+            changed = self.changeTopology(nid, view)
+            for v in changed.keys():
+                for key in self._pfxs[v].keys():
+                    pfxs[key] = 1
+
+        # prefixes the node itself advertises
+        i = g._index[nid]
+        opfxs = self._pfxs[i]
+        npfxs = self._pfxs[i] = self.nodePfxs(view)
+        for key in opfxs.keys():
+            if opfxs[key] != npfxs.get(key):
+                pfxs[key] = 1
+                if not npfxs.has_key(key):
+                    del self._origins[key][i]
+                    if not self._origins[key]:
+                        del self._origins[key]
+        for key in npfxs.keys():
+            if opfxs.get(key) != npfxs[key]:
+                pfxs[key] = 1
+                if not self._origins.has_key(key):
+                    self._origins[key] = { }
+                self._origins[key][i] = 1
+
+        for key in pfxs.keys():
+            self.updateRoute(key)
+
+        if topo:
+            rv = { "TYPE": "ISPF", "NODES": len(changed) }
+        else:
+            rv = { "TYPE": "PRC", "NODES": 0 }
+        rv["PFXS"] = len(pfxs)
+        rv["TIME"] = time.time() - t0
+
+        s = self._stats
+        s[rv["TYPE"]] = s[rv["TYPE"]] + 1
+        s["NODES_SAVED"] = s["NODES_SAVED"] + len(g) - rv["NODES"]
+        s["PFXS_SAVED"]  = s["PFXS_SAVED"] + len(self._origins) - rv["PFXS"]
+        s["INCR_T"]      = s["INCR_T"] + rv["TIME"]
+        s["NODES"]       = len(g)
+        s["EDGES"]       = g._nedges
+
+        return rv
+
+    def changeTopology(self, nid, view):
+
+        ## updates the graph for node nid's new view and repairs the
+        ## SPF; returns the nodes recomputed
+
+        g    = self._graph
+        root = g._index[self._root]
+        u    = g.index(nid, nid[6] != '\000')
+
+        (out, into, one_way) = self.adjacencies(nid, view)
+
+        # new nodes (u, or neighbours without an LSP of their own)
+        for j in range(len(self._dist), len(g)):
+            self._dist.append(INFINITY)
+            self._parent.append(-1)
+            self._hops.append(())
+            self._views.append(None)
+            self._pfxs.append({ })
+        self._views[u] = view
+
+        # effective metrics: an edge out of a node that can't be
+        # transited might as well not be there
+        def effective(w, metric, g=g, root=root):
+            if w == root or g._transit[w]:
+                return metric
+            return None
+
+        changed = [ ]
+        old_transit = g._transit[u] or u == root
+        g._transit[u] = not (view and view["OVERLOAD"])
+
+        oout = { }
+        for (v, metric) in g._adj[u]:
+            oout[v] = metric
+        nbrs = oout.copy()
+        nbrs.update(out)
+        for v in nbrs.keys():
+            g.setEdge(u, v, out.get(v))
+            o = oout.get(v)
+            if not old_transit:
+                o = None
+            n = effective(u, out.get(v))
+            if o != n:
+                changed.append((u, v, o, n))
+
+        ointo = { }
+        for (v, metric) in g._radj[u]:
+            ointo[v] = metric
+        nbrs = ointo.copy()
+        nbrs.update(into)
+        for v in nbrs.keys():
+            g.setEdge(v, u, into.get(v))
+            o = effective(v, ointo.get(v))
+            n = effective(v, into.get(v))
+            if o != n:
+                changed.append((v, u, o, n))
+
+        return repair(g, root, self._dist, self._parent, self._hops, changed)
+
+    #---------------------------------------------------------------------------
+
+    def distance(self, nid):
+
+        i = self._graph._index.get(nid)
+        if i == None:
+            return INFINITY
+        return self._dist[i]
+
+    def prtTree(self, level=0):
+
+        ids  = self._graph._ids
+        dist = self._dist
+        order = filter(lambda i, dist=dist: dist[i] != INFINITY, range(len(ids)))
+        order.sort(lambda x, y, dist=dist: cmp(dist[x], dist[y]) or cmp(x, y))
+
+        for i in order:
+            if self._parent[i] < 0:
+                parent = "-"
+            else:
+                parent = self._lsdb.nodeStr(ids[self._parent[i]])
+            print level*INDENT + "%s: dist: %d, parent: %s, first hops: %s" %\
+                  (self._lsdb.nodeStr(ids[i]), dist[i], parent,
+                   string.join(map(lambda h, s=self, ids=ids:
+                                   s._lsdb.nodeStr(ids[h]), self._hops[i]),
+                               ", "))
+
+    def prtRoutes(self, level=0):
+
+        prtRoutes(self._lsdb, self._routes, level)
+#-------------------------------------------------------------------------------
+
+def mergeRoutes(l1_routes, l2_routes):
+
+    ## L1 (intra-area) routes are preferred over L2 whatever the cost
+
+    rv = l2_routes.copy()
+    rv.update(l1_routes)
+    return rv
+
+def prtRoutes(lsdb, routes, level=0):
+
+    keys = routes.keys()
+    keys.sort()
+    for key in keys:
+        (cost, flags, nhops, origins) = routes[key]
+        print level*INDENT + "%s: cost: %d%s, via: %s, from: %s" %\
+              (key2str(key), cost,
+               (flags & isis.PFX_EXTERNAL) and " (ext)" or "",
+               string.join(map(lsdb.nodeStr, nhops), ", ") or "direct",
+               string.join(map(lsdb.nodeStr, origins), ", "))
+
+def parseNodeId(strng):
+
+    ## returns the 7 octet node ID given as dotted octets
+    ## (00.00.00.00.00.05[.00]) or as dotted groups of 4 hex digits
+    ## (0000.0000.0005[.00]), the pseudonode number defaulting to 0;
+    ## None if strng is neither (eg. it's a hostname)
+
+    nid = ""
+    for g in string.split(strng, '.'):
+        if len(g) not in (1, 2, 4):
+            return None
+        try:
+            v = int(g, 16)
+        except (ValueError):
+            return None
+        if len(g) == 4:
+            nid = nid + chr(v >> 8) + chr(v & 0xff)
+        else:
+            nid = nid + chr(v)
+
+    if len(nid) == 6:
+        nid = nid + '\000'
+    if len(nid) != 7:
+        return None
+    return nid
+
+#-------------------------------------------------------------------------------
+
+# OSPF SPF is run per area, over that area's Lsdb plus the AS scoped one
+# for the externals.  Routers are nodes (1, router ID) and transit
+# networks are pseudonodes (2, DR interface address), named by the LSA
+# type and LSID describing them; an edge is only used if the LSA at its
+# far end links back (RFC 2328 16.1 (2)(b)), and MaxAge LSAs are
+# ignored.  Routes are worked out in the RFC's order, intra-area
+# (16.1), inter-area (16.2) and AS external (16.4), each stage only
+# adding prefixes the stages before didn't reach: intra-area beats
+# inter-area beats type 1 external beats type 2 external whatever the
+# costs.  Only router and network LSAs affect the tree, so a change to
+# any other LSA just reruns the route stages (16.5, 16.6).
+
+OSPF_INTRA = 0
+OSPF_INTER = 1
+OSPF_EXT1  = 2
+OSPF_EXT2  = 3
+
+OSPF_PATH_TYPES = { OSPF_INTRA: "intra",
+                    OSPF_INTER: "inter",
+                    OSPF_EXT1:  "E1",
+                    OSPF_EXT2:  "E2",
+                    }
+
+OSPF_LS_INFINITY = 0xffffff # summary and external metrics, RFC 2328 B
+
+class OspfSpf:
+
+    def __init__(self, lsdb, as_lsdb, root):
+
+        self._lsdb    = lsdb
+        self._as_lsdb = as_lsdb
+        self._root    = root
+        self._graph   = None
+        self._dist    = [ ]
+        self._parent  = [ ]
+        self._hops    = [ ]
+        self._pfxs    = [ ] # index -> [ (addr, plen, metric, origin), ... ]
+        self._abrs    = { } # router ID -> index, reachable ABRs
+        self._asbrs   = { } # router ID -> (cost, first hop indexes)
+        self._routes  = { } # prefix key -> (cost, path type,
+                            #                  first hops, origins)
+
+        self._stats = { "NODES":    0,
+                        "EDGES":    0,
+                        "ONE_WAY":  0,
+                        "BUILD_T":  0.0,
+                        "SPF_T":    0.0,
+                        "ROUTES_T": 0.0,
+
+                        "FULL":     0,
+                        "PRC":      0,
+                        "INCR_T":   0.0,
+                        }
+
+    def __repr__(self):
+
+        return "area %s SPF from %s: %d nodes, %d edges, %d routes" %\
+               (id2str(self._lsdb._area), id2str(self._root),
+                self._stats["NODES"], self._stats["EDGES"], len(self._routes))
+
+    def nodeStr(self, nid):
+
+        if nid[0] == ospf.LSA_TYPES["NETWORK"]:
+            return "net %s" % id2str(nid[1])
+        return id2str(nid[1])
+
+    #---------------------------------------------------------------------------
+
+    def buildGraph(self):
+
+        RTR  = ospf.LSA_TYPES["ROUTER"]
+        NET  = ospf.LSA_TYPES["NETWORK"]
+        P2P  = ospf.RTR_LINK_TYPE["P2P"]
+        TRAN = ospf.RTR_LINK_TYPE["TRANSIT"]
+        STUB = ospf.RTR_LINK_TYPE["STUB"]
+
+        rtrs = { } # router ID -> router LSA body
+        for ((t, lsid, advrtr), lsa) in self._lsdb.lsas(RTR).items():
+            if lsa._age != ospf.MAX_AGE and lsid == advrtr and lsa._v:
+                rtrs[lsid] = lsa._v
+
+        nets = { } # DR address -> (mask, DR, { router ID: 1 })
+        for ((t, lsid, advrtr), lsa) in self._lsdb.lsas(NET).items():
+            if lsa._age != ospf.MAX_AGE and lsa._v:
+                attached = { }
+                for r in lsa._v["RTRS"]:
+                    attached[r] = 1
+                nets[lsid] = (lsa._v["MASK"], advrtr, attached)
+
+        # what each router links to, for the two-way check
+        links = { }
+        for (rid, v) in rtrs.items():
+            links[rid] = { }
+            for l in v["LINKS"].values():
+                if l["T"] in (P2P, TRAN):
+                    links[rid][(l["T"], l["ID"])] = 1
+
+        g       = Graph()
+        pfxs    = { }
+        one_way = 0
+        for (rid, v) in rtrs.items():
+            u = g.index((RTR, rid))
+            for l in v["LINKS"].values():
+                (lid, metric) = (l["ID"], l["METRICS"][0])
+                if l["T"] == P2P:
+                    if links.get(lid, { }).has_key((P2P, rid)):
+                        g.addEdge(u, g.index((RTR, lid)), metric)
+                    else:
+                        one_way = one_way + 1
+
+                elif l["T"] == TRAN:
+                    if nets.has_key(lid) and nets[lid][2].has_key(rid):
+                        g.addEdge(u, g.index((NET, lid), 1), metric)
+                    else:
+                        one_way = one_way + 1
+
+                elif l["T"] == STUB:
+                    mask = l["DATA"]
+                    if not pfxs.has_key(u):
+                        pfxs[u] = [ ]
+                    pfxs[u].append((lid & mask, mask2plen(mask), metric, rid))
+
+                # virtual links are only of use to a backbone SPF with
+                # the transit areas' trees to hand, so are skipped
+
+        for (lsid, (mask, dr, attached)) in nets.items():
+            if not g._index.has_key((NET, lsid)):
+                continue
+            n = g._index[(NET, lsid)]
+            pfxs[n] = [ (lsid & mask, mask2plen(mask), 0, dr) ]
+            for rid in attached.keys():
+                if links.get(rid, { }).has_key((TRAN, lsid)):
+                    g.addEdge(n, g.index((RTR, rid)), 0)
+
+        self._graph = g
+        self._pfxs  = map(lambda i, p=pfxs: p.get(i, [ ]), range(len(g)))
+        self._stats["NODES"]   = len(g)
+        self._stats["EDGES"]   = g._nedges
+        self._stats["ONE_WAY"] = one_way
+
+        return g
+
+    #---------------------------------------------------------------------------
+
+    def addRoute(self, best, key, pref, cost, ptype, hops, origin):
+
+        ## keeps the most preferred route to key in best, as [ pref,
+        ## cost, path type, { first hop: 1 }, { origin: 1 } ], merging
+        ## the first hops and origins of equally preferred ones; pref
+        ## is a tuple led by the path type
+
+        r = best.get(key)
+        if r == None or pref < r[0]:
+            r = best[key] = [ pref, cost, ptype, { }, { } ]
+        elif pref > r[0]:
+            return
+
+        for h in hops:
+            r[3][h] = 1
+        r[4][origin] = 1
+
+    def finishRoutes(self, best):
+
+        ## turns what addRoute() kept into routes
+
+        rv = { }
+        for (key, (pref, cost, ptype, hops, origins)) in best.items():
+            hops    = hops.keys()
+            origins = origins.keys()
+            hops.sort()
+            origins.sort()
+            rv[key] = (cost, ptype, tuple(hops), tuple(origins))
+        return rv
+
+    def intraRoutes(self):
+
+        ## RFC 2328 16.1: the transit networks and stub links of every
+        ## node on the tree
+
+        dist = self._dist
+        hops = self._hops
+
+        best = { }
+        for i in range(len(dist)):
+            if dist[i] == INFINITY:
+                continue
+
+            for (addr, plen, metric, origin) in self._pfxs[i]:
+                cost = dist[i] + metric
+                self.addRoute(best, id2key(addr, plen), (OSPF_INTRA, cost),
+                              cost, OSPF_INTRA, hops[i], origin)
+
+        return best
+
+    def interRoutes(self, best):
+
+        ## RFC 2328 16.2: type 3 summaries from reachable ABRs, and
+        ## type 4 summaries (and the area's own ASBRs) into _asbrs
+
+        RTR  = ospf.LSA_TYPES["ROUTER"]
+        dist = self._dist
+        hops = self._hops
+
+        self._abrs  = { }
+        self._asbrs = { }
+        for ((t, lsid, advrtr), lsa) in self._lsdb.lsas(RTR).items():
+            i = self._graph._index.get((RTR, lsid))
+            if i == None or dist[i] == INFINITY or not lsa._v:
+                continue
+            if lsa._v["BORDER"] and lsid != self._root:
+                self._abrs[lsid] = i
+            if lsa._v["EXTERNAL"]:
+                self._asbrs[lsid] = (dist[i], hops[i])
+
+        inter = { }
+        for t in (ospf.LSA_TYPES["SUMMARY (IP)"],
+                  ospf.LSA_TYPES["SUMMARY (ASBR)"]):
+            for ((_, lsid, advrtr), lsa) in self._lsdb.lsas(t).items():
+                if lsa._age == ospf.MAX_AGE or not lsa._v or\
+                   not self._abrs.has_key(advrtr):
+                    continue
+
+                metric = lsa._v["METRICS"].get(0, OSPF_LS_INFINITY)
+                if metric >= OSPF_LS_INFINITY:
+                    continue
+
+                i    = self._abrs[advrtr]
+                cost = dist[i] + metric
+                if t == ospf.LSA_TYPES["SUMMARY (ASBR)"]:
+                    if lsid == self._root:
+                        continue
+                    if not inter.has_key(lsid) or cost < inter[lsid][0]:
+                        inter[lsid] = (cost, { })
+                    if cost == inter[lsid][0]:
+                        for h in hops[i]:
+                            inter[lsid][1][h] = 1
+                    continue
+
+                mask = lsa._v["MASK"]
+                key  = id2key(lsid, mask2plen(mask))
+                self.addRoute(best, key, (OSPF_INTER, cost), cost,
+                              OSPF_INTER, hops[i], advrtr)
+
+        # an ASBR in the area is reached directly, not via a summary
+        for (asbr, (cost, hops)) in inter.items():
+            if not self._asbrs.has_key(asbr):
+                hops = hops.keys()
+                hops.sort()
+                self._asbrs[asbr] = (cost, tuple(hops))
+
+        return best
+
+    def lookup(self, best, addr):
+
+        ## longest match for addr amongst the intra- and inter-area
+        ## routes in best; returns (cost, first hops) or None
+
+        for plen in range(32, -1, -1):
+            r = best.get(id2key(addr, plen))
+            if r and r[2] in (OSPF_INTRA, OSPF_INTER):
+                return (r[1], r[3].keys())
+        return None
+
+    def extRoutes(self, best):
+
+        ## RFC 2328 16.4: type 5 LSAs from reachable ASBRs, via the
+        ## forwarding address if one is given
+
+        if not self._as_lsdb:
+            return best
+
+        for ((_, lsid, advrtr), lsa) in\
+                self._as_lsdb.lsas(ospf.LSA_TYPES["EXTERNAL AS"]).items():
+            if lsa._age == ospf.MAX_AGE or not lsa._v or\
+               advrtr == self._root or not self._asbrs.has_key(advrtr):
+                continue
+
+            m = lsa._v["METRICS"].get(0)
+            if not m or m["METRIC"] >= OSPF_LS_INFINITY:
+                continue
+
+            mask = lsa._v["MASK"]
+            key  = id2key(lsid, mask2plen(mask))
+            (cost, hops) = self._asbrs[advrtr]
+            if m["FWD"]:
+                r = self.lookup(best, m["FWD"])
+                if r == None:
+                    continue
+                (cost, hops) = r
+
+            if m["EXT"]:
+                self.addRoute(best, key, (OSPF_EXT2, m["METRIC"], cost),
+                              m["METRIC"], OSPF_EXT2, hops, advrtr)
+            else:
+                c = cost + m["METRIC"]
+                self.addRoute(best, key, (OSPF_EXT1, c), c,
+                              OSPF_EXT1, hops, advrtr)
+
+        return best
+
+    def calcRoutes(self):
+
+        ## routes as { prefix key: (cost, path type, first hops,
+        ## origins) }, the cost of an E2 route being its type 2 metric
+
+        best = self.intraRoutes()
+        self.interRoutes(best)
+        self.extRoutes(best)
+
+        ids = self._graph._ids
+        for r in best.values():
+            hops = { }
+            for h in r[3].keys():
+                hops[ids[h][1]] = 1
+            r[3] = hops
+
+        self._routes = self.finishRoutes(best)
+        return self._routes
+
+    #---------------------------------------------------------------------------
+
+    def run(self):
+
+        t0 = time.time()
+        g  = self.buildGraph()
+        t1 = time.time()
+
+        root = (ospf.LSA_TYPES["ROUTER"], self._root)
+        if not g._index.has_key(root):
+            raise NoRootExc(id2str(self._root))
+
+        (self._dist, self._parent, self._hops) = dijkstra(g, g._index[root])
+        t2 = time.time()
+
+        self.calcRoutes()
+        t3 = time.time()
+
+        self._stats["BUILD_T"]  = t1 - t0
+        self._stats["SPF_T"]    = t2 - t1
+        self._stats["ROUTES_T"] = t3 - t2
+        self._stats["FULL"]     = self._stats["FULL"] + 1
+
+        return self._routes
+
+    def change(self, keys):
+
+        ## brings the SPF and routes up to date after the LSAs with the
+        ## given keys changed; returns { "TYPE": "NONE"|"PRC"|"FULL",
+        ## "TIME": seconds taken }
+
+        t0 = time.time()
+        types = { }
+        for (t, lsid, advrtr) in keys:
+            types[t] = 1
+
+        if types.has_key(ospf.LSA_TYPES["ROUTER"]) or\
+           types.has_key(ospf.LSA_TYPES["NETWORK"]) or not self._graph:
+            self.run()
+            typ = "FULL"
+
+        elif types.has_key(ospf.LSA_TYPES["SUMMARY (IP)"]) or\
+             types.has_key(ospf.LSA_TYPES["SUMMARY (ASBR)"]) or\
+             types.has_key(ospf.LSA_TYPES["EXTERNAL AS"]):
+            self.calcRoutes()
+            self._stats["PRC"] = self._stats["PRC"] + 1
+            typ = "PRC"
+
+        else:
+            return { "TYPE": "NONE", "TIME": 0.0 }
+
+        t = time.time() - t0
+        self._stats["INCR_T"] = self._stats["INCR_T"] + t
+        return { "TYPE": typ, "TIME": t }
+
+    #---------------------------------------------------------------------------
+
+    def prtTree(self, level=0):
+
+        ids  = self._graph._ids
+        dist = self._dist
+        order = filter(lambda i, dist=dist: dist[i] != INFINITY, range(len(ids)))
+        order.sort(lambda x, y, dist=dist: cmp(dist[x], dist[y]) or cmp(x, y))
+
+        for i in order:
+            if self._parent[i] < 0:
+                parent = "-"
+            else:
+                parent = self.nodeStr(ids[self._parent[i]])
+            print level*INDENT + "%s: dist: %d, parent: %s, first hops: %s" %\
+                  (self.nodeStr(ids[i]), dist[i], parent,
+                   string.join(map(lambda h, s=self, ids=ids:
+                                   s.nodeStr(ids[h]), self._hops[i]),
+                               ", "))
+
+    def prtRoutes(self, level=0):
+
+        prtOspfRoutes(self._routes, level)
+
+#-------------------------------------------------------------------------------
+
+def mergeOspfRoutes(area_routes):
+
+    ## the best of each area's routes to each prefix, by path type and
+    ## then cost; equal ones are merged
+
+    rv = { }
+    for routes in area_routes:
+        for (key, r) in routes.items():
+            old = rv.get(key)
+            if old == None or (r[1], r[0]) < (old[1], old[0]):
+                rv[key] = r
+            elif (r[1], r[0]) == (old[1], old[0]):
+                hops    = { }
+                origins = { }
+                for h in old[2] + r[2]:
+                    hops[h] = 1
+                for o in old[3] + r[3]:
+                    origins[o] = 1
+                hops    = hops.keys()
+                origins = origins.keys()
+                hops.sort()
+                origins.sort()
+                rv[key] = (r[0], r[1], tuple(hops), tuple(origins))
+    return rv
+
+def prtOspfRoutes(routes, level=0):
+
+    keys = routes.keys()
+    keys.sort()
+    for key in keys:
+        (cost, ptype, nhops, origins) = routes[key]
+        print level*INDENT + "%s: cost: %d (%s), via: %s, from: %s" %\
+              (key2str(key), cost, OSPF_PATH_TYPES[ptype],
+               string.join(map(id2str, nhops), ", ") or "direct",
+               string.join(map(id2str, origins), ", "))
+
+#-------------------------------------------------------------------------------
+
+class NoRootExc(Exception): pass
+
+################################################################################
+
+if __name__ == "__main__":
+
+    VERBOSE = 1
+
+    root   = None
+    levels = (1, 2)
+    tree   = 0
+    incr   = 0
+    proto  = "isis"
+    areas  = None
+
+    #---------------------------------------------------------------------------
+
+    def usage():
+
+        print """Usage: %s [ options ] <filenames> ([*] options required):
+        -h|--help       : Help
+        -q|--quiet      : Be quiet
+        -v|--verbose    : Be verbose
+
+        -r|--root       : [*] System ID (xx.xx.xx.xx.xx.xx or
+                          xxxx.xxxx.xxxx) or hostname of the SPF root;
+                          with -o, its router ID
+        -l|--level      : Only compute for this level (1 or 2)
+        -t|--tree       : Print the shortest path tree
+        -i|--incremental: Keep SPF up to date LSP by LSP as the dumps
+                          are read, reporting the work done
+
+        -o|--ospf       : The dumps are of OSPF rather than ISIS
+        -a|--area       : Only compute for this OSPF area (may be
+                          given more than once)
+
+        Builds ISIS (or OSPF) link state databases from the LSPs (or
+        LSUPDs) in the given MRTd dumps, runs SPF over them, and prints
+        the resulting routes.""" % (os.path.basename(sys.argv[0]),)
+        sys.exit(0)
+
+    #---------------------------------------------------------------------------
+
+    if len(sys.argv) < 2:
+        usage()
+
+    try:
+        opts, args = getopt.getopt(sys.argv[1:],
+                                   "hqvr:l:tioa:",
+                                   ("help", "quiet", "verbose",
+                                    "root=", "level=", "tree",
+                                    "incremental", "ospf", "area=" ))
+    except (getopt.error):
+        usage()
+
+    for (x, y) in opts:
+        if x in ('-h', '--help'):
+            usage()
+
+        elif x in ('-q', '--quiet'):
+            VERBOSE = 0
+
+        elif x in ('-v', '--verbose'):
+            VERBOSE = 2
+
+        elif x in ('-r', '--root'):
+            root = y
+
+        elif x in ('-l', '--level'):
+            levels = (string.atoi(y), )
+
+        elif x in ('-t', '--tree'):
+            tree = 1
+
+        elif x in ('-i', '--incremental'):
+            incr = 1
+
+        elif x in ('-o', '--ospf'):
+            proto = "ospf"
+
+        elif x in ('-a', '--area'):
+            if areas == None:
+                areas = [ ]
+            areas.append(str2id(y))
+
+        else:
+            usage()
+
+    filenames = args
+    if not (filenames and root):
+        usage()
+
+    #---------------------------------------------------------------------------
+
+    if proto == "ospf":
+        root_id = str2id(root)
+        lsdbs   = { ospf.AS_SCOPE: ospf.Lsdb(ospf.AS_SCOPE) } # area -> Lsdb
+        spfs    = { } # area -> OspfSpf
+
+        for fn in filenames:
+            cnt = 0
+            mrt = mrtd.Mrtd(fn, "rb")
+            error('[ %s ] loading...' % fn)
+            try:
+                while 1:
+                    msg = mrt.read()
+                    if msg[1] != mrtd.MSG_TYPES["PROTOCOL_OSPF2"]:
+                        continue
+
+                    rv = mrt.parse(msg, 0)["V"]
+                    if rv["T"] != ospf.MSG_TYPES["LSUPD"]:
+                        continue
+
+                    installed = ospf.updateLsdbs(lsdbs, rv, msg[0])
+                    cnt = cnt + 1
+                    if not (installed and incr):
+                        continue
+
+                    changed = { }
+                    for (lsdb, key) in installed:
+                        if lsdb._area == ospf.AS_SCOPE:
+                            for area in spfs.keys():
+                                changed[area] = changed.get(area, [ ]) + [ key ]
+                        else:
+                            changed[lsdb._area] =\
+                                changed.get(lsdb._area, [ ]) + [ key ]
+
+                    for (area, keys) in changed.items():
+                        if areas != None and area not in areas:
+                            continue
+
+                        if spfs.has_key(area):
+                            st = spfs[area].change(keys)
+                            if VERBOSE > 1:
+                                print "area %s: %d LSAs: %s, %.3fms" %\
+                                      (id2str(area), len(keys), st["TYPE"],
+                                       1000*st["TIME"])
+
+                        elif lsdbs[area].get((ospf.LSA_TYPES["ROUTER"],
+                                              root_id, root_id)):
+                            spfs[area] = OspfSpf(lsdbs[area],
+                                                 lsdbs[ospf.AS_SCOPE], root_id)
+                            spfs[area].run()
+
+            except (mrtd.EOFExc):
+                error("%d LSUPDs\n" % cnt)
+            mrt.close()
+
+        if areas == None:
+            areas = filter(lambda a: a != ospf.AS_SCOPE, lsdbs.keys())
+            areas.sort()
+
+        routes = [ ]
+        for area in areas:
+            if not lsdbs.has_key(area):
+                error("area %s: no LSAs\n" % id2str(area))
+                continue
+
+            s = spfs.get(area)
+            if not s:
+                s = OspfSpf(lsdbs[area], lsdbs[ospf.AS_SCOPE], root_id)
+                try:
+                    s.run()
+                except (NoRootExc):
+                    error("area %s: root %s not found\n" % (id2str(area), root))
+                    continue
+
+            routes.append(s._routes)
+            if VERBOSE > 0:
+                print `s`
+                print INDENT + "build: %.3fs, SPF: %.3fs, routes: %.3fs" %\
+                      (s._stats["BUILD_T"], s._stats["SPF_T"],
+                       s._stats["ROUTES_T"])
+                if s._stats["ONE_WAY"]:
+                    print INDENT + "%d one-way links ignored" %\
+                          s._stats["ONE_WAY"]
+                if incr:
+                    print INDENT + "incremental: %d full, %d PRC in %.3fs" %\
+                          (s._stats["FULL"], s._stats["PRC"],
+                           s._stats["INCR_T"])
+            if tree:
+                s.prtTree(1)
+            if VERBOSE > 1:
+                s.prtRoutes(1)
+
+        if VERBOSE > 0:
+            print "Routes:"
+            prtOspfRoutes(mergeOspfRoutes(routes), 1)
+
+        sys.exit(0)
+
+    # root is either a system ID or a dynamic hostname, looked up as
+    # LSPs arrive
+    root_id = parseNodeId(root)
+
+    lsdbs = { 1: isis.Lsdb(1), 2: isis.Lsdb(2) }
+    spfs  = { }
+
+    for fn in filenames:
+        cnt = 0
+        mrt = mrtd.Mrtd(fn, "rb")
+        error('[ %s ] loading...' % fn)
+        try:
+            while 1:
+                msg = mrt.read()
+                if msg[1] not in (mrtd.MSG_TYPES["PROTOCOL_ISIS"],
+                                  mrtd.MSG_TYPES["PROTOCOL_ISIS2"]):
+                    continue
+
+                rv = mrt.parse(msg, 0)["V"]
+                if rv["T"] not in (isis.MSG_TYPES["L1LSP"],
+                                   isis.MSG_TYPES["L2LSP"]):
+                    continue
+
+                level = (rv["T"] - 16) / 2
+                lsdb  = lsdbs[level]
+                key   = lsdb.update(rv, msg[0])
+                cnt   = cnt + 1
+                if not (key and incr and level in levels):
+                    continue
+
+                nid = key[:7]
+                if not root_id and lsdb.nodeStr(nid) == root:
+                    root_id = nid
+
+                if spfs.has_key(level):
+                    st = spfs[level].change(nid)
+                    if VERBOSE > 1:
+                        print "L%d %s: %s, %d nodes, %d prefixes, %.3fms" %\
+                              (level, lsdb.nodeStr(nid), st["TYPE"],
+                               st["NODES"], st["PFXS"], 1000*st["TIME"])
+
+                elif root_id and lsdb.node(root_id):
+                    spfs[level] = IsisSpf(lsdb, root_id)
+                    spfs[level].run()
+
+        except (mrtd.EOFExc):
+            error("%d LSPs\n" % cnt)
+        mrt.close()
+
+    if not root_id:
+        for level in levels:
+            for nid in lsdbs[level].nodes():
+                if lsdbs[level].nodeStr(nid) == root:
+                    root_id = nid
+    if not root_id:
+        error("root %s not found\n" % root)
+        sys.exit(1)
+
+    routes = { }
+    for level in levels:
+        s = spfs.get(level)
+        if s:
+            routes[level] = s._routes
+        else:
+            s = IsisSpf(lsdbs[level], root_id)
+            try:
+                routes[level] = s.run()
+            except (NoRootExc):
+                error("L%d: root %s not found\n" % (level, root))
+                routes[level] = { }
+                continue
+
+        if VERBOSE > 0:
+            print `s`
+            print INDENT + "build: %.3fs, SPF: %.3fs, routes: %.3fs" %\
+                  (s._stats["BUILD_T"], s._stats["SPF_T"],
+                   s._stats["ROUTES_T"])
+            if incr:
+                print INDENT + "incremental: %d full, %d SPF, %d PRC in %.3fs;"\
+                      " saved %d node and %d prefix recalculations" %\
+                      (s._stats["FULL"], s._stats["ISPF"], s._stats["PRC"],
+                       s._stats["INCR_T"], s._stats["NODES_SAVED"],
+                       s._stats["PFXS_SAVED"])
+        if tree:
+            s.prtTree(1)
+        if VERBOSE > 1:
+            s.prtRoutes(1)
+
+    if VERBOSE > 0:
+        print "Routes:"
+        lsdb = lsdbs[levels[-1]]
+        prtRoutes(lsdb, mergeRoutes(routes.get(1, { }), routes.get(2, { })), 1)
+
+    sys.exit(0)
+
+################################################################################
+################################################################################
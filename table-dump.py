@@ -35,91 +35,28 @@ MINS_TO_SECS = 60
 
 def processEntry(rv):
 
-    def mkStr(attr, aval):
-
-        flags = 0
-        if aval["FLAGS"]['optional']:
-            flags = flags | (1<<7)
-        if aval["FLAGS"]['transitive']:
-            flags = flags | (1<<6)
-        if aval["FLAGS"]['partial']:
-            flags = flags | (1<<5)
-        if aval["FLAGS"]['extlen']:
-            flags = flags | (1<<4)
-
-        rflgs = struct.pack('BB', flags & 0xff, attr & 0xff)
-        if   attr == bgp.PATH_ATTRIBUTES["ORIGIN"]:
-            rval = struct.pack('B', aval["V"])
-
-        elif attr == bgp.PATH_ATTRIBUTES["AS_PATH"]:
-            if aval["V"] != None:
-                for pseg in aval["V"]:
-                    tl = struct.pack('BB', pseg["T"], pseg["L"])
-                    val = ""
-                    for v in pseg["V"]:
-                        val = struct.pack('>%dsH' % len(val), val, v)
-                rval = struct.pack('%ds%ds' % (len(tl), len(val)), tl, val)
-            else:
-                rval = struct.pack('BB',
-                                   bgp.AS_PATH_SEG_TYPES['SEQUENCE'], 0)
-
-        elif attr == bgp.PATH_ATTRIBUTES["NEXT_HOP"]:
-            rval = struct.pack('>L', aval["V"])
-
-        elif attr == bgp.PATH_ATTRIBUTES["MULTI_EXIT_DISCRIMINATOR"]:
-            rval = struct.pack('>L', aval["V"])
-
-        elif attr == bgp.PATH_ATTRIBUTES["LOC_PREF"]:
-            rval = struct.pack('>L', aval["V"])
-
-        elif attr == bgp.PATH_ATTRIBUTES["ATOMIC_AGGR"]:
-            rval = ""
-
-        elif attr == bgp.PATH_ATTRIBUTES["AGGREGATOR"]:
-            rval = struct.pack(">HL", aval["V"][0], aval["V"][1])
-
-        elif attr == bgp.PATH_ATTRIBUTES["COMMUNITY"]:
-            rval = ""
-            for v in aval["V"]:
-                rval = struct.pack('>%ds4s' % len(rval), rval, v)
-
-        elif attr == bgp.PATH_ATTRIBUTES["ORIGINATOR_ID"]:
-            rval = struct.pack('>L', aval["V"])
-
-        elif attr == bgp.PATH_ATTRIBUTES["CLUSTER_LIST"]:
-            rval = ""
-            for v in aval["V"]:
-                rval = struct.pack('>%dsL' % len(rval), rval, v)
-
-        else:
-            print '[ *** Unsupported attribute:', \
-                  bgp.PATH_ATTRIBUTES[attr], '*** ]'
-            return None
-
-        if aval["FLAGS"]['extlen']:
-            rlen = struct.pack('>H', len(rval) & 0xffff)
-        else:
-            rlen = struct.pack('>B', len(rval) & 0xff)
-
-        return struct.pack('%ds%ds%ds' % (len(rflgs), len(rlen), len(rval)),
-                           rflgs, rlen, rval)
-
     msg_tm = rv["H"]["TIME"]
     src_as, src_ip = rv["H"]["SRC_AS"], rv["H"]["SRC_IP"]
     ifc, afi = rv["H"]["IFC"], rv["H"]["AFI"]
 
-    for pfx in rv["V"]["V"]["UNFEASIBLE"]:
-        del TABLE[pfx]
+    for key in rv["V"]["V"]["UNFEASIBLE"]:
+        if TABLE.has_key(key):
+            del TABLE[key]
 
-    astr = ""
-    for attr in rv["V"]["V"]["PATH_ATTRS"].keys():
-        rstr = mkStr(attr, rv["V"]["V"]["PATH_ATTRS"][attr])
-        astr = struct.pack('%ds%ds' % (len(astr), len(rstr)),
-                           astr, rstr)
+    # an empty AS_PATH has always been dumped as an empty SEQUENCE
+    # segment rather than as a zero length attribute, so keep doing so
+    attrs = rv["V"]["V"]["PATH_ATTRS"]
+    asp_t = bgp.PATH_ATTRIBUTES["AS_PATH"]
+    if attrs.has_key(asp_t) and not attrs[asp_t]["V"]:
+        attrs = attrs.copy()
+        attrs[asp_t] = attrs[asp_t].copy()
+        attrs[asp_t]["V"] = [ { "T": bgp.AS_PATH_SEG_TYPES["SEQUENCE"],
+                                "L": 0, "V": [] } ]
 
+    astr = bgp.mkPathAttrs(attrs, VERBOSE)
 
-    for pfx in rv["V"]["V"]["FEASIBLE"]:
-        TABLE[pfx] = {"TIME"   : msg_tm,
+    for key in rv["V"]["V"]["FEASIBLE"]:
+        TABLE[key] = {"TIME"   : msg_tm,
                       "PEER_IP": src_ip,
                       "PEER_AS": src_as,
                       "ATTRS"  : astr,
@@ -135,16 +72,19 @@ def dumpTable():
 
     error('dumping...')
 
+    # packed prefix keys sort into address order
+    keys = TABLE.keys()
+    keys.sort()
+
     seq_no = 0
-    for (pfx, plen) in TABLE.keys():
-        attr_len = len(TABLE[(pfx,plen)]['ATTRS'])
+    for key in keys:
+        e = TABLE[key]
+        attr_len = len(e['ATTRS'])
         common_hdr = struct.pack('>HH', VIEW_NO, seq_no)
-        entry      = struct.pack('>4sBBLLHH%ds' % attr_len,
-                                 pfx, plen, STATUS,
-                                 TABLE[(pfx,plen)]['TIME'],
-                                 TABLE[(pfx,plen)]['PEER_IP'],
-                                 TABLE[(pfx,plen)]['PEER_AS'],
-                                 attr_len, TABLE[(pfx,plen)]['ATTRS'])
+        entry      = struct.pack('>LBBLLHH%ds' % attr_len,
+                                 key2id(key), key2plen(key), STATUS,
+                                 e['TIME'], e['PEER_IP'], e['PEER_AS'],
+                                 attr_len, e['ATTRS'])
 
         mrt_hdr = struct.pack('>LHHL',
                               now,
@@ -249,14 +189,14 @@ if __name__ == "__main__":
                 cnt = cnt + 1
                 if rv["T"] == mrtd.MSG_TYPES["TABLE_DUMP"]:
                     for v in rv["V"]:
-                        pfx = v["V"]["PREFIX"]
+                        key = v["V"]["PREFIX"]
                         entry = { "TIME"   : v["V"]["UPTIME"],
                                   "PEER_IP": v["V"]["PEER_IP"],
                                   "PEER_AS": v["V"]["PEER_AS"],
                                   "ATTRS"  : v["V"]["ATTRS"],
                                   }
 
-                        TABLE[pfx] = entry
+                        TABLE[key] = entry
         except (mrtd.EOFExc):
             error("end of file: %u messages\n" % cnt)
         except (KeyboardInterrupt):